@@ -0,0 +1,215 @@
+# built-in
+import ast
+import json
+import os
+import struct
+
+# third-party
+from fastapi import HTTPException
+import smbclient
+
+# local
+from app.config import COLUMNAR_DIR, DOWNLOAD_CHUNK_SIZE
+from app.smb import get_smb_path
+
+# Wearable recordings converted by scripts/get_records_metadata.py (see scripts/columnar.py) are stored under
+# COLUMNAR_DIR, mirroring their smb_path, as <name>.npy (one column-major 2D array: samples x channels, so each
+# channel is contiguous and np.load(mmap_mode='r') maps it without parsing), <name>.parquet (one column per
+# channel) and <name>.json (header metadata, written last, so its presence marks a complete conversion).
+COLUMNAR_FORMATS = {'npy': 'application/octet-stream', 'parquet': 'application/vnd.apache.parquet'}
+
+
+def columnar_base(root, smb_path):
+    """Path of the converted files of a record under root, without extension."""
+    return os.path.join(root, *os.path.splitext(smb_path)[0].split('\\'))
+
+
+def load_columnar(smb_path):
+    """Metadata of the converted form of a record's file, or None when it has not been converted (or COLUMNAR_DIR is unset)."""
+    if not COLUMNAR_DIR:
+        return None
+    base = columnar_base(COLUMNAR_DIR, smb_path)
+    try:
+        with open(f"{base}.json", encoding='utf-8') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    meta['paths'] = {fmt: f"{base}.{fmt}" for fmt in COLUMNAR_FORMATS}
+    return meta
+
+
+NOT_CONVERTED = "Record has no columnar form; only wearable data files are converted."
+UNREADABLE = "The converted file could not be read; it is rewritten when the file is converted again."
+
+
+def current_columnar(smb_path, file_stat=None):
+    """
+    Metadata of the converted form of a record's file: 404 if it has not been converted, 409 if the file changed
+    since. file_stat, if the caller already has it, saves stat'ing the file on the share again.
+    """
+    meta = load_columnar(smb_path)
+    if meta is None:
+        raise HTTPException(status_code=404, detail=NOT_CONVERTED)
+    if file_stat is None:
+        try:
+            file_stat = smbclient.stat(get_smb_path(smb_path))
+        except OSError:
+            raise HTTPException(status_code=404, detail="File not found on SMB share")
+    if meta['source_size'] != file_stat.st_size:
+        raise HTTPException(status_code=409, detail="The file changed since it was converted; it is converted again by the next crawl.")
+    return meta
+
+
+def read_npy_header(f):
+    """(descr, fortran_order, shape, data offset) from the header of an open .npy file (format versions 1 to 3)."""
+    magic = f.read(8)
+    if magic[:6] != b'\x93NUMPY':
+        raise ValueError("not a .npy file")
+    if magic[6] == 1:
+        length, = struct.unpack('<H', f.read(2))
+    else:
+        length, = struct.unpack('<I', f.read(4))
+    header = ast.literal_eval(f.read(length).decode('latin1'))
+    return header['descr'], header['fortran_order'], header['shape'], f.tell()
+
+
+def npy_header(descr, shape, fortran_order):
+    """Version 1.0 .npy header, padded so the data starts on a 64-byte boundary like numpy's own files."""
+    text = repr({'descr': descr, 'fortran_order': fortran_order, 'shape': tuple(shape)})
+    padding = -(10 + len(text) + 1) % 64
+    text = text + ' ' * padding + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(text)) + text.encode('latin1')
+
+
+def _open_converted(path, missing=NOT_CONVERTED):
+    try:
+        return open(path, 'rb')
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=missing)
+    except OSError:
+        raise HTTPException(status_code=409, detail=UNREADABLE)
+
+
+def open_npy(path, missing=NOT_CONVERTED):
+    """
+    Open a column-major 2D .npy file under COLUMNAR_DIR and read its header, as (file, descr, shape, data offset):
+    404 with the `missing` detail if the file is gone, 409 if it cannot be read or is not such an array.
+    """
+    f = _open_converted(path, missing)
+    try:
+        descr, fortran_order, shape, data_offset = read_npy_header(f)
+        if not fortran_order or len(shape) != 2:
+            raise ValueError("expected a column-major 2D array")
+    except (OSError, ValueError, SyntaxError, KeyError, struct.error):
+        f.close()
+        raise HTTPException(status_code=409, detail=UNREADABLE)
+    return f, descr, shape, data_offset
+
+
+def converted_file_stat(path, fmt):
+    """
+    stat of a converted .npy or .parquet file to download whole, after checking that it is complete: 404 if it is
+    missing, 409 if it is truncated or unreadable, the same responses as a window read from it.
+    """
+    if fmt == 'npy':
+        f, descr, (rows, columns), data_offset = open_npy(path)
+        with f:
+            file_stat = os.fstat(f.fileno())
+        complete = file_stat.st_size == data_offset + rows * columns * int(descr[2:])
+    else:
+        # Parquet files start and end with the PAR1 magic, so a truncated file lacks the trailing one
+        with _open_converted(path) as f:
+            file_stat = os.fstat(f.fileno())
+            complete = file_stat.st_size >= 8 and f.read(4) == b'PAR1'
+            if complete:
+                f.seek(-4, os.SEEK_END)
+                complete = f.read(4) == b'PAR1'
+    if not complete:
+        raise HTTPException(status_code=409, detail=UNREADABLE)
+    return file_stat
+
+
+def _npy_window_stream(f, descr, rows, channels, data_offset, first, last):
+    itemsize = int(descr[2:])
+    with f:
+        yield npy_header(descr, (last - first, channels), True)
+        # Column-major: channel c is rows * itemsize contiguous bytes, so each channel's window is one seek and read.
+        # All channels come from the file opened up front, even if the crawler replaces it meanwhile.
+        for channel in range(channels):
+            f.seek(data_offset + (channel * rows + first) * itemsize)
+            remaining = (last - first) * itemsize
+            while remaining > 0:
+                chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+def read_npy_window(path, first, last):
+    """
+    Return a generator of the bytes of a .npy file holding rows first to last - 1 of a converted recording. The file
+    is opened before returning, so a missing or unreadable file is a 404/409 rather than a failed stream.
+    """
+    f, descr, (rows, channels), data_offset = open_npy(path)
+    return _npy_window_stream(f, descr, rows, channels, data_offset, first, last)
+
+
+# === Preview pyramids ===
+
+# Built by scripts/build_previews.py next to the converted files: <name>.preview-<bin size>.npy per level, each a
+# column-major bins x (2 * channels) array holding the min and max of each channel side by side, and
+# <name>.preview.json with the bin sizes of the levels (written last, like the conversion's own .json).
+_NPY_TYPECODES = {'<i2': 'h', '<i4': 'i', '<i8': 'q', '<f4': 'f', '<f8': 'd'}
+NO_PREVIEW = "Record has no preview yet; previews are built after the record is converted."
+
+
+def load_preview(smb_path, meta):
+    """Bin sizes of the preview pyramid of a converted record, finest first: 404 if not built yet, 409 if built from an older conversion."""
+    try:
+        with open(f"{columnar_base(COLUMNAR_DIR, smb_path)}.preview.json", encoding='utf-8') as f:
+            preview = json.load(f)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=NO_PREVIEW)
+    if preview['source_size'] != meta['source_size']:
+        raise HTTPException(status_code=409, detail="The preview predates the current conversion of the file; it is rebuilt by the next preview job.")
+    return sorted(preview['levels'])
+
+
+def _read_columns(path, first, last, missing=NOT_CONVERTED):
+    """Rows first to last - 1 of each column of a column-major 2D .npy file, as lists, with one seek and read per column."""
+    f, descr, (rows, columns), data_offset = open_npy(path, missing)
+    with f:
+        if descr not in _NPY_TYPECODES:
+            raise HTTPException(status_code=409, detail=UNREADABLE)
+        itemsize = int(descr[2:])
+        last = min(last, rows)
+        values = []
+        try:
+            for column in range(columns):
+                f.seek(data_offset + (column * rows + first) * itemsize)
+                values.append(list(struct.unpack(f"<{last - first}{_NPY_TYPECODES[descr]}", f.read((last - first) * itemsize))))
+        except (OSError, struct.error):  # truncated
+            raise HTTPException(status_code=409, detail=UNREADABLE)
+    return values
+
+
+def preview_window(smb_path, meta, first, last, points):
+    """
+    Per-channel min/max envelope of samples first to last - 1 of a converted record in at most `points` bins, as
+    (bin size, first sample of the first bin, {channel: {'min': [...], 'max': [...]}}). Windows of at most `points`
+    samples are returned as they are (bins of one sample); others from the finest pyramid level that fits, whose
+    bins are aligned on multiples of the bin size, so the first and last bin may extend beyond the window.
+    """
+    channels = meta['channels']
+    if last - first <= points:
+        columns = _read_columns(meta['paths']['npy'], first, last)
+        return 1, first, {name: {'min': column, 'max': column} for name, column in zip(channels, columns)}
+
+    levels = load_preview(smb_path, meta)
+    bin_size = next((size for size in levels if -(-last // size) - first // size <= points), levels[-1])
+    first_bin, last_bin = first // bin_size, -(-last // bin_size)
+    columns = _read_columns(f"{columnar_base(COLUMNAR_DIR, smb_path)}.preview-{bin_size}.npy", first_bin, last_bin, NO_PREVIEW)
+    return bin_size, first_bin * bin_size, {
+        name: {'min': columns[2 * i], 'max': columns[2 * i + 1]} for i, name in enumerate(channels)
+    }
@@ -10,10 +10,59 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
 PATIENT_HASH_SALT = os.getenv("PATIENT_HASH_SALT")
 
+DB_POOL_NAME = os.getenv("DB_POOL_NAME", "preepiseizures")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))  # mysql-connector caps pools at 32 connections
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))  # seconds to wait for a free pooled connection
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", 10))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 500))  # rows fetched per round-trip for NDJSON/CSV listings
+
+# Blocking DB and SMB work runs on two separately sized thread limiters, so long downloads cannot starve metadata queries.
+# Download routes check out a pooled connection per query only, never while reading the share, so DOWNLOAD_THREADS
+# may exceed DB_POOL_SIZE
+DB_THREADS = int(os.getenv("DB_THREADS", 2 * DB_POOL_SIZE))
+DOWNLOAD_THREADS = int(os.getenv("DOWNLOAD_THREADS", 16))
+
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))  # seconds a verified user is served without a DB lookup, 0 disables
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 1024))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # bearer token required by GET /metrics; open when unset
+# /records, /events and /sessions results, dropped when the import scripts bump metadata_generation
+METADATA_CACHE_TTL = float(os.getenv("METADATA_CACHE_TTL", 300))  # 0 disables
+METADATA_CACHE_SIZE = int(os.getenv("METADATA_CACHE_SIZE", 512))  # number of cached queries
+METADATA_CACHE_MAX_ROWS = int(os.getenv("METADATA_CACHE_MAX_ROWS", 100000))  # rows across all cached queries; larger results are not cached
+METADATA_GENERATION_CHECK = float(os.getenv("METADATA_GENERATION_CHECK", 5))  # seconds between generation lookups
 
 SMB_HOST = os.getenv("SMB_HOST")
 SMB_SHARE = os.getenv("SMB_SHARE")
 SMB_USER = os.getenv("SMB_USER")
-SMB_PASSWORD = os.getenv("SMB_PASSWORD")
\ No newline at end of file
+SMB_PASSWORD = os.getenv("SMB_PASSWORD")
+
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", 1024 * 1024))  # bytes read from SMB per streamed chunk
+# Multi-record zips read up to ZIP_PREFETCH_WORKERS files ahead, buffering at most
+# ZIP_PREFETCH_BUFFER_CHUNKS chunks of ZIP_PREFETCH_CHUNK_SIZE bytes per file
+ZIP_PREFETCH_WORKERS = int(os.getenv("ZIP_PREFETCH_WORKERS", 4))
+ZIP_PREFETCH_CHUNK_SIZE = int(os.getenv("ZIP_PREFETCH_CHUNK_SIZE", 4 * 1024 * 1024))
+ZIP_PREFETCH_BUFFER_CHUNKS = int(os.getenv("ZIP_PREFETCH_BUFFER_CHUNKS", 2))
+MANIFEST_STAT_WORKERS = int(os.getenv("MANIFEST_STAT_WORKERS", 16))  # parallel SMB stat calls per /records/manifest request
+
+# Optional local disk cache of downloaded SMB files; disabled unless FILE_CACHE_DIR is set. The budget is shared
+# by all worker processes using the same directory
+FILE_CACHE_DIR = os.getenv("FILE_CACHE_DIR")
+FILE_CACHE_MAX_BYTES = int(os.getenv("FILE_CACHE_MAX_BYTES", 10 * 1024 ** 3))
+
+# Export jobs build large zips in the background into EXPORT_SPOOL_DIR, on at most EXPORT_WORKERS threads
+EXPORT_SPOOL_DIR = os.getenv("EXPORT_SPOOL_DIR", "exports")
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", 2))
+EXPORT_JOBS_PER_USER = int(os.getenv("EXPORT_JOBS_PER_USER", 2))  # queued or running jobs per user, in each worker process
+EXPORT_MAX_JOBS = int(os.getenv("EXPORT_MAX_JOBS", 16))  # queued or running jobs overall, in each worker process
+EXPORT_RETENTION = float(os.getenv("EXPORT_RETENTION", 24 * 3600))  # seconds finished archives are kept
+
+# GET /events/epochs cuts at most EPOCH_MAX_EVENTS events per request (later ones are paged with X-Next-Cursor),
+# reading file headers and epochs on EPOCH_READ_WORKERS threads
+EPOCH_MAX_EVENTS = int(os.getenv("EPOCH_MAX_EVENTS", 500))
+EPOCH_READ_WORKERS = int(os.getenv("EPOCH_READ_WORKERS", 8))
+
+# Converted (binary columnar) wearable recordings written by the crawler; .npy/.parquet downloads are disabled when unset
+COLUMNAR_DIR = os.getenv("COLUMNAR_DIR")
+PREVIEW_MAX_POINTS = int(os.getenv("PREVIEW_MAX_POINTS", 10000))  # upper bound of the points parameter of GET /records/{record_id}/preview
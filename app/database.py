@@ -1,20 +1,187 @@
+# built-in
+import threading
+import time
+
 # third-party
 import mysql.connector
+from mysql.connector import pooling
 from fastapi import HTTPException
 
 # local
-from app.config import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME
+from app.executors import run_db, run_db_release
+from app.metrics import DB_CONNECT_SECONDS, DB_QUERY_SECONDS, current_router, query_shape
+from app.config import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME, DB_POOL_NAME, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_CONNECT_TIMEOUT
+
+_pool = None
+_pool_lock = threading.Lock()
+# mysql-connector fails immediately when the pool is empty, so checkouts wait on this instead
+_pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+
+_stats_lock = threading.Lock()
+_stats = {"checkouts": 0, "waits": 0, "exhausted": 0, "errors": 0, "in_use": 0}
+
+
+def _count(key, value=1):
+    with _stats_lock:
+        _stats[key] += value
+
+
+def get_pool_stats():
+    """Snapshot of the connection pool counters (checkouts, waits, exhausted, errors, in_use)."""
+    with _stats_lock:
+        return {"size": DB_POOL_SIZE, **_stats}
+
+
+class _TimedCursor:
+    """
+    Cursor wrapper recording the time of each statement in DB_QUERY_SECONDS: its execute call plus every fetch of
+    its rows, which unbuffered cursors read as they are fetched. Observed when the next statement runs or on close().
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._query = None
+        self._elapsed = 0.0
+
+    def _observe(self):
+        if self._query is not None:
+            DB_QUERY_SECONDS.labels(current_router(), query_shape(self._query)).observe(self._elapsed)
+            self._query = None
+
+    def _timed(self, method, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def execute(self, operation, params=None, **kwargs):
+        self._observe()
+        self._query, self._elapsed = operation, 0.0
+        return self._timed(self._cursor.execute, operation, params, **kwargs)
+
+    def executemany(self, operation, seq_params):
+        self._observe()
+        self._query, self._elapsed = operation, 0.0
+        return self._timed(self._cursor.executemany, operation, seq_params)
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+    def fetchmany(self, size=1):
+        return self._timed(self._cursor.fetchmany, size)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
+
+    def close(self):
+        self._observe()
+        return self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _TimedConnection:
+    """Pooled connection wrapper whose cursors are timed; everything else goes to the connection itself."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return _TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name=DB_POOL_NAME,
+                    pool_size=DB_POOL_SIZE,
+                    pool_reset_session=True,
+                    host=DB_HOST,
+                    port=DB_PORT,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                    database=DB_NAME,
+                    connection_timeout=DB_CONNECT_TIMEOUT,
+                )
+    return _pool
+
 
 def get_db_connection():
+    """
+    Check out a connection from the shared pool, waiting up to DB_POOL_TIMEOUT seconds for a free one.
+    The pool pings the connection on checkout and reconnects it if the server dropped it.
+    Calling close() on the returned connection hands it back to the pool; use release_db_connection().
+    """
+    started = time.perf_counter()
+    if not _pool_slots.acquire(blocking=False):
+        _count("waits")
+        if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+            _count("exhausted")
+            raise HTTPException(status_code=503, detail="Database connection pool exhausted")
+
     try:
-        conn = mysql.connector.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME
-        )
-        return conn
+        conn = _get_pool().get_connection()
     except mysql.connector.Error as err:
+        _pool_slots.release()
+        _count("errors")
         print(f"DB Connection Error: {err}")
-        raise HTTPException(status_code=500, detail="Database connection error")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    _count("checkouts")
+    _count("in_use")
+    DB_CONNECT_SECONDS.labels(current_router()).observe(time.perf_counter() - started)
+    return _TimedConnection(conn)
+
+
+def release_db_connection(conn, discard=False):
+    """
+    Hand a connection back to the pool. With discard=True the server connection is dropped first
+    (e.g. after an interrupted unbuffered read left rows unread) and the pool reconnects it on next checkout.
+    """
+    try:
+        if discard:
+            conn.disconnect()
+        conn.close()
+    except mysql.connector.Error as err:
+        if not discard:
+            print(f"DB Connection Error: {err}")
+    finally:
+        _count("in_use", -1)
+        _pool_slots.release()
+
+
+def fetch_rows(query, params=()):
+    """
+    All rows (as dicts) of one query, run on a connection checked out for just that query. Download routes use it
+    instead of get_db, so they never hold a pooled connection while they read the SMB share.
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        release_db_connection(conn)
+    return rows
+
+
+async def get_db():
+    """
+    FastAPI dependency yielding a pooled connection for the duration of the route function. Declare it with
+    Depends(get_db, scope="function"): by default FastAPI only releases it after the response body has been sent,
+    which would keep the connection checked out for the whole of a streamed download.
+    """
+    conn = await run_db(get_db_connection)
+    try:
+        yield conn
+    finally:
+        await run_db_release(release_db_connection, conn)
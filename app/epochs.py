@@ -0,0 +1,201 @@
+# built-in
+import itertools
+import json
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+# third-party
+import smbclient
+import zipstream
+
+# local
+from app.config import EPOCH_READ_WORKERS
+from app.database import fetch_rows
+from app.metrics import cpu_timed
+from app.signals import edf_layout, edf_slice, fetch_offsets, is_index_current, read_edf_header, sample_range, slice_lines
+from app.smb import SmbPrefetcher, get_smb_path, iter_smb_file
+
+# Recordings epochs can be cut from: indexed wearable text files and EDF/BDF hospital EEG
+EPOCH_RECORDS_QUERY = """
+    SELECT r.record_id, r.session_id, r.file_name, r.file_extension, r.smb_path, r.modality, r.start_time, r.end_time,
+        i.sampling_rate, i.sample_count, i.index_step, i.indexed_size
+    FROM records r
+    LEFT JOIN record_sample_index i ON i.record_id = r.record_id
+    WHERE r.session_id IN ({sessions}) AND r.modality IN ('wearable', 'hospital_eeg')
+        AND r.file_extension IN ('.txt', '.edf', '.bdf')
+"""
+
+
+def event_windows(events, pre, post):
+    """(event, start, end) of each event padded by pre/post seconds; events without an offset_time are instants."""
+    return [
+        (event, event['onset_time'] - timedelta(seconds=pre), (event['offset_time'] or event['onset_time']) + timedelta(seconds=post))
+        for event in events if event['onset_time'] is not None
+    ]
+
+
+def overlapping_records(windows):
+    """
+    (event, start, end, record) for every record of an event's session that overlaps its window. All events are
+    resolved at once: one query for the records of every session involved, then a binary search over each
+    session's records sorted by start time. Records with an unknown end_time are assumed to overlap.
+    """
+    session_ids = sorted({event['session_id'] for event, _, _ in windows})
+    if not session_ids:
+        return []
+    records = fetch_rows(EPOCH_RECORDS_QUERY.format(sessions=','.join(['%s'] * len(session_ids))), session_ids)
+
+    by_session = {}
+    for record in records:
+        if record['start_time'] is not None:
+            by_session.setdefault(record['session_id'], []).append(record)
+    starts = {}
+    for session_id, records in by_session.items():
+        records.sort(key=lambda record: (record['start_time'], record['record_id']))
+        starts[session_id] = [record['start_time'] for record in records]
+
+    pairs = []
+    for event, start, end in windows:
+        records = by_session.get(event['session_id'], [])
+        for record in records[:bisect_left(starts.get(event['session_id'], []), end)]:
+            if record['end_time'] is None or record['end_time'] > start:
+                pairs.append((event, start, end, record))
+    return pairs
+
+
+def _probe(record, header_end):
+    """(file stat, header, None) of a record's file on the share, or (None, None, error)."""
+    smb_path = get_smb_path(record['smb_path'])
+    try:
+        file_stat = smbclient.stat(smb_path)
+        if header_end is not None:
+            return file_stat, b''.join(iter_smb_file(smb_path, length=header_end)), None
+        return file_stat, read_edf_header(smb_path), None
+    except (OSError, ValueError) as err:
+        return None, None, str(err)
+
+
+def _skip(event, record, reason):
+    return {'event_id': event['event_id'], 'record_id': record['record_id'], 'reason': reason}
+
+
+def _epoch_info(event, record, start_time, name, **fields):
+    return {
+        'event_id': event['event_id'],
+        'record_id': record['record_id'],
+        'modality': record['modality'],
+        'entry': f"event_{event['event_id']}/{name}",
+        'start_time': start_time,
+        **fields,
+    }
+
+
+def plan_epochs(events, pre, post):
+    """
+    Work out which bytes to read for the epoch of every event in every overlapping record, without reading signal data.
+
+    Returns (epochs, skipped). Each epoch is (info, smb_path, header, (start, length), lines): info describes it in
+    epochs.json, header is written before the `length` bytes read from `start`, and lines is the (skip, count) of
+    text lines to keep from them, or None for EDF/BDF slices, which are sent whole. Sample offsets of all indexed
+    windows come from batched queries and the headers of all files are read in parallel. Overlapping records
+    that cannot be cut are listed in skipped with the reason.
+    """
+    pairs = overlapping_records(event_windows(events, pre, post))
+
+    skipped, candidates = [], []
+    for event, start, end, record in pairs:
+        if record['file_extension'].lower() != '.txt':
+            candidates.append((event, start, end, record, None))
+        elif record['sampling_rate'] is None:
+            skipped.append(_skip(event, record, "no sample index"))
+        else:
+            first, last = sample_range(record, start, end)
+            if first < last:
+                candidates.append((event, start, end, record, (first, last)))
+
+    offsets = iter(fetch_offsets([(record, *samples) for *_, record, samples in candidates if samples]))
+    candidates = [(*candidate, next(offsets) if candidate[-1] else None) for candidate in candidates]
+
+    records, header_ends = {}, {}
+    for *_, record, samples, window_offsets in candidates:
+        if samples is None or window_offsets is not None:
+            records[record['record_id']] = record
+        if window_offsets is not None:
+            header_ends[record['record_id']] = window_offsets[0]
+    with ThreadPoolExecutor(max_workers=EPOCH_READ_WORKERS, thread_name_prefix="epoch-probe") as executor:
+        probes = dict(zip(records, executor.map(lambda record: _probe(record, header_ends.get(record['record_id'])), records.values())))
+
+    epochs = []
+    for event, start, end, record, samples, window_offsets in candidates:
+        if samples is not None and window_offsets is None:
+            skipped.append(_skip(event, record, "no sample index"))
+            continue
+        file_stat, header, error = probes[record['record_id']]
+        if error is not None:
+            skipped.append(_skip(event, record, f"file not readable: {error}"))
+            continue
+
+        if samples is not None:
+            if not is_index_current(record, file_stat):
+                skipped.append(_skip(event, record, "file changed since it was indexed"))
+                continue
+            first, last = samples
+            _, data_start, data_end = window_offsets
+            info = _epoch_info(
+                event, record, record['start_time'] + timedelta(seconds=first / record['sampling_rate']),
+                f"{record['file_name']}_{first}-{last}.txt",
+                first_sample=first, sample_count=last - first, sampling_rate=record['sampling_rate'],
+            )
+            epochs.append((info, record['smb_path'], header, (data_start, data_end - data_start), (first % record['index_step'], last - first)))
+            continue
+
+        try:
+            layout = edf_layout(header, file_stat.st_size, record['file_extension'])
+        except (ValueError, KeyError) as err:
+            skipped.append(_skip(event, record, f"unreadable header: {err}"))
+            continue
+        if not layout['continuous'] or layout['record_duration'] <= 0:
+            skipped.append(_skip(event, record, "discontinuous or annotation-only EDF+"))
+            continue
+        sliced = edf_slice(header, layout, start, end)
+        if sliced is None:
+            continue
+        edf_header, data_start, length, slice_start = sliced
+        first_record = (data_start - layout['header_size']) // layout['record_size']
+        info = _epoch_info(
+            event, record, slice_start,
+            f"{record['file_name']}_{first_record}-{first_record + length // layout['record_size']}{record['file_extension']}",
+            first_data_record=first_record, record_duration=layout['record_duration'],
+        )
+        epochs.append((info, record['smb_path'], edf_header, (data_start, length), None))
+    return epochs, skipped
+
+
+def epochs_zip_stream(epochs, skipped):
+    """
+    Return a generator of the bytes of a zip with one entry per epoch planned by plan_epochs(), read ahead on
+    EPOCH_READ_WORKERS threads, and an epochs.json describing them and the skipped records.
+    """
+    z = zipstream.ZipFile(mode='w', compression=zipstream.ZIP_DEFLATED, allowZip64=True)
+    manifest = {"epochs": [info for info, *_ in epochs], "skipped": skipped}
+    z.writestr("epochs.json", json.dumps(manifest, indent=2, default=str).encode())
+
+    prefetcher = SmbPrefetcher(
+        [get_smb_path(smb_path) for _, smb_path, *_ in epochs],
+        workers=EPOCH_READ_WORKERS,
+        ranges=[byte_range for _, _, _, byte_range, _ in epochs],
+    )
+    for index, (info, _, header, (_, length), lines) in enumerate(epochs):
+        chunks = prefetcher.iter_file(index)
+        if lines is not None:
+            chunks = slice_lines(chunks, *lines)
+        z.write_iter(info['entry'], itertools.chain([header], chunks), buffer_size=len(header) + length)
+
+    def zip_stream():
+        try:
+            yield from cpu_timed(z)
+        finally:
+            prefetcher.close()
+
+    return zip_stream()
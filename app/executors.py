@@ -0,0 +1,66 @@
+# built-in
+import functools
+
+# third-party
+import anyio
+import anyio.to_thread
+
+# local
+from app.config import DB_POOL_SIZE, DB_THREADS, DOWNLOAD_THREADS
+
+# Routes are async and push their blocking mysql-connector / smbclient calls onto one of these limiters instead of
+# Starlette's shared threadpool, so a burst of slow SMB transfers cannot block the metadata endpoints.
+_limiters = {}
+_DONE = object()
+
+
+def _limiter(name, size):
+    # Created lazily, since anyio limiters belong to the running event loop
+    limiter = _limiters.get(name)
+    if limiter is None:
+        limiter = _limiters[name] = anyio.CapacityLimiter(size)
+    return limiter
+
+
+async def run_db(func, *args, **kwargs):
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=_limiter("db", DB_THREADS))
+
+
+async def run_download(func, *args, **kwargs):
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=_limiter("download", DOWNLOAD_THREADS))
+
+
+async def run_db_release(func, *args, **kwargs):
+    # Releases get their own limiter, one thread per pooled connection, so handing a connection back never queues
+    # behind db threads blocked at checkout waiting for that very connection
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=_limiter("db_release", DB_POOL_SIZE))
+
+
+def _offload(run):
+    def decorator(endpoint):
+        # functools.wraps keeps the signature, so FastAPI still resolves the endpoint's parameters
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            return await run(endpoint, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+on_db_threads = _offload(run_db)
+on_download_threads = _offload(run_download)
+
+
+async def iterate_on(run, iterator):
+    """Pull items from a blocking iterator on the given executor, e.g. to stream a response body off the default threadpool."""
+    try:
+        while True:
+            item = await run(next, iterator, _DONE)
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            # Shielded, so the generator's cleanup still runs when the client disconnects
+            with anyio.CancelScope(shield=True):
+                await run(close)
@@ -0,0 +1,266 @@
+# built-in
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# third-party
+from fastapi import HTTPException
+
+# local
+from app.config import EXPORT_SPOOL_DIR, EXPORT_WORKERS, EXPORT_JOBS_PER_USER, EXPORT_MAX_JOBS, EXPORT_RETENTION
+
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+_SPOOL_FILE = re.compile(r"export-([0-9a-f]{32})\.(zip|zip\.part|json|json\.part|cancel)")
+STATE_SAVE_INTERVAL = 1  # seconds between progress saves of a running job
+HEARTBEAT_INTERVAL = 10  # seconds between touches of the state of active jobs by the process building them
+STALE_AFTER = 6 * HEARTBEAT_INTERVAL  # active jobs whose state is older were interrupted by a restart
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class ExportJob:
+    """
+    An export job and its files in the spool directory: export-<id>.zip, and export-<id>.json with the state shown
+    by as_dict(), written by the process building the archive so that every worker can answer for the job, and
+    touched by it while the job is active. export-<id>.cancel asks the building process to stop.
+    """
+
+    def __init__(self, user_id, files_total, spool_dir, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.user_id = user_id
+        self.path = os.path.join(spool_dir, f"export-{self.id}.zip")
+        self.state_path = os.path.join(spool_dir, f"export-{self.id}.json")
+        self.cancel_path = os.path.join(spool_dir, f"export-{self.id}.cancel")
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.files_total = files_total
+        self.files_done = 0
+        self.bytes_written = 0
+        self.error = None
+        self.cancelled = threading.Event()
+        self._saved_at = 0
+
+    @classmethod
+    def load(cls, spool_dir, job_id):
+        """The job as last saved by the process building it, or None. Active jobs no longer touched are failed."""
+        try:
+            with open(os.path.join(spool_dir, f"export-{job_id}.json"), encoding="utf-8") as f:
+                state = json.load(f)
+                touched_at = os.fstat(f.fileno()).st_mtime
+        except (FileNotFoundError, ValueError):
+            return None
+        job = cls(state["user_id"], state["files_total"], spool_dir, job_id)
+        for key in ("status", "created_at", "finished_at", "files_done", "bytes_written", "error"):
+            setattr(job, key, state[key])
+        if job.active and time.time() - touched_at > STALE_AFTER:
+            job.status, job.error = "failed", "Interrupted by a restart of the API"
+        return job
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def file_done(self):
+        self.files_done += 1
+
+    def save(self):
+        self._saved_at = time.time()
+        state = {**self.as_dict(), "user_id": self.user_id}
+        with open(f"{self.state_path}.part", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(f"{self.state_path}.part", self.state_path)
+
+    def checkpoint(self):
+        """Save the progress at most every STATE_SAVE_INTERVAL seconds; whether another worker asked to cancel the job."""
+        if time.time() - self._saved_at < STATE_SAVE_INTERVAL:
+            return False
+        self.save()
+        return os.path.exists(self.cancel_path)
+
+    def expired(self, now, retention):
+        return not self.active and now - (self.finished_at or self.created_at) > retention
+
+    def remove_files(self):
+        for path in (self.path, f"{self.path}.part", self.state_path, f"{self.state_path}.part", self.cancel_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def as_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "bytes_written": self.bytes_written,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ExportManager:
+    """
+    Builds export archives in the background on a bounded thread pool, writing them to a spool directory.
+
+    Limits are checked when a job is submitted: at most `per_user` queued or running jobs per user and `max_jobs`
+    overall, so exports can neither monopolize the SMB share nor pile up. They count the jobs of this process, so
+    with several workers they apply to each of them. Job state is kept in the spool directory, so any worker on the
+    host can report, serve or cancel any job; jobs interrupted by a restart are reported as failed. Finished jobs
+    and their archives are dropped `retention` seconds after they finish, by whichever worker notices first.
+    """
+
+    def __init__(self, spool_dir, workers, per_user, max_jobs, retention):
+        self.spool_dir = spool_dir
+        self.per_user = per_user
+        self.max_jobs = max_jobs
+        self.retention = retention
+        self._jobs = {}  # jobs built by this process
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        os.makedirs(spool_dir, exist_ok=True)
+        self._sweep()
+        threading.Thread(target=self._heartbeat, name="export-heartbeat", daemon=True).start()
+
+    def submit(self, user_id, files_total, build):
+        """
+        Queue a job writing the bytes yielded by build(on_file_done) to its archive.
+        Raises 429 when the user or the server already has as many active jobs as allowed.
+        """
+        self._sweep()
+        with self._lock:
+            active = [job for job in self._jobs.values() if job.active]
+            if sum(job.user_id == user_id for job in active) >= self.per_user:
+                raise HTTPException(status_code=429, detail="Too many export jobs in progress for this user.")
+            if len(active) >= self.max_jobs:
+                raise HTTPException(status_code=429, detail="Too many export jobs in progress, try again later.")
+            job = ExportJob(user_id, files_total, self.spool_dir)
+            self._jobs[job.id] = job
+        job.save()
+        self._executor.submit(self._run, job, build)
+        return job
+
+    def get(self, job_id, user_id):
+        """The user's job with that ID; 404 for unknown, expired, deleted or other users' jobs."""
+        self._sweep()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and _JOB_ID.fullmatch(job_id):
+            job = ExportJob.load(self.spool_dir, job_id)
+        if job is None or job.user_id != user_id or os.path.exists(job.cancel_path):
+            raise HTTPException(status_code=404, detail="Export job not found")
+        return job
+
+    def delete(self, job_id, user_id):
+        """Cancel the job if it is still queued or running, and remove its archive."""
+        job = self.get(job_id, user_id)
+        # The marker hides the job from every worker and stops it in the one building it (see ExportJob.checkpoint())
+        open(job.cancel_path, "w").close()
+        job.cancelled.set()
+        if not job.active:
+            self._forget(job)
+
+    def _run(self, job, build):
+        if job.cancelled.is_set() or os.path.exists(job.cancel_path):
+            job.status, job.finished_at = "cancelled", time.time()
+            self._forget(job)
+            return
+        job.status = "running"
+        job.save()
+        part_path = f"{job.path}.part"
+        chunks = None
+        try:
+            chunks = build(job.file_done)
+            with open(part_path, "wb") as f:
+                for chunk in chunks:
+                    if job.cancelled.is_set():
+                        raise _Cancelled()
+                    f.write(chunk)
+                    job.bytes_written += len(chunk)
+                    if job.checkpoint():
+                        raise _Cancelled()
+            os.replace(part_path, job.path)
+            job.status = "done"
+        except _Cancelled:
+            job.status = "cancelled"
+        except HTTPException as err:
+            job.status, job.error = "failed", err.detail
+        except Exception as err:
+            print(f"Export job {job.id} failed: {err}")
+            job.status, job.error = "failed", str(err)
+        finally:
+            job.finished_at = time.time()
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            self._remove(part_path)
+            if job.cancelled.is_set() or os.path.exists(job.cancel_path):
+                self._forget(job)
+            else:
+                job.save()
+
+    def _forget(self, job):
+        # A cancelled job is gone for every worker, including this one
+        with self._lock:
+            self._jobs.pop(job.id, None)
+        job.remove_files()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._lock:
+                active = [job for job in self._jobs.values() if job.active]
+            for job in active:
+                try:
+                    os.utime(job.state_path)
+                except FileNotFoundError:
+                    pass
+
+    def _sweep(self):
+        now = time.time()
+        with self._lock:
+            for job in [job for job in self._jobs.values() if job.expired(now, self.retention)]:
+                del self._jobs[job.id]
+        # Expired jobs of every worker, and files left without a state by a crash once they are as old
+        for name in os.listdir(self.spool_dir):
+            match = _SPOOL_FILE.fullmatch(name)
+            if match is None:
+                continue
+            job = ExportJob.load(self.spool_dir, match.group(1)) if match.group(2) == "json" else None
+            if job is not None:
+                if job.expired(now, self.retention):
+                    job.remove_files()
+            elif not os.path.exists(os.path.join(self.spool_dir, f"export-{match.group(1)}.json")):
+                try:
+                    if now - os.path.getmtime(os.path.join(self.spool_dir, name)) > self.retention:
+                        self._remove(os.path.join(self.spool_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_export_manager():
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ExportManager(EXPORT_SPOOL_DIR, EXPORT_WORKERS, EXPORT_JOBS_PER_USER, EXPORT_MAX_JOBS, EXPORT_RETENTION)
+    return _manager
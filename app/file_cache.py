@@ -0,0 +1,251 @@
+# built-in
+import fcntl
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+# third-party
+from fastapi.responses import FileResponse
+
+# local
+from app.config import FILE_CACHE_DIR, FILE_CACHE_MAX_BYTES
+
+# Partial copies not written to for this long are left over from an interrupted fill rather than still filling
+STALE_PART_SECONDS = 24 * 3600
+
+
+class DiskCache:
+    """
+    Read-through cache of SMB files on local disk, evicting least recently used files to stay within max_bytes.
+
+    Files are keyed by smb_path, size and mtime, so a file that changes on the share is simply a miss and its
+    stale copy ages out. Copies are written while the first requester streams the file from SMB (fill()) and only
+    become visible once complete; interrupted or failed fills are discarded without affecting the download.
+
+    The directory is the only shared state: sizes and recency (mtime, touched on every hit) are read from it when
+    evicting, and copies in use are pinned with file locks, so all worker processes of a host can share one
+    directory and one budget. Only the hit/miss counters are per process.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._filling = set()
+        self._stats = {"hits": 0, "misses": 0, "bytes_saved": 0, "bytes_filled": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._remove_stale_parts()
+        with self._lock:
+            self._evict(0)
+
+    def _remove_stale_parts(self):
+        # Left behind by fills interrupted by a restart; recent ones may be fills in progress in other workers
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".part"):
+                try:
+                    if time.time() - entry.stat().st_mtime > STALE_PART_SECONDS:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _scan(self):
+        """(mtime, path, size) of every complete copy, least recently used first."""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".part"):
+                continue
+            try:
+                file_stat = entry.stat()
+            except FileNotFoundError:  # evicted by another worker meanwhile
+                continue
+            files.append((file_stat.st_mtime, entry.path, file_stat.st_size))
+        return sorted(files)
+
+    @staticmethod
+    def _key(smb_path, file_stat):
+        return hashlib.sha256(f"{smb_path}\0{file_stat.st_size}\0{file_stat.st_mtime_ns}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    @staticmethod
+    def _remove_unpinned(path):
+        """Delete a cached copy unless a reader has it pinned (see open()); whether it is gone."""
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return True
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        finally:
+            os.close(fd)
+        return True
+
+    def _evict(self, incoming):
+        # Pinned copies are skipped and go over the budget until a later eviction finds them unpinned
+        files = self._scan()
+        size = sum(file_size for _, _, file_size in files)
+        for _, path, file_size in files:
+            if size + incoming <= self.max_bytes:
+                break
+            if self._remove_unpinned(path):
+                size -= file_size
+                self._stats["evictions"] += 1
+
+    def open(self, smb_path, file_stat):
+        """
+        Open the cached copy of the file as it is now for binary reading, or return None (counted as a miss). The copy
+        is pinned by a shared lock on the open file, so it is not evicted until the file is closed and can be served
+        by path meanwhile (see CachedFileResponse).
+        """
+        try:
+            f = open(self._path(self._key(smb_path, file_stat)), "rb")
+        except FileNotFoundError:
+            f = None
+        if f is not None:
+            # Waits only while an eviction holds the copy; if it was removed meanwhile, it is a miss
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+            if os.fstat(f.fileno()).st_nlink == 0:
+                f.close()
+                f = None
+        with self._lock:
+            self._stats["hits" if f is not None else "misses"] += 1
+        if f is not None:
+            try:
+                os.utime(f.fileno())  # recency for _evict(), shared by all workers and surviving restarts
+            except OSError:
+                pass
+        return f
+
+    def count_saved(self, nbytes):
+        """Record bytes served from the cache instead of the share."""
+        with self._lock:
+            self._stats["bytes_saved"] += nbytes
+
+    def fill(self, smb_path, file_stat, chunks):
+        """Pass the chunks of a file read from SMB through, storing a copy once all of them have been consumed."""
+        key = self._key(smb_path, file_stat)
+        with self._lock:
+            # Files over the budget are never cached; concurrent requesters of the same file don't fill twice
+            if file_stat.st_size > self.max_bytes or key in self._filling or os.path.exists(self._path(key)):
+                key = None
+            else:
+                self._filling.add(key)
+        if key is None:
+            yield from chunks
+            return
+
+        part_path = os.path.join(self.directory, f"{key}.{uuid.uuid4().hex}.part")
+        written = 0
+        f = None
+        try:
+            try:
+                f = open(part_path, "wb")
+            except OSError:
+                pass
+            for chunk in chunks:
+                if f is not None:
+                    try:
+                        f.write(chunk)
+                        written += len(chunk)
+                    except OSError:
+                        # e.g. disk full: stop caching, keep streaming
+                        f.close()
+                        f = None
+                yield chunk
+            if f is not None:
+                f.close()
+                f = None
+                if written == file_stat.st_size:
+                    try:
+                        self._commit(key, part_path, written)
+                    except OSError as err:
+                        print(f"File cache error: {err}")
+        finally:
+            if f is not None:
+                f.close()
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            with self._lock:
+                self._filling.discard(key)
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+    def _commit(self, key, part_path, size):
+        with self._lock:
+            self._evict(size)
+            os.replace(part_path, self._path(key))
+            self._stats["bytes_filled"] += size
+
+    def stats(self):
+        files = self._scan()
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "size_bytes": sum(file_size for _, _, file_size in files),
+                "max_bytes": self.max_bytes,
+                "files": len(files),
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_file_cache():
+    """The process-wide disk cache, or None when FILE_CACHE_DIR is not set."""
+    global _cache
+    if not FILE_CACHE_DIR:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DiskCache(FILE_CACHE_DIR, FILE_CACHE_MAX_BYTES)
+    return _cache
+
+
+def get_file_cache_stats():
+    cache = get_file_cache()
+    return cache.stats() if cache is not None else None
+
+
+def iter_local_file(f, chunk_size, length=None):
+    """Yield the contents of an open local file in chunks, or its next `length` bytes, closing it at the end."""
+    with f:
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+class CachedFileResponse(FileResponse):
+    """
+    FileResponse of a copy opened with DiskCache.open(), sent by path (zero-copy where the server supports it) while
+    the open file keeps it pinned, and closed once the response has been sent or abandoned.
+    """
+
+    def __init__(self, cached_file, **kwargs):
+        super().__init__(cached_file.name, stat_result=os.fstat(cached_file.fileno()), **kwargs)
+        self.cached_file = cached_file
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.cached_file.close()
@@ -6,7 +6,8 @@ from fastapi import FastAPI
 import smbclient
 
 # local
-from app.routers import records, download, events, sessions, token
+from app.metrics import MetricsMiddleware
+from app.routers import records, download, events, exports, metrics, sessions, token
 from app.config import SMB_USER, SMB_PASSWORD
 
 # Register your SMB server credentials
@@ -33,6 +34,9 @@ app.include_router(records.router)
 app.include_router(download.router)
 app.include_router(events.router)
 app.include_router(sessions.router)
+app.include_router(exports.router)
+app.include_router(metrics.router)
+app.add_middleware(MetricsMiddleware)
 
 
 
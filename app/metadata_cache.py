@@ -0,0 +1,79 @@
+# built-in
+import threading
+import time
+
+# third-party
+import mysql.connector
+
+# local
+from app.cache import MISSING, TTLCache
+from app.config import METADATA_CACHE_TTL, METADATA_CACHE_SIZE, METADATA_CACHE_MAX_ROWS, METADATA_GENERATION_CHECK
+from app.database import fetch_rows, get_db_connection, release_db_connection
+
+# Results of the /records, /events and /sessions queries. Metadata only changes when an import script runs,
+# so entries are keyed on the generation those scripts bump (metadata_generation) plus the generated SQL and
+# its parameters, which already normalize the filters (e.g. event types become one bitmask). Entries are weighed by
+# their row count, so unpaged cohort-wide listings cannot grow the cache past METADATA_CACHE_MAX_ROWS rows.
+_cache = TTLCache(maxsize=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL, max_weight=METADATA_CACHE_MAX_ROWS)
+
+_generation_lock = threading.Lock()
+_generation = None
+_generation_checked = None
+
+
+def _read_generation():
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT generation FROM metadata_generation WHERE id = 1")
+        row = cursor.fetchone()
+        cursor.close()
+    except mysql.connector.Error as err:
+        # e.g. db/migrations/003_metadata_generation.sql not applied yet: entries then only expire with the TTL
+        print(f"DB Error reading metadata generation: {err}")
+        return None
+    finally:
+        release_db_connection(conn)
+    return row[0] if row else 0
+
+
+def current_generation():
+    """Metadata generation, re-read at most every METADATA_GENERATION_CHECK seconds. The cache is cleared when it changes."""
+    global _generation, _generation_checked
+    now = time.monotonic()
+    with _generation_lock:
+        refresh = _generation_checked is None or now - _generation_checked >= METADATA_GENERATION_CHECK
+        if refresh:
+            # Claimed before reading, so other requests keep using the current generation meanwhile instead of
+            # waiting for this read (which may itself wait for a pooled connection) or starting their own
+            _generation_checked = now
+    if refresh:
+        generation = _read_generation()
+        with _generation_lock:
+            if generation != _generation:
+                _cache.clear()
+                _generation = generation
+    return _generation
+
+
+def cached_fetchall(query, params):
+    """
+    All rows of a metadata query, served from the cache when the same query ran in the current generation.
+    Misses run the query on their own pooled connection, so hits never check out a connection.
+    """
+    key = (current_generation(), query, tuple(params))
+    rows = _cache.get(key)
+    if rows is MISSING:
+        rows = fetch_rows(query, params)
+        _cache.set(key, rows, weight=len(rows))
+    # Callers trim pages in place (set_next_cursor), so never hand out the cached list itself
+    return list(rows)
+
+
+def clear_metadata_cache():
+    _cache.clear()
+
+
+def get_metadata_cache_stats():
+    """Cache counters (size, hits, misses, hit_rate) and the generation the entries belong to."""
+    return {"generation": _generation, **_cache.stats()}
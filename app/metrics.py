@@ -0,0 +1,121 @@
+# built-in
+import contextvars
+import re
+import time
+from functools import lru_cache
+
+# third-party
+from prometheus_client import Counter, Gauge, Histogram
+
+# Durations span fast metadata lookups to multi-GB zips, so the request buckets reach well past the default 10 s
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+REQUEST_SECONDS = Histogram(
+    "api_request_duration_seconds", "Time from receiving a request to sending the last byte of its response",
+    ["method", "route", "status"], buckets=REQUEST_BUCKETS,
+)
+RESPONSES_IN_PROGRESS = Gauge("api_responses_in_progress", "Responses being sent, e.g. downloads still streaming", ["method", "route"])
+RESPONSE_BYTES = Counter("api_response_bytes", "Response body bytes sent", ["method", "route"])
+
+DB_CONNECT_SECONDS = Histogram("api_db_connect_duration_seconds", "Time to check out a pooled connection, including waiting for a free one", ["router"])
+DB_QUERY_SECONDS = Histogram("api_db_query_duration_seconds", "Time spent executing a statement and fetching its rows", ["router", "query"])
+
+SMB_OPEN_SECONDS = Histogram("api_smb_open_duration_seconds", "Time to open a file on the SMB share")
+SMB_READ_SECONDS = Histogram("api_smb_read_duration_seconds", "Time of a single read from the SMB share")
+SMB_READ_BYTES = Counter("api_smb_read_bytes", "Bytes read from the SMB share")
+
+ZIP_CPU_SECONDS = Counter("api_zip_cpu_seconds", "CPU time spent building zip streams (compression and framing)", ["router"])
+
+# ASGI scope of the request being handled, for the metrics recorded deep in the DB and zip code, which are labeled
+# with the router (tag) of its route. Context variables follow the request into the worker threads of app.executors;
+# background work (e.g. export jobs) has no request.
+_scope = contextvars.ContextVar("metrics_scope", default=None)
+
+
+def _route_labels(scope):
+    """(route path template, router tag) of a request; set once Starlette has routed it."""
+    route = scope.get("route") if scope is not None else None
+    if route is None:
+        return "unmatched", "other"
+    tags = getattr(route, "tags", None)
+    return route.path, tags[0] if tags else "other"
+
+
+def current_router():
+    scope = _scope.get()
+    return _route_labels(scope)[1] if scope is not None else "background"
+
+
+@lru_cache(maxsize=1024)
+def query_shape(query):
+    """Low-cardinality label for a statement: its verb and main table, e.g. "SELECT records"."""
+    verb = query.split(None, 1)[0].upper() if query.strip() else ""
+    table = re.search(r"\b(?:FROM|INTO|UPDATE)\s+`?(\w+)", query, re.IGNORECASE)
+    return f"{verb} {table.group(1)}" if table else verb
+
+
+def cpu_timed(chunks):
+    """
+    Pass through a stream of chunks, adding the CPU time of the thread producing each one to ZIP_CPU_SECONDS.
+    Each chunk is produced on a single thread, even when iterate_on() pulls successive ones on different threads.
+    """
+    chunks = iter(chunks)
+    counter = ZIP_CPU_SECONDS.labels(current_router())
+    try:
+        while True:
+            started = time.thread_time()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                counter.inc(time.thread_time() - started)
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency, status and response bytes of every HTTP request per route template, and
+    the responses still being sent. Timing ends when the last byte of the response is sent, so streamed downloads
+    are measured in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        in_progress = None
+        sent = None
+
+        async def send_with_metrics(message):
+            nonlocal status, in_progress, sent
+            if message["type"] == "http.response.start":
+                # Routing has run by now, so the route template is known
+                status = message["status"]
+                path = _route_labels(scope)[0]
+                sent = RESPONSE_BYTES.labels(method, path)
+                in_progress = RESPONSES_IN_PROGRESS.labels(method, path)
+                in_progress.inc()
+            elif message["type"] == "http.response.body" and sent is not None:
+                sent.inc(len(message.get("body", b"")))
+            await send(message)
+
+        token = _scope.set(scope)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            REQUEST_SECONDS.labels(method, _route_labels(scope)[0], str(status)).observe(time.perf_counter() - started)
+            if in_progress is not None:
+                in_progress.dec()
+            _scope.reset(token)
@@ -1,12 +1,16 @@
 # third-party
 from fastapi import HTTPException
 
+SESSION_TIMES_QUERY = "SELECT start_time, end_time FROM sessions WHERE session_id = %s"
+
+
 def check_session_date_id(cursor, session_id, session_date):
-    cursor.execute(
-        "SELECT start_time, end_time FROM sessions WHERE session_id = %s",
-        (session_id,)
-    )
-    session = cursor.fetchone()
+    cursor.execute(SESSION_TIMES_QUERY, (session_id,))
+    check_session_times(cursor.fetchone(), session_date)
+
+
+def check_session_times(session, session_date):
+    """Validate session_date against the start/end time row of the session (None if the session does not exist)."""
     if not session:
         raise HTTPException(status_code=404, detail="Session ID not found.")
 
@@ -17,4 +21,4 @@ def check_session_date_id(cursor, session_id, session_date):
                 detail="Provided session_date is outside the start/end time of the given session_id."
             )
     except TypeError:
-        pass
\ No newline at end of file
+        pass
@@ -1,98 +1,238 @@
+# built-in
+import json
+from typing import Optional
+
 # third-party
-from fastapi import APIRouter, Path, Query, HTTPException, Depends
-from fastapi.responses import StreamingResponse
-import io
+from fastapi import APIRouter, Path, Query, Header, HTTPException, Depends, Response
+from fastapi.responses import FileResponse, StreamingResponse
 import smbclient
 import zipstream
 
 # local
-from app.database import get_db_connection
-from app.config import SMB_SHARE
+from app.columnar import COLUMNAR_FORMATS, converted_file_stat, current_columnar
+from app.config import ZIP_PREFETCH_CHUNK_SIZE
+from app.database import fetch_rows
+from app.file_cache import CachedFileResponse, get_file_cache, iter_local_file
+from app.executors import iterate_on, on_download_threads, run_download
+from app.metrics import cpu_timed
 from app.routers.token import get_current_user
+from app.routers.enums import CompressionEnum, MODALITY_EXTENSIONS, SENSITIVE_MODALITIES, SignalFormatEnum
+from app.routers.ranges import current_content_hash, http_date, if_none_match_matches, if_range_matches, parse_range, record_etag
+from app.smb import SmbPrefetcher, get_smb_path, iter_smb_file, stat_smb_files
 
 
 router = APIRouter(prefix='/download', tags=['download'])
 
+# Video, PDFs and zipped office/EEG bundles are already compressed, so deflating them burns CPU for almost no gain
+MODALITY_COMPRESSION = {
+    'hospital_video': zipstream.ZIP_STORED,
+    'hospital_eeg': zipstream.ZIP_DEFLATED,
+    'wearable': zipstream.ZIP_DEFLATED,
+    'report': zipstream.ZIP_STORED,
+}
+EXTENSION_COMPRESSION = {
+    extension: MODALITY_COMPRESSION[modality]
+    for modality, extensions in MODALITY_EXTENSIONS.items()
+    for extension in extensions
+}
+EXTENSION_COMPRESSION.update({'.mff': zipstream.ZIP_STORED, '.xdfz': zipstream.ZIP_STORED, '.doc': zipstream.ZIP_DEFLATED})
+
+
+def _compress_type(entry, compression):
+    if compression == CompressionEnum.store:
+        return zipstream.ZIP_STORED
+    if compression == CompressionEnum.deflate:
+        return zipstream.ZIP_DEFLATED
+    return EXTENSION_COMPRESSION.get(entry['file_extension'].lower(), zipstream.ZIP_DEFLATED)
+
+
+def _notify_when_read(chunks, callback):
+    yield from chunks
+    callback()
+
+
+def records_zip_stream(files, compression=CompressionEnum.auto, dedupe=False, on_file_done=None):
+    """
+    Stat the files of the given records rows (404 if any is missing) and return a generator of the bytes of a zip
+    holding them, built as it is consumed. on_file_done, if given, is called after each file has been read.
+    """
+    smb_paths = [get_smb_path(f['smb_path']) for f in files]
+    file_stats = stat_smb_files(smb_paths)
+    for f, file_stat in zip(files, file_stats):
+        if file_stat is None:
+            raise HTTPException(status_code=404, detail=f"File {f['smb_path']} not found on SMB share")
+
+    # Shared sidecars and reports are referenced by several sessions; read and send their content only once
+    entries, duplicates, stored = [], {}, {}
+    for f, smb_path, file_stat in zip(files, smb_paths, file_stats):
+        content_hash = current_content_hash(f, file_stat) if dedupe else None
+        if content_hash in stored:
+            duplicates[f['smb_path']] = stored[content_hash]
+            if on_file_done is not None:
+                on_file_done()
+            continue
+        if content_hash:
+            stored[content_hash] = f['smb_path']
+        entries.append((f, smb_path, file_stat))
+
+    # ZIP64 records are only written for entries and offsets that need them, i.e. archives over 4 GB
+    z = zipstream.ZipFile(mode='w', compression=zipstream.ZIP_DEFLATED, allowZip64=True)
+
+    # Files in the local cache are read from disk; the others are read ahead from SMB on a thread pool while
+    # earlier entries are compressed and sent, filling the cache on the way
+    file_cache = get_file_cache()
+    cached_files = {}
+    for index, (f, _, file_stat) in enumerate(entries):
+        cached_file = file_cache.open(f['smb_path'], file_stat) if file_cache else None
+        if cached_file is not None:
+            cached_files[index] = cached_file
+    prefetcher = SmbPrefetcher([smb_path for index, (_, smb_path, _) in enumerate(entries) if index not in cached_files])
+
+    remote_index = 0
+    for index, (f, _, file_stat) in enumerate(entries):
+        if index in cached_files:
+            chunks = iter_local_file(cached_files[index], ZIP_PREFETCH_CHUNK_SIZE)
+            file_cache.count_saved(file_stat.st_size)
+        else:
+            chunks = prefetcher.iter_file(remote_index)
+            remote_index += 1
+            if file_cache:
+                chunks = file_cache.fill(f['smb_path'], file_stat, chunks)
+        if on_file_done is not None:
+            chunks = _notify_when_read(chunks, on_file_done)
+        # buffer_size lets zipstream switch the entry to ZIP64 up front when the file is over 4 GB
+        z.write_iter(f['smb_path'], chunks, compress_type=_compress_type(f, compression), buffer_size=file_stat.st_size)
+    if duplicates:
+        z.writestr("duplicates.json", json.dumps(duplicates, indent=2).encode())
+
+    def zip_stream():
+        try:
+            yield from cpu_timed(z)
+        finally:
+            prefetcher.close()
+            for cached_file in cached_files.values():
+                cached_file.close()
+
+    return zip_stream()
+
+
 @router.get("/{record_id}", summary="Download record", description="Download a single record by ID")
-def download_file(record_id: int = Path(..., description="Record ID"), user=Depends(get_current_user)):
+@on_download_threads
+def download_file(
+    record_id: int = Path(..., description="Record ID"),
+    format: Optional[SignalFormatEnum] = Query(None, description="Download the converted (binary columnar) form of a wearable recording instead of the original file: npy or parquet"),
+    range: Optional[str] = Header(None, description="Single byte range to download (e.g., bytes=0-1023), for resuming interrupted transfers"),
+    if_range: Optional[str] = Header(None, description="ETag or Last-Modified value the Range is conditional on"),
+    if_none_match: Optional[str] = Header(None, description="ETag(s) of copies the client already has; answered with 304 Not Modified if one is current"),
+    user=Depends(get_current_user),
+):
     """
-    Download a single record by ID.
+    Download a single record by ID. Supports resuming through Range/If-Range requests and revalidation through
+    If-None-Match. The ETag is the file's SHA-256 once it has been hashed, so it identifies the content itself.
 
     - **record_id**: Record ID
+    - **format**: npy (a column-major samples x channels array, memory-mappable with np.load(mmap_mode='r')) or
+      parquet (one column per channel) to download the converted form of a wearable recording
+    - **range**: Single byte range to download (e.g., bytes=0-1023)
+    - **if_range**: ETag or Last-Modified value the Range is conditional on
+    - **if_none_match**: ETag(s) of copies the client already has
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    rows = fetch_rows("SELECT * FROM records WHERE record_id = %s", (record_id,))
+    entry = rows[0] if rows else None
 
-    try:
-        query = """
-            SELECT * FROM records WHERE record_id = %s
-        """
-        cursor.execute(query, (record_id,))
-        entry = cursor.fetchone()
-
-        if not entry:
-            raise HTTPException(status_code=404, detail="File not found")
-        
-        if entry["modality"] in ["hospital_video", "report"] and not user['can_access_sensitive']:
-            raise HTTPException(status_code=403, detail="Access to sensitive data denied.")
-        
-        smb_path = rf"{SMB_SHARE}\{entry['smb_path']}"
+    if not entry:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if entry["modality"] in SENSITIVE_MODALITIES and not user['can_access_sensitive']:
+        raise HTTPException(status_code=403, detail="Access to sensitive data denied.")
 
-        with smbclient.open_file(smb_path, mode='rb') as remote_file:
-            data = remote_file.read()
+    smb_path = get_smb_path(entry['smb_path'])
 
-        return StreamingResponse(io.BytesIO(data), media_type="application/octet-stream", headers={
-            "Content-Disposition": f"attachment; filename={entry['smb_path']}"
-        })
+    try:
+        file_stat = smbclient.stat(smb_path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="File not found on SMB share")
+
+    if format:
+        # Served from local disk as written by the crawler, with FileResponse's own Range support and zero-copy sends
+        meta = current_columnar(entry['smb_path'], file_stat)
+        path = meta['paths'][format.value]
+        return FileResponse(
+            path, stat_result=converted_file_stat(path, format.value),
+            media_type=COLUMNAR_FORMATS[format.value], filename=f"{entry['file_name']}.{format.value}",
+        )
 
-    finally:
-        cursor.close()
-        conn.close()
+    size = file_stat.st_size
+    headers = {
+        "Content-Disposition": f"attachment; filename={entry['smb_path']}",
+        "Accept-Ranges": "bytes",
+        "ETag": record_etag(entry, file_stat),
+        "Last-Modified": http_date(file_stat.st_mtime),
+    }
+
+    if if_none_match and if_none_match_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers={"ETag": headers["ETag"], "Last-Modified": headers["Last-Modified"]})
+
+    byte_range = None
+    if range and (if_range is None or if_range_matches(if_range, headers["ETag"], file_stat.st_mtime)):
+        byte_range = parse_range(range, size)
+
+    file_cache = get_file_cache()
+    cached_file = file_cache.open(entry['smb_path'], file_stat) if file_cache else None
+    if cached_file is not None:
+        # Served from local disk; FileResponse applies the Range itself and uses zero-copy sends where the server supports them
+        file_cache.count_saved(size if byte_range is None else byte_range[1] - byte_range[0] + 1)
+        return CachedFileResponse(cached_file, media_type="application/octet-stream", headers=headers)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        chunks = iter_smb_file(smb_path)
+        if file_cache:
+            chunks = file_cache.fill(entry['smb_path'], file_stat, chunks)
+        return StreamingResponse(iterate_on(run_download, chunks), media_type="application/octet-stream", headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iterate_on(run_download, iter_smb_file(smb_path, start=start, length=end - start + 1)),
+        status_code=206,
+        media_type="application/octet-stream",
+        headers=headers,
+    )
 
 
 @router.get("/", summary="Download records", description="Download multiple records by ID into a zip")
-def download_files(record_ids: list[int] = Query(..., description="List with record IDs"), user=Depends(get_current_user)):
+@on_download_threads
+def download_files(
+    record_ids: list[int] = Query(..., description="List with record IDs"),
+    compression: CompressionEnum = Query(CompressionEnum.auto, description="Zip compression: auto (stored for already-compressed formats, deflated otherwise), store or deflate"),
+    dedupe: bool = Query(False, description="Store files with identical content once; the other paths are listed in duplicates.json"),
+    user=Depends(get_current_user),
+):
     """
     Download multiple records by ID into a zip. The zip maintains original directory structure.
 
     - **record_id**: List with record IDs
+    - **compression**: Zip compression: auto (stored for already-compressed formats, deflated otherwise), store or deflate
+    - **dedupe**: Off by default, so every path is in the zip. When on, files with identical content (same current
+      content hash) are stored once and duplicates.json maps every other path to the entry holding its content
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    # Fetch all files matching the given IDs
+    format_strings = ','.join(['%s'] * len(record_ids))
+    files = fetch_rows(f"SELECT * FROM records WHERE record_id IN ({format_strings})", tuple(record_ids))
 
-    try:
-        # Fetch all files matching the given IDs
-        format_strings = ','.join(['%s'] * len(record_ids))
-        query = f"SELECT * FROM records WHERE record_id IN ({format_strings})"
-        cursor.execute(query, tuple(record_ids))
-        files = cursor.fetchall()
-
-        if not files:
-            raise HTTPException(status_code=404, detail="No files found")
-
-        z = zipstream.ZipFile(mode='w', compression=zipstream.ZIP_DEFLATED)
-
-        # Add files to ZIP stream one by one
-        for f in files:
-            if f["modality"] in ["hospital_video", "report"] and not user['can_access_sensitive']:
-                raise HTTPException(status_code=403, detail="Access to sensitive data denied.")
-            smb_path = rf"{SMB_SHARE}\{f['smb_path']}"
-
-            def file_generator(path):
-                with smbclient.open_file(path, mode='rb') as remote_file:
-                    chunk = remote_file.read(4096)
-                    while chunk:
-                        yield chunk
-                        chunk = remote_file.read(4096)
-
-            z.write_iter(f['smb_path'], file_generator(smb_path))
-
-        return StreamingResponse(
-            z,
-            media_type="application/zip",
-            headers={"Content-Disposition": "attachment; filename=records.zip"}
-        )
+    if not files:
+        raise HTTPException(status_code=404, detail="No files found")
+
+    for f in files:
+        if f["modality"] in SENSITIVE_MODALITIES and not user['can_access_sensitive']:
+            raise HTTPException(status_code=403, detail="Access to sensitive data denied.")
+
+    zip_stream = records_zip_stream(files, compression, dedupe)
 
-    finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+    return StreamingResponse(
+        iterate_on(run_download, zip_stream),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=records.zip"}
+    )
@@ -7,6 +7,34 @@ class ModalityEnum(str, Enum):
     report = "report"
 
 
+# File extensions of each modality, used to classify files on import and to pick a zip compression per entry
+MODALITY_EXTENSIONS = {
+    'hospital_video': ['.mpe', '.wmv', '.avi'],
+    'hospital_eeg': ['.vhdr', '.vmrk', '.eeg', '.edf', '.bdf', '.gdf', '.cnt', '.egi', '.mff', '.set', '.fdt', '.data', '.nxe', '.lay', '.dat', '.eeg', '.21e', '.pnt', '.log', '.xdf', '.xdfz', '.trc'],
+    'wearable': ['.txt'],
+    'report': ['.doc', '.docx', '.pdf']
+}
+
+# Modalities only users with can_access_sensitive may download or locate
+SENSITIVE_MODALITIES = {'hospital_video', 'report'}
+
+
+class CompressionEnum(str, Enum):
+    auto = "auto"
+    store = "store"
+    deflate = "deflate"
+
+
+class SignalFormatEnum(str, Enum):
+    npy = "npy"
+    parquet = "parquet"
+
+
+class WindowFormatEnum(str, Enum):
+    text = "text"
+    npy = "npy"
+
+
 class SeizureClassEnum(str, Enum):
     seizure = "seizure"
     non_seizure = "non-seizure"
@@ -26,3 +54,56 @@ class SeizureClassEnum(str, Enum):
     non_motor = "non-motor"
     automatisms = "automatisms"
     behavior_arrest = "behavior arrest"
+
+
+# Bit of each classification in events.classification_mask. The order is that of the classifications.name ENUM
+# in db/schema.sql, so the same mask can be computed in SQL as 1 << (name + 0 - 1). Only ever append to it.
+CLASSIFICATION_BITS = {
+    name: 1 << bit for bit, name in enumerate([
+        "seizure", "non-seizure", "subclinical", "electrographic", "non-electrographic",
+        "aware", "impaired awareness", "unknown awareness",
+        "focal", "generalized", "to bilateral tonic-clonic", "tonic-clonic", "tonic",
+        "motor", "non-motor", "automatisms", "behavior arrest", "absence",
+    ])
+}
+
+
+def classification_mask(names):
+    """OR together the bits of the given classification names (plain strings or SeizureClassEnum members)."""
+    mask = 0
+    for name in names:
+        mask |= CLASSIFICATION_BITS[SeizureClassEnum(name).value]
+    return mask
+
+
+class RecordFieldEnum(str, Enum):
+    record_id = "record_id"
+    session_id = "session_id"
+    patient_code = "patient_code"
+    file_name = "file_name"
+    file_extension = "file_extension"
+    smb_path = "smb_path"
+    modality = "modality"
+    start_time = "start_time"
+    end_time = "end_time"
+    content_hash = "content_hash"
+    hashed_size = "hashed_size"
+    hashed_mtime_ns = "hashed_mtime_ns"
+
+
+class EventFieldEnum(str, Enum):
+    event_id = "event_id"
+    session_id = "session_id"
+    patient_code = "patient_code"
+    onset_time = "onset_time"
+    offset_time = "offset_time"
+    annotations = "annotations"
+    classifications = "classifications"
+
+
+class SessionFieldEnum(str, Enum):
+    session_id = "session_id"
+    patient_code = "patient_code"
+    hospital_code = "hospital_code"
+    start_time = "start_time"
+    end_time = "end_time"
@@ -2,22 +2,85 @@
 from datetime import datetime
 
 # third-party
-from fastapi import APIRouter, Query, HTTPException
+from fastapi import APIRouter, Depends, Header, Query, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from typing import Optional
 
 # local
-from app.database import get_db_connection
-from app.routers.checks import check_session_date_id
-from app.routers.enums import SeizureClassEnum
+from app.config import EPOCH_MAX_EVENTS
+from app.epochs import epochs_zip_stream, plan_epochs
+from app.executors import iterate_on, on_db_threads, on_download_threads, run_download
+from app.metadata_cache import cached_fetchall
+from app.routers.checks import SESSION_TIMES_QUERY, check_session_times
+from app.routers.enums import EventFieldEnum, SeizureClassEnum, classification_mask
+from app.routers.pagination import keyset_filter, keyset_order, select_fields, set_next_cursor
+from app.routers.streaming import stream_media_type, stream_query
+from app.routers.token import get_current_user
 
 router = APIRouter(prefix='/events', tags=['events'])
 
+EVENT_COLUMNS = {
+    'event_id': 'e.event_id',
+    'session_id': 'e.session_id',
+    'patient_code': 'p.patient_code',
+    'onset_time': 'e.onset_time',
+    'offset_time': 'e.offset_time',
+    'annotations': 'e.annotations',
+    'classifications': "GROUP_CONCAT(DISTINCT cl.name ORDER BY cl.name SEPARATOR ', ')",
+}
+EVENT_DEFAULT_FIELDS = ['event_id', 'onset_time', 'offset_time', 'annotations', 'classifications']
+EPOCH_EVENT_FIELDS = [EventFieldEnum.session_id, EventFieldEnum.onset_time, EventFieldEnum.offset_time]
+
+
+def build_events_query(patient_code=None, session_date=None, session_id=None, event_types=None, fields=None, limit=None, page_cursor=None, lookahead=True):
+    """Build the events listing query and its parameters for the given filters."""
+    query = f"""
+        SELECT {select_fields(fields, EVENT_COLUMNS, EVENT_DEFAULT_FIELDS)}
+        FROM events e
+        JOIN sessions s ON e.session_id=s.session_id
+        JOIN patients p ON s.patient_id=p.patient_id
+        JOIN event_classifications ec ON e.event_id=ec.event_id
+        JOIN classifications cl ON ec.classification_id=cl.classification_id
+        WHERE 1=1
+    """
+    params = []
+
+    if patient_code:
+        query += " AND p.patient_code = %s"
+        params.append(patient_code)
+
+    if session_date:
+        query += " AND s.start_time <= %s AND s.end_time > %s"
+        params.extend([session_date, session_date])
+
+    if session_id:
+        query += " AND s.session_id = %s"
+        params.append(session_id)
+
+    # Seizure types: require ALL specified types
+    if event_types:
+        wanted = classification_mask(event_types)
+        query += " AND (e.classification_mask & %s) = %s"
+        params.extend([wanted, wanted])
+
+    query += keyset_filter("e.event_id", page_cursor, params)
+    query += " GROUP BY e.event_id"
+    query += keyset_order("e.event_id", limit, params, lookahead=lookahead)
+    return query, params
+
+
 @router.get("/", summary="Get events", description="Retrieve all events with optional filters, including by patient code, session, and event type.")
+@on_db_threads
 def get_events(
+    response: Response,
     patient_code: Optional[str] = Query(None, description='4-letter code identifying the patient'),
     session_date: Optional[datetime] = Query(None, description='Session datetime (in the format YYYY-MM-DD HH:MM:SS) which should be within the range of start_time and end_time of desired session'),
     session_id: Optional[int] = Query(None, description='Session ID'),
     event_types: Optional[list[SeizureClassEnum]] = Query(None, description='List of seizure classifications (see class SeizureClassEnum for options)'),
+    fields: Optional[list[EventFieldEnum]] = Query(None, description='Fields to return for each event (default: event_id, onset_time, offset_time, annotations, classifications)'),
+    limit: Optional[int] = Query(None, ge=1, description='Maximum number of events per page; the next page cursor is returned in the X-Next-Cursor header'),
+    page_cursor: Optional[int] = Query(None, alias='cursor', description='X-Next-Cursor value of the previous page'),
+    accept: Optional[str] = Header(None, description='application/x-ndjson or text/csv to stream rows as they are read instead of returning one JSON array'),
 ):
     """
     Retrieve all events with optional filters, including by patient code and session.
@@ -26,60 +89,82 @@ def get_events(
     - **session_date**: Session datetime (in the format YYYY-MM-DD HH:MM:SS) which should be within the range of start_time and end_time of desired session
     - **session_id**: Session ID
     - **event_types**: List of seizure classifications (see class SeizureClassEnum for options)
+    - **fields**: Fields to return for each event (default: event_id, onset_time, offset_time, annotations, classifications)
+    - **limit**: Maximum number of events per page; the next page cursor is returned in the X-Next-Cursor header
+    - **cursor**: X-Next-Cursor value of the previous page
+    - **accept**: application/x-ndjson or text/csv to stream rows as they are read instead of returning one JSON array
+    """
+    # Consistency check if both session_id and session_date are provided
+    if session_id and session_date:
+        sessions = cached_fetchall(SESSION_TIMES_QUERY, [session_id])
+        check_session_times(sessions[0] if sessions else None, session_date)
+
+    media_type = stream_media_type(accept)
+    query, params = build_events_query(patient_code, session_date, session_id, event_types, fields, limit, page_cursor, lookahead=media_type is None)
+
+    # Streams bypass the metadata cache, since they exist for result sets too large to hold in memory
+    if media_type:
+        return stream_query(query, params, media_type, "No events found matching the filters.")
+
+    results = cached_fetchall(query, params)
+    set_next_cursor(response, results, 'event_id', limit)
+
+    if not results:
+        raise HTTPException(status_code=404, detail="No events found matching the filters.")
+    return results
+
+
+@router.get("/epochs", summary="Get event epochs", description="Cut the signal around each event from every overlapping wearable and EEG record, as one zip.")
+@on_download_threads
+def get_event_epochs(
+    response: Response,
+    patient_code: Optional[str] = Query(None, description='4-letter code identifying the patient'),
+    session_date: Optional[datetime] = Query(None, description='Session datetime (in the format YYYY-MM-DD HH:MM:SS) which should be within the range of start_time and end_time of desired session'),
+    session_id: Optional[int] = Query(None, description='Session ID'),
+    event_types: Optional[list[SeizureClassEnum]] = Query(None, description='List of seizure classifications (see class SeizureClassEnum for options)'),
+    pre: float = Query(0, ge=0, description='Seconds of signal before each event onset'),
+    post: float = Query(0, ge=0, description='Seconds of signal after each event offset (or onset, for events without one)'),
+    limit: Optional[int] = Query(None, ge=1, le=EPOCH_MAX_EVENTS, description='Maximum number of events per page (default and maximum: EPOCH_MAX_EVENTS); the next page cursor is returned in the X-Next-Cursor header'),
+    page_cursor: Optional[int] = Query(None, alias='cursor', description='X-Next-Cursor value of the previous page'),
+    user=Depends(get_current_user),
+):
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    try:
-        # Consistency check if both session_id and session_date are provided
-        if session_id and session_date:
-            check_session_date_id(cursor, session_id, session_date)
-            
-        query = """
-            SELECT e.event_id, e.onset_time, e.offset_time, e.annotations, GROUP_CONCAT(DISTINCT cl.name ORDER BY cl.name SEPARATOR ', ') AS classifications
-            FROM events e
-            JOIN sessions s ON e.session_id=s.session_id
-            JOIN patients p ON s.patient_id=p.patient_id
-            JOIN event_classifications ec ON e.event_id=ec.event_id
-            JOIN classifications cl ON ec.classification_id=cl.classification_id
-            WHERE 1=1
-        """
-        params = []
-
-        if patient_code:
-            query += " AND p.patient_code = %s"
-            params.append(patient_code)
-
-        if session_date:
-            query += " AND s.start_time <= %s AND s.end_time > %s"
-            params.extend([session_date, session_date])
-
-        if session_id:
-            query += " AND s.session_id = %s"
-            params.append(session_id)
-
-        # Seizure types: require ALL specified types
-        if event_types:
-            placeholders = ', '.join(['%s'] * len(event_types))
-            subquery = f"""
-                SELECT ec_inner.event_id
-                FROM event_classifications ec_inner
-                JOIN classifications cl_inner ON ec_inner.classification_id = cl_inner.classification_id
-                WHERE cl_inner.name IN ({placeholders})
-                GROUP BY ec_inner.event_id
-                HAVING COUNT(DISTINCT cl_inner.name) = %s
-            """
-            query += f" AND e.event_id IN ({subquery}) GROUP BY e.event_id"
-            params.extend(event_types)
-            params.append(len(event_types))
-
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-
-        if not results:
-            raise HTTPException(status_code=404, detail="No events found matching the filters.")
-        return results
-    
-    finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+    Cut the signal around each event matching the filters from every overlapping wearable and EEG record, and
+    return the epochs as one zip, so a training set does not require downloading whole recordings.
+
+    - **patient_code**, **session_date**, **session_id**, **event_types**: Same filters as GET /events
+    - **pre**: Seconds of signal before each event onset
+    - **post**: Seconds of signal after each event offset (or onset, for events without one)
+    - **limit**: Maximum number of events per page; the next page cursor is returned in the X-Next-Cursor header
+    - **cursor**: X-Next-Cursor value of the previous page
+
+    Wearable epochs are cut from indexed text files (see GET /records/{record_id}/window) and keep their format.
+    EEG epochs are cut from EDF/BDF files at data record boundaries, with the header start time and record count
+    rewritten (EDF+ annotation onsets stay relative to the original file). Other EEG formats are not included.
+    epochs.json lists every epoch with its event, record and exact start time, plus the overlapping records
+    that could not be cut and why.
+    """
+    if not any([patient_code, session_date, session_id, event_types]):
+        raise HTTPException(status_code=400, detail="Provide at least one filter.")
+
+    if session_id and session_date:
+        sessions = cached_fetchall(SESSION_TIMES_QUERY, [session_id])
+        check_session_times(sessions[0] if sessions else None, session_date)
+
+    limit = limit or EPOCH_MAX_EVENTS
+    query, params = build_events_query(patient_code, session_date, session_id, event_types, EPOCH_EVENT_FIELDS, limit, page_cursor)
+    events = cached_fetchall(query, params)
+    set_next_cursor(response, events, 'event_id', limit)
+
+    if not events:
+        raise HTTPException(status_code=404, detail="No events found matching the filters.")
+
+    epochs, skipped = plan_epochs(events, pre, post)
+    if not epochs:
+        raise HTTPException(status_code=404, detail="No indexed wearable or EDF/BDF recording overlaps the events.")
+
+    # Returning a response directly drops the headers set on `response`, so the cursor is copied over
+    headers = {"Content-Disposition": "attachment; filename=epochs.zip"}
+    if "X-Next-Cursor" in response.headers:
+        headers["X-Next-Cursor"] = response.headers["X-Next-Cursor"]
+    return StreamingResponse(iterate_on(run_download, epochs_zip_stream(epochs, skipped)), media_type="application/zip", headers=headers)
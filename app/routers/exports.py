@@ -0,0 +1,123 @@
+# built-in
+from datetime import datetime
+from typing import Optional
+
+# third-party
+from fastapi import APIRouter, Depends, HTTPException, Path, Response
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, Field
+
+# local
+from app.executors import on_db_threads, on_download_threads
+from app.exports import get_export_manager
+from app.metadata_cache import cached_fetchall
+from app.routers.checks import SESSION_TIMES_QUERY, check_session_times
+from app.routers.download import records_zip_stream
+from app.routers.enums import CompressionEnum, ModalityEnum, RecordFieldEnum, SENSITIVE_MODALITIES
+from app.routers.records import build_records_query
+from app.routers.token import get_current_user
+
+router = APIRouter(prefix='/exports', tags=['exports'])
+
+# Columns records_zip_stream needs from each records row
+EXPORT_FIELDS = [
+    RecordFieldEnum.smb_path, RecordFieldEnum.file_extension, RecordFieldEnum.modality,
+    RecordFieldEnum.content_hash, RecordFieldEnum.hashed_size, RecordFieldEnum.hashed_mtime_ns,
+]
+
+
+class ExportRequest(BaseModel):
+    record_ids: Optional[list[int]] = Field(None, description='Record IDs to include')
+    patient_code: Optional[str] = Field(None, description='4-letter code identifying the patient')
+    session_date: Optional[datetime] = Field(None, description='Session datetime which should be within the range of start_time and end_time of desired session')
+    session_id: Optional[int] = Field(None, description='Session ID')
+    modality: Optional[ModalityEnum] = Field(None, description='Type of data modality (e.g., hospital_eeg, wearable, hospital_video, report)')
+    compression: CompressionEnum = Field(CompressionEnum.auto, description='Zip compression: auto (stored for already-compressed formats, deflated otherwise), store or deflate')
+    dedupe: bool = Field(False, description='Store files with identical content once; the other paths are listed in duplicates.json')
+
+
+@router.post("/", status_code=202, summary="Create export", description="Start building a zip of records in the background, by ID or with the same filters as GET /records.")
+@on_db_threads
+def create_export(
+    request: ExportRequest,
+    response: Response,
+    user=Depends(get_current_user),
+):
+    """
+    Start building a zip of records in the background. Poll GET /exports/{job_id} for progress and fetch the
+    archive from GET /exports/{job_id}/download once its status is "done".
+
+    - **record_ids**: Record IDs to include
+    - **patient_code**, **session_date**, **session_id**, **modality**: Same filters as GET /records
+    - **compression**: Zip compression: auto (stored for already-compressed formats, deflated otherwise), store or deflate
+    - **dedupe**: Off by default; when on, files with identical content are stored once and the other paths are listed in duplicates.json
+    """
+    if not any([request.record_ids, request.patient_code, request.session_date, request.session_id, request.modality]):
+        raise HTTPException(status_code=400, detail="Provide record_ids or a filter.")
+
+    if request.session_id and request.session_date:
+        sessions = cached_fetchall(SESSION_TIMES_QUERY, [request.session_id])
+        check_session_times(sessions[0] if sessions else None, request.session_date)
+
+    query, params = build_records_query(
+        request.patient_code, request.session_date, request.session_id, request.modality, EXPORT_FIELDS,
+        record_ids=request.record_ids,
+    )
+    files = cached_fetchall(query, params)
+    if not files:
+        raise HTTPException(status_code=404, detail="No files found")
+
+    for f in files:
+        if f["modality"] in SENSITIVE_MODALITIES and not user['can_access_sensitive']:
+            raise HTTPException(status_code=403, detail="Access to sensitive data denied.")
+
+    job = get_export_manager().submit(
+        user['id'], len(files),
+        lambda on_file_done: records_zip_stream(files, request.compression, request.dedupe, on_file_done),
+    )
+    response.headers["Location"] = f"/exports/{job.id}"
+    return job.as_dict()
+
+
+@router.get("/{job_id}", summary="Get export status", description="Progress and status (queued, running, done, failed or cancelled) of an export job.")
+async def get_export(
+    job_id: str = Path(..., description="Export job ID"),
+    user=Depends(get_current_user),
+):
+    """
+    Progress and status of an export job.
+
+    - **job_id**: Export job ID
+    """
+    return get_export_manager().get(job_id, user['id']).as_dict()
+
+
+@router.get("/{job_id}/download", summary="Download export", description="Download the archive of a finished export job. Supports Range requests.")
+@on_download_threads
+def download_export(
+    job_id: str = Path(..., description="Export job ID"),
+    user=Depends(get_current_user),
+):
+    """
+    Download the archive of a finished export job. Range/If-Range requests are supported for resuming.
+
+    - **job_id**: Export job ID
+    """
+    job = get_export_manager().get(job_id, user['id'])
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Export job is {job.status}")
+    return FileResponse(job.path, media_type="application/zip", filename=f"export-{job.id}.zip")
+
+
+@router.delete("/{job_id}", status_code=204, summary="Delete export", description="Cancel an export job and delete its archive.")
+@on_download_threads
+def delete_export(
+    job_id: str = Path(..., description="Export job ID"),
+    user=Depends(get_current_user),
+):
+    """
+    Cancel an export job if it is still running, and delete its archive.
+
+    - **job_id**: Export job ID
+    """
+    get_export_manager().delete(job_id, user['id'])
@@ -0,0 +1,62 @@
+# built-in
+import secrets
+
+# third-party
+from fastapi import APIRouter, Header, HTTPException, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from typing import Optional
+
+# local
+from app.config import METRICS_TOKEN
+from app.database import get_pool_stats
+from app.file_cache import get_file_cache_stats
+from app.metadata_cache import get_metadata_cache_stats
+from app.routers.token import get_user_cache_stats
+
+router = APIRouter(tags=['metrics'])
+
+
+class StatsCollector:
+    """Exposes the counters the connection pool and caches already keep, read at scrape time."""
+
+    def collect(self):
+        pool = get_pool_stats()
+        yield GaugeMetricFamily("api_db_pool_size", "Connections in the pool", value=pool["size"])
+        yield GaugeMetricFamily("api_db_pool_in_use", "Pooled connections checked out", value=pool["in_use"])
+        for key, documentation in (
+            ("checkouts", "Connections checked out of the pool"),
+            ("waits", "Checkouts that had to wait for a free connection"),
+            ("exhausted", "Checkouts that timed out waiting (503)"),
+            ("errors", "Checkouts that failed to connect"),
+        ):
+            yield CounterMetricFamily(f"api_db_pool_{key}", documentation, value=pool[key])
+
+        size = GaugeMetricFamily("api_cache_size", "Entries held by an in-process cache (bytes for the file cache)", labels=["cache"])
+        hits = CounterMetricFamily("api_cache_hits", "Cache lookups answered from the cache", labels=["cache"])
+        misses = CounterMetricFamily("api_cache_misses", "Cache lookups that missed", labels=["cache"])
+        metadata = get_metadata_cache_stats()
+        caches = [("user", get_user_cache_stats(), "size"), ("metadata", metadata, "size"), ("file", get_file_cache_stats(), "size_bytes")]
+        for name, stats, size_key in caches:
+            if stats is None:  # file cache disabled
+                continue
+            size.add_metric([name], stats[size_key])
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+        yield from (size, hits, misses)
+
+        yield GaugeMetricFamily("api_metadata_generation", "Metadata generation the cached listings belong to", value=metadata["generation"])
+
+
+REGISTRY.register(StatsCollector())
+
+
+@router.get("/metrics", summary="Get metrics", description="Prometheus metrics of the API: request latency, DB, SMB, zip and cache statistics.")
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    """
+    Prometheus metrics in the text exposition format. When METRICS_TOKEN is set, scrapes must send it as a bearer
+    token (Authorization: Bearer <token>); user tokens are not accepted, so the scraper needs no API account.
+    """
+    if METRICS_TOKEN and not secrets.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
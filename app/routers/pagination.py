@@ -0,0 +1,37 @@
+# Keyset pagination and field projection shared by the metadata listings.
+# Pages are ordered by the table's primary key and the cursor is the last key of the previous page.
+
+
+def select_fields(fields, columns, default):
+    """
+    Build the SELECT list for the requested fields, mapping each name to its SQL expression.
+    The primary key (first entry of `columns`) is always selected, since it is the pagination cursor.
+    """
+    names = [field.value for field in fields] if fields else list(default)
+    key = next(iter(columns))
+    if key not in names:
+        names.insert(0, key)
+    return ", ".join(f"{columns[name]} AS {name}" for name in dict.fromkeys(names))
+
+
+def keyset_filter(key_column, cursor, params):
+    if cursor is None:
+        return ""
+    params.append(cursor)
+    return f" AND {key_column} > %s"
+
+
+def keyset_order(key_column, limit, params, lookahead=True):
+    # One extra row tells whether there is a next page; streamed responses skip it since headers are already sent
+    query = f" ORDER BY {key_column}"
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit + 1 if lookahead else limit)
+    return query
+
+
+def set_next_cursor(response, results, key, limit):
+    """Trim the extra row fetched by keyset_order and advertise the cursor of the next page in X-Next-Cursor."""
+    if limit and len(results) > limit:
+        del results[limit:]
+        response.headers["X-Next-Cursor"] = str(results[-1][key])
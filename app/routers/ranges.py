@@ -0,0 +1,73 @@
+# built-in
+from email.utils import formatdate, parsedate_to_datetime
+
+# third-party
+from fastapi import HTTPException
+
+
+def file_etag(file_stat):
+    return f'"{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}"'
+
+
+def current_content_hash(entry, file_stat):
+    """The record's stored content hash, if it was computed for the file as it is now (same size and mtime)."""
+    if entry.get('content_hash') and (entry.get('hashed_size'), entry.get('hashed_mtime_ns')) == (file_stat.st_size, file_stat.st_mtime_ns):
+        return entry['content_hash']
+    return None
+
+
+def record_etag(entry, file_stat):
+    """Strong ETag from the record's content hash while it is current, else from the file's mtime and size."""
+    content_hash = current_content_hash(entry, file_stat)
+    return f'"{content_hash}"' if content_hash else file_etag(file_stat)
+
+
+def if_none_match_matches(if_none_match, etag):
+    """Check an If-None-Match header, which uses the weak comparison (W/ prefixes ignored; * matches any file)."""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+def if_range_matches(if_range, etag, mtime):
+    """Check an If-Range validator (ETag or HTTP date) against the current file."""
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # If-Range requires a strong comparison, so weak tags never match
+        return if_range == etag
+    try:
+        return int(parsedate_to_datetime(if_range).timestamp()) == int(mtime)
+    except (TypeError, ValueError):
+        return False
+
+
+def parse_range(range_header, size):
+    """
+    Parse a single 'bytes=' range into an inclusive (start, end) pair.
+    Returns None for headers that should be ignored (malformed or multi-range), which means the full file is sent.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+        else:
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+
+    if start >= size:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
@@ -1,74 +1,323 @@
 # built-in
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 # third-party
-from fastapi import APIRouter, Query, HTTPException
+from fastapi import APIRouter, Depends, Header, Path, Query, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from typing import Optional
 
 # local
-from app.database import get_db_connection
-from app.routers.checks import check_session_date_id
-from app.routers.enums import ModalityEnum
+from app.columnar import current_columnar, preview_window, read_npy_window
+from app.config import MANIFEST_STAT_WORKERS, PREVIEW_MAX_POINTS
+from app.database import fetch_rows
+from app.executors import iterate_on, on_db_threads, on_download_threads, run_download
+from app.metadata_cache import cached_fetchall
+from app.routers.checks import SESSION_TIMES_QUERY, check_session_times
+from app.routers.enums import ModalityEnum, RecordFieldEnum, SENSITIVE_MODALITIES, WindowFormatEnum
+from app.routers.pagination import keyset_filter, keyset_order, select_fields, set_next_cursor
+from app.routers.ranges import current_content_hash
+from app.routers.streaming import stream_media_type, stream_query
+from app.routers.token import get_current_user, get_optional_user
+from app.signals import SAMPLE_INDEX_QUERY, read_window, window_samples
+from app.smb import get_smb_path, stat_smb_files
 
 router = APIRouter(prefix='/records', tags=['records'])
 
+RECORD_COLUMNS = {
+    'record_id': 'r.record_id',
+    'session_id': 'r.session_id',
+    'patient_code': 'p.patient_code',
+    'file_name': 'r.file_name',
+    'file_extension': 'r.file_extension',
+    'smb_path': 'r.smb_path',
+    'modality': 'r.modality',
+    'start_time': 'r.start_time',
+    'end_time': 'r.end_time',
+    'content_hash': 'r.content_hash',
+    'hashed_size': 'r.hashed_size',
+    'hashed_mtime_ns': 'r.hashed_mtime_ns',
+}
+# Fields that locate or fingerprint a file: null for sensitive records in listings requested without
+# can_access_sensitive, as in the manifest
+SENSITIVE_RECORD_FIELDS = ['smb_path', 'content_hash', 'hashed_size', 'hashed_mtime_ns']
+_SENSITIVE_MODALITY_LIST = ', '.join(f"'{modality}'" for modality in sorted(SENSITIVE_MODALITIES))
+RESTRICTED_RECORD_COLUMNS = {
+    **RECORD_COLUMNS,
+    **{
+        name: f"CASE WHEN r.modality IN ({_SENSITIVE_MODALITY_LIST}) THEN NULL ELSE {RECORD_COLUMNS[name]} END"
+        for name in SENSITIVE_RECORD_FIELDS
+    },
+}
+MANIFEST_FIELDS = [
+    RecordFieldEnum.session_id, RecordFieldEnum.smb_path, RecordFieldEnum.modality,
+    RecordFieldEnum.start_time, RecordFieldEnum.end_time, RecordFieldEnum.content_hash,
+    RecordFieldEnum.hashed_size, RecordFieldEnum.hashed_mtime_ns,
+]
+
+
+class ManifestRequest(BaseModel):
+    record_ids: Optional[list[int]] = Field(None, description='Record IDs to include')
+    patient_code: Optional[str] = Field(None, description='4-letter code identifying the patient')
+    session_date: Optional[datetime] = Field(None, description='Session datetime which should be within the range of start_time and end_time of desired session')
+    session_id: Optional[int] = Field(None, description='Session ID')
+    modality: Optional[ModalityEnum] = Field(None, description='Type of data modality (e.g., hospital_eeg, wearable, hospital_video, report)')
+    limit: Optional[int] = Field(None, ge=1, description='Maximum number of records per page; the next page cursor is returned in the X-Next-Cursor header')
+    cursor: Optional[int] = Field(None, description='X-Next-Cursor value of the previous page')
+
+
+def build_records_query(patient_code=None, session_date=None, session_id=None, modality=None, fields=None, limit=None, page_cursor=None, lookahead=True, record_ids=None, columns=RECORD_COLUMNS):
+    """Build the records listing query and its parameters for the given filters."""
+    query = f"""
+        SELECT {select_fields(fields, columns, ['record_id'])}
+        FROM records r
+        JOIN sessions s ON r.session_id=s.session_id
+        JOIN patients p ON s.patient_id=p.patient_id
+        WHERE 1=1
+    """
+    params = []
+
+    if patient_code:
+        query += " AND p.patient_code = %s"
+        params.append(patient_code)
+
+    if session_date:
+        query += " AND s.start_time <= %s AND s.end_time > %s"
+        params.extend([session_date, session_date])
+
+    if session_id:
+        query += " AND s.session_id = %s"
+        params.append(session_id)
+
+    if modality:
+        query += " AND r.modality = %s"
+        params.append(modality)
+
+    if record_ids:
+        query += f" AND r.record_id IN ({','.join(['%s'] * len(record_ids))})"
+        params.extend(record_ids)
+
+    query += keyset_filter("r.record_id", page_cursor, params)
+    query += keyset_order("r.record_id", limit, params, lookahead=lookahead)
+    return query, params
+
 
 @router.get("/", summary="Get records", description="Retrieve all records with optional filters, including by patient code, session, or modality.")
+@on_db_threads
 def get_records(
+    response: Response,
     patient_code: Optional[str] = Query(None, description='4-letter code identifying the patient'),
     session_date: Optional[datetime] = Query(None, description='Session datetime (in the format YYYY-MM-DD HH:MM:SS) which should be within the range of start_time and end_time of desired session'),
     session_id: Optional[int] = Query(None, description='Session ID'),
-    modality: Optional[ModalityEnum] = Query(None, description='Type of data modality (e.g., hospital_eeg, wearable, hospital_video, report)')
+    modality: Optional[ModalityEnum] = Query(None, description='Type of data modality (e.g., hospital_eeg, wearable, hospital_video, report)'),
+    fields: Optional[list[RecordFieldEnum]] = Query(None, description='Fields to return for each record (default: record_id)'),
+    limit: Optional[int] = Query(None, ge=1, description='Maximum number of records per page; the next page cursor is returned in the X-Next-Cursor header'),
+    page_cursor: Optional[int] = Query(None, alias='cursor', description='X-Next-Cursor value of the previous page'),
+    accept: Optional[str] = Header(None, description='application/x-ndjson or text/csv to stream rows as they are read instead of returning one JSON array'),
+    user=Depends(get_optional_user),
 ):
     """
     Retrieve all records with optional filters, including by patient code, session, or modality.
+    smb_path, content_hash, hashed_size and hashed_mtime_ns are null for hospital_video and report records unless
+    the request is authenticated as a user with access to sensitive data.
 
     - **patient_code**: 4-letter code identifying the patient
     - **session_date**: Session datetime (in the format YYYY-MM-DD HH:MM:SS) which should be within the range of start_time and end_time of desired session
     - **session_id**: Session ID
     - **modality**: Type of data modality (e.g., hospital_eeg, wearable, hospital_video, report)
+    - **fields**: Fields to return for each record (default: record_id)
+    - **limit**: Maximum number of records per page; the next page cursor is returned in the X-Next-Cursor header
+    - **cursor**: X-Next-Cursor value of the previous page
+    - **accept**: application/x-ndjson or text/csv to stream rows as they are read instead of returning one JSON array
+    """
+    # Consistency check if both session_id and session_date are provided
+    if session_id and session_date:
+        sessions = cached_fetchall(SESSION_TIMES_QUERY, [session_id])
+        check_session_times(sessions[0] if sessions else None, session_date)
+
+    media_type = stream_media_type(accept)
+    columns = RECORD_COLUMNS if user and user['can_access_sensitive'] else RESTRICTED_RECORD_COLUMNS
+    query, params = build_records_query(patient_code, session_date, session_id, modality, fields, limit, page_cursor, lookahead=media_type is None, columns=columns)
+
+    # Streams bypass the metadata cache, since they exist for result sets too large to hold in memory
+    if media_type:
+        return stream_query(query, params, media_type, "No records found matching the filters.")
+
+    results = cached_fetchall(query, params)
+    set_next_cursor(response, results, 'record_id', limit)
+
+    if not results:
+        raise HTTPException(status_code=404, detail="No records found matching the filters.")
+    return results
+
+
+@router.post("/manifest", summary="Get records manifest", description="Resolve records, by ID or with the same filters as GET /records, to their paths, sizes, modification times and content hashes in one call.")
+@on_download_threads
+def get_records_manifest(
+    request: ManifestRequest,
+    response: Response,
+    user=Depends(get_current_user),
+):
+    """
+    Resolve many records to what is needed to plan a transfer, without one /download call per file.
+    Files are stat'ed on the SMB share in parallel; records of sensitive modalities the user may not access
+    are listed with status "forbidden" and without their path.
+
+    - **record_ids**: Record IDs to include
+    - **patient_code**, **session_date**, **session_id**, **modality**: Same filters as GET /records
+    - **limit**: Maximum number of records per page; the next page cursor is returned in the X-Next-Cursor header
+    - **cursor**: X-Next-Cursor value of the previous page
+
+    Each entry holds record_id, session_id, smb_path, modality, start_time, end_time, size (bytes), mtime,
+    content_hash (SHA-256, null until the current version of the file has been hashed) and status ("ok", "forbidden" or "missing").
+    """
+    filters = [request.record_ids, request.patient_code, request.session_date, request.session_id, request.modality]
+    if not any(filters) and not request.limit:
+        raise HTTPException(status_code=400, detail="Provide record_ids, a filter or a limit.")
+
+    if request.session_id and request.session_date:
+        sessions = cached_fetchall(SESSION_TIMES_QUERY, [request.session_id])
+        check_session_times(sessions[0] if sessions else None, request.session_date)
+
+    query, params = build_records_query(
+        request.patient_code, request.session_date, request.session_id, request.modality, MANIFEST_FIELDS,
+        request.limit, request.cursor, record_ids=request.record_ids,
+    )
+    results = cached_fetchall(query, params)
+    set_next_cursor(response, results, 'record_id', limit=request.limit)
+
+    if not results:
+        raise HTTPException(status_code=404, detail="No records found matching the filters.")
+
+    allowed = [row for row in results if row['modality'] not in SENSITIVE_MODALITIES or user['can_access_sensitive']]
+    file_stats = stat_smb_files([get_smb_path(row['smb_path']) for row in allowed], workers=MANIFEST_STAT_WORKERS)
+    stats = {row['record_id']: file_stat for row, file_stat in zip(allowed, file_stats)}
+
+    manifest = []
+    for row in results:
+        entry = {key: value for key, value in row.items() if key not in ('hashed_size', 'hashed_mtime_ns')}
+        entry.update(size=None, mtime=None)
+        if row['record_id'] not in stats:
+            entry.update(smb_path=None, content_hash=None, status='forbidden')
+        elif stats[row['record_id']] is None:
+            entry['status'] = 'missing'
+        else:
+            file_stat = stats[row['record_id']]
+            entry.update(
+                size=file_stat.st_size,
+                mtime=datetime.fromtimestamp(file_stat.st_mtime, timezone.utc),
+                content_hash=current_content_hash(row, file_stat),
+                status='ok',
+            )
+        manifest.append(entry)
+    return manifest
+
+
+@router.get("/{record_id}/window", summary="Get record time window", description="Retrieve the samples of a wearable record within a time window, without downloading the whole file.")
+@on_download_threads
+def get_record_window(
+    record_id: int = Path(..., description="Record ID"),
+    start: datetime = Query(..., description='Start of the window (in the format YYYY-MM-DD HH:MM:SS[.ffffff])'),
+    end: datetime = Query(..., description='End of the window, exclusive (in the format YYYY-MM-DD HH:MM:SS[.ffffff])'),
+    format: WindowFormatEnum = Query(WindowFormatEnum.text, description='text (lines of the original file) or npy (slice of the converted recording)'),
+    user=Depends(get_current_user),
+):
     """
+    Retrieve the samples of a wearable record within [start, end). As text, the header lines of the file are followed
+    by the sample lines, in the file's own format, read by seeking through the record's sample index (built by the
+    crawler). As npy, the window is sliced from the converted recording: a column-major samples x channels array,
+    with the channel names and header metadata in its JSON sidecar. Either way, the cost depends on the length of
+    the window rather than of the recording.
+
+    - **record_id**: Record ID
+    - **start**: Start of the window (in the format YYYY-MM-DD HH:MM:SS[.ffffff])
+    - **end**: End of the window, exclusive
+    - **format**: text (lines of the original file) or npy (slice of the converted recording)
+
+    The X-First-Sample, X-Sample-Count and X-Sampling-Rate headers locate the returned samples in the recording.
+    """
+    rows = fetch_rows(SAMPLE_INDEX_QUERY, (record_id,))
+    entry = rows[0] if rows else None
+
+    if not entry:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if entry["modality"] in SENSITIVE_MODALITIES and not user['can_access_sensitive']:
+        raise HTTPException(status_code=403, detail="Access to sensitive data denied.")
+
+    # Windows are located relative to the record's start time
+    if entry['start_time'] is None:
+        raise HTTPException(status_code=404, detail="Record has no start time.")
+
+    if format == WindowFormatEnum.npy:
+        # Column-major, so each channel's window is a single contiguous read of the .npy on local disk
+        meta = current_columnar(entry['smb_path'])
+        entry.update(sampling_rate=meta['sampling_rate'], sample_count=meta['sample_count'])
+        first, last = window_samples(entry, start, end)
+        chunks, media_type, extension = read_npy_window(meta['paths']['npy'], first, last), "application/octet-stream", "npy"
+    else:
+        if entry["sampling_rate"] is None:
+            raise HTTPException(status_code=404, detail="Record has no sample index; only wearable data files are indexed.")
+        first, last = window_samples(entry, start, end)
+        chunks, media_type, extension = read_window(entry, first, last), "text/plain", "txt"
+
+    return StreamingResponse(
+        iterate_on(run_download, chunks),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={entry['file_name']}_{first}-{last}.{extension}",
+            "X-First-Sample": str(first),
+            "X-Sample-Count": str(last - first),
+            "X-Sampling-Rate": str(entry["sampling_rate"]),
+        },
+    )
+
+
+@router.get("/{record_id}/preview", summary="Get record preview", description="Retrieve a min/max envelope of each channel of a wearable record, for plotting any time range at a bounded number of points.")
+@on_download_threads
+def get_record_preview(
+    record_id: int = Path(..., description="Record ID"),
+    start: Optional[datetime] = Query(None, description='Start of the range (in the format YYYY-MM-DD HH:MM:SS[.ffffff]); default: start of the record'),
+    end: Optional[datetime] = Query(None, description='End of the range, exclusive; default: end of the record'),
+    points: int = Query(1000, ge=16, le=PREVIEW_MAX_POINTS, description='Maximum number of points per channel'),
+    user=Depends(get_current_user),
+):
+    """
+    Retrieve the minimum and maximum of each channel of a wearable record over [start, end) in at most `points`
+    bins, read from the precomputed min/max pyramid of its converted form (built by scripts/build_previews.py), so
+    the cost depends on `points` rather than on the length of the range. Ranges of at most `points` samples are
+    returned sample by sample, with equal min and max.
+
+    - **record_id**: Record ID
+    - **start**: Start of the range (in the format YYYY-MM-DD HH:MM:SS[.ffffff]); default: start of the record
+    - **end**: End of the range, exclusive; default: end of the record
+    - **points**: Maximum number of points per channel
+
+    Returns the record_id, sampling_rate, bin_size (samples per bin), bin_seconds, start_time (of the first bin,
+    which may start before the range as bins are aligned on multiples of bin_size) and, per channel, the min and max lists.
+    """
+    rows = fetch_rows(SAMPLE_INDEX_QUERY, (record_id,))
+    entry = rows[0] if rows else None
+
+    if not entry:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if entry["modality"] in SENSITIVE_MODALITIES and not user['can_access_sensitive']:
+        raise HTTPException(status_code=403, detail="Access to sensitive data denied.")
+
+    meta = current_columnar(entry['smb_path'])
+    entry.update(sampling_rate=meta['sampling_rate'], sample_count=meta['sample_count'])
+    if entry['start_time'] is None:
+        raise HTTPException(status_code=404, detail="Record has no start time.")
+    duration = timedelta(seconds=meta['sample_count'] / meta['sampling_rate'])
+    first, last = window_samples(entry, start or entry['start_time'], end or entry['start_time'] + duration)
 
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    try:
-        # Consistency check if both session_id and session_date are provided
-        if session_id and session_date:
-            check_session_date_id(cursor, session_id, session_date)
-
-        query = """
-            SELECT r.record_id
-            FROM records r
-            JOIN sessions s ON r.session_id=s.session_id
-            JOIN patients p ON s.patient_id=p.patient_id
-            WHERE 1=1
-        """
-        params = []
-
-        if patient_code:
-            query += " AND p.patient_code = %s"
-            params.append(patient_code)
-
-        if session_date:
-            query += " AND s.start_time <= %s AND s.end_time > %s"
-            params.extend([session_date, session_date])
-
-        if session_id:
-            query += " AND s.session_id = %s"
-            params.append(session_id)
-
-        if modality:
-            query += " AND r.modality = %s"
-            params.append(modality)
-
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-
-        if not results:
-            raise HTTPException(status_code=404, detail="No records found matching the filters.")
-        return results
-    
-    finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+    bin_size, first_sample, channels = preview_window(entry['smb_path'], meta, first, last, points)
+    return {
+        "record_id": record_id,
+        "sampling_rate": meta['sampling_rate'],
+        "bin_size": bin_size,
+        "bin_seconds": bin_size / meta['sampling_rate'],
+        "start_time": entry['start_time'] + timedelta(seconds=first_sample / meta['sampling_rate']),
+        "channels": channels,
+    }
@@ -1,18 +1,69 @@
 # third-party
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Header, HTTPException, Query, Response
 from typing import Optional
 
 # local
-from app.database import get_db_connection
-from app.routers.enums import ModalityEnum, SeizureClassEnum
+from app.executors import on_db_threads
+from app.metadata_cache import cached_fetchall
+from app.routers.enums import ModalityEnum, SeizureClassEnum, SessionFieldEnum, classification_mask
+from app.routers.pagination import keyset_filter, keyset_order, select_fields, set_next_cursor
+from app.routers.streaming import stream_media_type, stream_query
 
 router = APIRouter(prefix='/sessions', tags=['sessions'])
 
+SESSION_COLUMNS = {
+    'session_id': 's.session_id',
+    'patient_code': 'p.patient_code',
+    'hospital_code': 's.hospital_code',
+    'start_time': 's.start_time',
+    'end_time': 's.end_time',
+}
+SESSION_DEFAULT_FIELDS = ['session_id', 'hospital_code', 'start_time', 'end_time']
+
+
+def build_sessions_query(patient_code=None, event_types=None, modality=None, fields=None, limit=None, page_cursor=None, lookahead=True):
+    """Build the sessions listing query and its parameters for the given filters."""
+    query = f"""
+        SELECT DISTINCT {select_fields(fields, SESSION_COLUMNS, SESSION_DEFAULT_FIELDS)}
+        FROM sessions s
+        JOIN patients p ON s.patient_id = p.patient_id
+        JOIN events e ON s.session_id = e.session_id
+        JOIN records r ON s.session_id = r.session_id
+        WHERE 1=1
+    """
+
+    params = []
+
+    if patient_code:
+        query += " AND p.patient_code = %s"
+        params.append(patient_code)
+
+    # Seizure types: require ALL specified types
+    if event_types:
+        wanted = classification_mask(event_types)
+        query += " AND (e.classification_mask & %s) = %s"
+        params.extend([wanted, wanted])
+
+    if modality:
+        query += " AND r.modality = %s"
+        params.append(modality)
+
+    query += keyset_filter("s.session_id", page_cursor, params)
+    query += keyset_order("s.session_id", limit, params, lookahead=lookahead)
+    return query, params
+
+
 @router.get("/", summary="Get sessions", description="Retrieve all sessions with optional filters, including by patient code, event types, or modality.")
+@on_db_threads
 def get_sessions(
+    response: Response,
     patient_code: Optional[str] = Query(None, description='4-letter code identifying the patient'),
     event_types: Optional[list[SeizureClassEnum]] = Query(None, description='List of seizure classifications (see class SeizureClassEnum for options)'),
-    modality: Optional[ModalityEnum] = Query(None, description='Type of data modality (e.g., hospital_eeg, wearable, hospital_video, report)')
+    modality: Optional[ModalityEnum] = Query(None, description='Type of data modality (e.g., hospital_eeg, wearable, hospital_video, report)'),
+    fields: Optional[list[SessionFieldEnum]] = Query(None, description='Fields to return for each session (default: session_id, hospital_code, start_time, end_time)'),
+    limit: Optional[int] = Query(None, ge=1, description='Maximum number of sessions per page; the next page cursor is returned in the X-Next-Cursor header'),
+    page_cursor: Optional[int] = Query(None, alias='cursor', description='X-Next-Cursor value of the previous page'),
+    accept: Optional[str] = Header(None, description='application/x-ndjson or text/csv to stream rows as they are read instead of returning one JSON array'),
 ):
     """
     Retrieve all sessions for a patient.
@@ -20,53 +71,21 @@ def get_sessions(
     - **patient_code**: 4-letter code identifying the patient
     - **event_types**: List of seizure classifications (see class SeizureClassEnum for options)
     - **modality**: Type of data modality (e.g., hospital_eeg, wearable, hospital_video, report)
+    - **fields**: Fields to return for each session (default: session_id, hospital_code, start_time, end_time)
+    - **limit**: Maximum number of sessions per page; the next page cursor is returned in the X-Next-Cursor header
+    - **cursor**: X-Next-Cursor value of the previous page
+    - **accept**: application/x-ndjson or text/csv to stream rows as they are read instead of returning one JSON array
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    try:
-        query = """
-            SELECT DISTINCT s.session_id,s.hospital_code,s.start_time,s.end_time
-            FROM sessions s
-            JOIN patients p ON s.patient_id = p.patient_id
-            JOIN events e ON s.session_id = e.session_id
-            JOIN records r ON s.session_id = r.session_id
-            WHERE 1=1
-        """
-
-        params = []
-
-        if patient_code:
-            query += " AND p.patient_code = %s"
-            params.append(patient_code)
-
-        # Seizure types: require ALL specified types
-        if event_types:
-            placeholders = ', '.join(['%s'] * len(event_types))
-            subquery = f"""
-                SELECT ec_inner.event_id
-                FROM event_classifications ec_inner
-                JOIN classifications cl_inner ON ec_inner.classification_id = cl_inner.classification_id
-                WHERE cl_inner.name IN ({placeholders})
-                GROUP BY ec_inner.event_id
-                HAVING COUNT(DISTINCT cl_inner.name) = %s
-            """
-            query += f" AND e.event_id IN ({subquery})"
-            params.extend(event_types)
-            params.append(len(event_types))
-
-        if modality:
-            query += " AND r.modality = %s"
-            params.append(modality)
-
-
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-
-        if not results:
-            raise HTTPException(status_code=404, detail="No sessions found matching the filters.")
-
-        return results
-    finally:
-        cursor.close()
-        conn.close()
+    media_type = stream_media_type(accept)
+    query, params = build_sessions_query(patient_code, event_types, modality, fields, limit, page_cursor, lookahead=media_type is None)
+
+    # Streams bypass the metadata cache, since they exist for result sets too large to hold in memory
+    if media_type:
+        return stream_query(query, params, media_type, "No sessions found matching the filters.")
+
+    results = cached_fetchall(query, params)
+    set_next_cursor(response, results, 'session_id', limit)
+
+    if not results:
+        raise HTTPException(status_code=404, detail="No sessions found matching the filters.")
+    return results
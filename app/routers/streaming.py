@@ -0,0 +1,88 @@
+# built-in
+import csv
+import io
+import json
+
+# third-party
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+# local
+from app.config import STREAM_BATCH_SIZE
+from app.database import get_db_connection, release_db_connection
+from app.executors import iterate_on, run_db
+
+NDJSON = "application/x-ndjson"
+CSV = "text/csv"
+
+
+def stream_media_type(accept):
+    """Pick the streaming format requested in the Accept header, or None for a regular JSON response."""
+    if accept:
+        for media_type in (NDJSON, CSV):
+            if media_type in accept:
+                return media_type
+    return None
+
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def _encode_ndjson(batch, write_header):
+    return "".join(json.dumps(row, default=_json_default) + "\n" for row in batch)
+
+
+def _encode_csv(batch, write_header):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(batch[0].keys()))
+    if write_header:
+        writer.writeheader()
+    writer.writerows(batch)
+    return buffer.getvalue()
+
+
+def stream_query(query, params, media_type, not_found, batch_size=STREAM_BATCH_SIZE):
+    """
+    Run `query` on its own pooled connection with an unbuffered cursor and stream the rows as NDJSON or CSV
+    while they arrive, so memory stays flat regardless of result size.
+    The connection is not the request's one, since the stream outlives the route function.
+    Like the JSON responses, an empty result is a 404 with detail `not_found`, raised before the stream starts.
+    """
+    encode = _encode_ndjson if media_type == NDJSON else _encode_csv
+
+    def rows():
+        conn = get_db_connection()
+        finished = False
+        try:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute(query, params)
+                write_header = True
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    yield encode(batch, write_header)
+                    write_header = False
+                finished = True
+            finally:
+                if finished:
+                    cursor.close()
+        finally:
+            release_db_connection(conn, discard=not finished)
+
+    chunks = rows()
+    # The first batch is read here, on the route's db thread, while a 404 can still be sent instead of the stream
+    first = next(chunks, None)
+    if first is None:
+        raise HTTPException(status_code=404, detail=not_found)
+
+    def body():
+        try:
+            yield first
+            yield from chunks
+        finally:
+            chunks.close()
+
+    return StreamingResponse(iterate_on(run_db, body()), media_type=media_type)
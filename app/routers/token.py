@@ -6,25 +6,47 @@ from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from typing import Optional
 
 # local
-from app.database import get_db_connection
-from app.config import SECRET_KEY, ALGORITHM
+from app.cache import MISSING, TTLCache
+from app.database import get_db, get_db_connection, release_db_connection
+from app.executors import on_db_threads, run_db
+from app.config import SECRET_KEY, ALGORITHM, USER_CACHE_TTL, USER_CACHE_SIZE
 
 
 router = APIRouter(prefix='/token', tags=['token'])
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Authenticate user (e.g., via /token)
-def authenticate_user(username: str, password: str):
+# Verified user principals, so protected requests skip the users lookup while the entry is fresh. Users are changed
+# outside the API (scripts/create_user.py), so changes take effect once the entry expires, within USER_CACHE_TTL
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+def get_user_cache_stats():
+    return _user_cache.stats()
+
+
+def _load_user(user_id):
     conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT id, username, can_access_sensitive, is_active FROM users WHERE id=%s", (user_id,))
+        user = cursor.fetchone()
+        cursor.close()
+    finally:
+        release_db_connection(conn)
+    return user
+
+# Authenticate user (e.g., via /token)
+def authenticate_user(conn, username: str, password: str):
     cursor = conn.cursor(dictionary=True)
     cursor.execute("SELECT * FROM users WHERE username=%s", (username,))
     user = cursor.fetchone()
     cursor.close()
-    conn.close()
     if user and pwd_context.verify(password, user["hashed_password"]):
         return user
     return None
@@ -41,26 +63,33 @@ def create_access_token(data: dict, expires_delta=None):
 
 
 # Dependency to get current user
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(status_code=401, detail="Could not validate credentials")
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("user_id")
     except JWTError:
         raise credentials_exception
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM users WHERE id=%s", (user_id,))
-    user = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    user = _user_cache.get(user_id)
+    if user is MISSING:
+        user = await run_db(_load_user, user_id)
+        if user is not None:
+            _user_cache.set(user_id, user)
     if user is None:
         raise credentials_exception
     return user
 
+
+async def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme)):
+    """The current user when the request sends a bearer token (401 if it is invalid), or None, for public endpoints."""
+    if token is None:
+        return None
+    return await get_current_user(token)
+
 @router.post("/")
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+@on_db_threads
+def login(form_data: OAuth2PasswordRequestForm = Depends(), conn=Depends(get_db, scope="function")):
+    user = authenticate_user(conn, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     token = create_access_token(data={"sub": user["username"], "user_id": user["id"]})
@@ -0,0 +1,230 @@
+# built-in
+import math
+import struct
+from datetime import datetime, timedelta
+
+# third-party
+from fastapi import HTTPException
+import smbclient
+
+# local
+from app.config import DOWNLOAD_CHUNK_SIZE
+from app.database import get_db_connection, release_db_connection
+from app.file_cache import get_file_cache, iter_local_file
+from app.smb import get_smb_path, iter_smb_file, open_smb_file, read_smb_chunk
+
+SAMPLE_INDEX_QUERY = """
+    SELECT r.record_id, r.file_name, r.smb_path, r.modality, r.start_time,
+        i.sampling_rate, i.sample_count, i.index_step, i.indexed_size
+    FROM records r
+    LEFT JOIN record_sample_index i ON i.record_id = r.record_id
+    WHERE r.record_id = %s
+"""
+# Offsets are packed 8 bytes each, so only the three needed per window are transferred: the first sample (i.e. the
+# end of the header) and the index entries before and after the window. Windows are looked up in batches of
+# OFFSETS_BATCH_SIZE, one UNION ALL of this SELECT per window.
+_OFFSETS_SELECT = """
+    SELECT %s, SUBSTRING(offsets, 1, 8), SUBSTRING(offsets, %s, 8), SUBSTRING(offsets, %s, 8)
+    FROM record_sample_index WHERE record_id = %s
+"""
+OFFSETS_BATCH_SIZE = 200
+
+
+# === Indexed text recordings (wearable) ===
+
+def sample_range(entry, start, end):
+    """Numbers [first, last) of the record's samples taken within [start, end), clamped to the recording; may be empty."""
+    fs = entry['sampling_rate']
+    # Rounded first, so float error cannot push a sample that falls exactly on a bound to the next one
+    first = math.ceil(round((start - entry['start_time']).total_seconds() * fs, 6))
+    last = math.ceil(round((end - entry['start_time']).total_seconds() * fs, 6))
+    return max(first, 0), min(last, entry['sample_count'])
+
+
+def window_samples(entry, start, end):
+    """sample_range() of a requested window, with 400/404 for invalid windows and windows without samples."""
+    if start.tzinfo is not None or end.tzinfo is not None:
+        raise HTTPException(status_code=400, detail="Window times must be local times without a UTC offset, like record times.")
+    if start >= end:
+        raise HTTPException(status_code=400, detail="The window start must be before its end.")
+
+    first, last = sample_range(entry, start, end)
+    if first >= last:
+        raise HTTPException(status_code=404, detail="The record has no samples in the requested window.")
+    return first, last
+
+
+def is_index_current(entry, file_stat):
+    """Whether the record's sample index still describes the file; offsets into a rewritten file point at other samples."""
+    return file_stat.st_size == entry['indexed_size']
+
+
+def _unpack_offset(value):
+    return struct.unpack('<q', bytes(value))[0] if value else None
+
+
+def fetch_offsets(windows):
+    """
+    Byte offsets (header end, start, end) to read for each (entry, first, last) window of an indexed record:
+    samples first to last - 1 lie within [start, end). None for windows whose record has no index. The lookups
+    run on a connection checked out for just them, so callers hold none while they go on to read the share.
+    """
+    if not windows:
+        return []
+    offsets = []
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        for i in range(0, len(windows), OFFSETS_BATCH_SIZE):
+            batch = windows[i:i + OFFSETS_BATCH_SIZE]
+            params = []
+            for position, (entry, first, last) in enumerate(batch):
+                step = entry['index_step']
+                params.extend([position, 8 * (first // step) + 1, 8 * -(-last // step) + 1, entry['record_id']])
+            cursor.execute(" UNION ALL ".join([_OFFSETS_SELECT] * len(batch)), params)
+            rows = {position: values for position, *values in cursor.fetchall()}
+
+            for position, (entry, _, _) in enumerate(batch):
+                if position not in rows:
+                    offsets.append(None)
+                    continue
+                header_end, start, end = (_unpack_offset(value) for value in rows[position])
+                # Empty past the last index entry: the window runs to the end of the file
+                offsets.append((header_end, start, end if end is not None else entry['indexed_size']))
+        cursor.close()
+    finally:
+        release_db_connection(conn)
+    return offsets
+
+
+def slice_lines(chunks, skip, count):
+    """
+    Pass through `count` lines of a stream of chunks, after skipping its first `skip` lines. The rest of the stream
+    is still consumed, so a reader prefetching it (see SmbPrefetcher) is never left blocked on a full buffer.
+    """
+    try:
+        for chunk in chunks:
+            if not count:
+                continue
+            start = 0
+            while skip:
+                newline = chunk.find(b'\n', start)
+                if newline < 0:
+                    break
+                start = newline + 1
+                skip -= 1
+            if skip:
+                continue
+
+            lines = chunk.count(b'\n', start)
+            if lines < count:
+                count -= lines
+                yield chunk[start:] if start else chunk
+                continue
+            end = start
+            for _ in range(count):
+                end = chunk.index(b'\n', end) + 1
+            yield chunk[start:end]
+            count = 0
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def _window_stream(header, lines):
+    yield header
+    yield from lines
+
+
+def read_window(entry, first, last):
+    """
+    Return a generator of the header of the record's file followed by its samples first to last - 1, as text lines.
+
+    Only the index blocks holding the window are read, seeking to the byte offset of the closest index entry before
+    it, from the local file cache when it has the file and over SMB otherwise. 409 if the file changed since it was
+    indexed, as the offsets no longer point at the same samples.
+    """
+    smb_path = get_smb_path(entry['smb_path'])
+    try:
+        file_stat = smbclient.stat(smb_path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="File not found on SMB share")
+    if not is_index_current(entry, file_stat):
+        raise HTTPException(status_code=409, detail="The file changed since it was indexed; its index is rebuilt by the next crawl.")
+
+    offsets = fetch_offsets([(entry, first, last)])[0]
+    if offsets is None:
+        raise HTTPException(status_code=404, detail="Record has no sample index; only wearable data files are indexed.")
+    header_end, start, end = offsets
+
+    file_cache = get_file_cache()
+    local_file = file_cache.open(entry['smb_path'], file_stat) if file_cache else None
+    if local_file is not None:
+        header = local_file.read(header_end)
+        local_file.seek(start)
+        chunks = iter_local_file(local_file, DOWNLOAD_CHUNK_SIZE, end - start)
+        file_cache.count_saved(header_end + end - start)
+    else:
+        header = b''.join(iter_smb_file(smb_path, length=header_end))
+        chunks = iter_smb_file(smb_path, start=start, length=end - start)
+
+    return _window_stream(header, slice_lines(chunks, first % entry['index_step'], last - first))
+
+
+# === EDF/BDF recordings (hospital EEG) ===
+
+EDF_BYTES_PER_SAMPLE = {'.edf': 2, '.bdf': 3}
+
+
+def read_edf_header(smb_path):
+    """The full header of an EDF/BDF file on the share: the fixed 256 bytes plus 256 bytes per signal."""
+    with open_smb_file(smb_path) as f:
+        header = read_smb_chunk(f, 256)
+        return header + read_smb_chunk(f, int(header[184:192]) - 256)
+
+
+def edf_layout(header, file_size, extension):
+    """Start time and data record layout of an EDF/BDF file, from its full header."""
+    text = header[:256].decode('ascii', errors='replace')
+    day, month, year = (int(part) for part in text[168:176].split('.'))
+    hour, minute, second = (int(part) for part in text[176:184].split('.'))
+    header_size, n_signals = int(text[184:192]), int(text[252:256])
+
+    # Samples per data record of each signal, after the 216 bytes of the other signal header fields
+    samples_at = 256 + n_signals * 216
+    samples = sum(int(header[samples_at + 8 * i:samples_at + 8 * (i + 1)]) for i in range(n_signals))
+    record_size = samples * EDF_BYTES_PER_SAMPLE[extension.lower()]
+
+    record_count = int(text[236:244])
+    if record_count < 0:  # -1 while the recording was still being written
+        record_count = (file_size - header_size) // record_size
+    return {
+        # EDF two-digit years: 85-99 are 1985-1999, 00-84 are 2000-2084
+        'start_time': datetime(1900 + year if year >= 85 else 2000 + year, month, day, hour, minute, second),
+        'header_size': header_size,
+        'record_count': record_count,
+        'record_duration': float(text[244:252]),
+        'record_size': record_size,
+        # EDF+D data records are not contiguous in time, so they cannot be located from the start time alone
+        'continuous': text[192:197] != 'EDF+D',
+    }
+
+
+def edf_slice(header, layout, start, end):
+    """
+    The data records of an EDF/BDF file overlapping [start, end) as (header, byte offset, length, start time),
+    where the header is patched with the start time and number of records of the slice; None if there are none.
+    EDF times have a resolution of one second, the exact start time of the slice is returned separately.
+    """
+    duration = layout['record_duration']
+    first = max(0, math.floor((start - layout['start_time']).total_seconds() / duration))
+    last = min(layout['record_count'], math.ceil((end - layout['start_time']).total_seconds() / duration))
+    if first >= last:
+        return None
+
+    slice_start = layout['start_time'] + timedelta(seconds=first * duration)
+    patched = bytearray(header)
+    patched[168:184] = slice_start.strftime('%d.%m.%y%H.%M.%S').encode()
+    patched[236:244] = str(last - first).ljust(8).encode()
+    return bytes(patched), layout['header_size'] + first * layout['record_size'], (last - first) * layout['record_size'], slice_start
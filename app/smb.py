@@ -0,0 +1,146 @@
+# built-in
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# third-party
+import smbclient
+
+# local
+from app.config import SMB_SHARE, DOWNLOAD_CHUNK_SIZE, ZIP_PREFETCH_WORKERS, ZIP_PREFETCH_CHUNK_SIZE, ZIP_PREFETCH_BUFFER_CHUNKS
+from app.metrics import SMB_OPEN_SECONDS, SMB_READ_BYTES, SMB_READ_SECONDS
+
+
+def get_smb_path(relative_path):
+    return rf"{SMB_SHARE}\{relative_path}"
+
+
+def open_smb_file(path):
+    """Open an SMB file for reading, recording the time it took in SMB_OPEN_SECONDS."""
+    started = time.perf_counter()
+    remote_file = smbclient.open_file(path, mode='rb')
+    SMB_OPEN_SECONDS.observe(time.perf_counter() - started)
+    return remote_file
+
+
+def read_smb_chunk(remote_file, size):
+    """Read up to size bytes from an open SMB file, recording the time and bytes read."""
+    started = time.perf_counter()
+    chunk = remote_file.read(size)
+    SMB_READ_SECONDS.observe(time.perf_counter() - started)
+    SMB_READ_BYTES.inc(len(chunk))
+    return chunk
+
+
+def stat_smb_files(paths, workers=ZIP_PREFETCH_WORKERS):
+    """Stat several SMB files in parallel. Returns the stat results in the order of `paths`, None for missing files."""
+    def _stat(path):
+        try:
+            return smbclient.stat(path)
+        except OSError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="smb-stat") as executor:
+        return list(executor.map(_stat, paths))
+
+
+def iter_smb_file(path, chunk_size=DOWNLOAD_CHUNK_SIZE, start=0, length=None):
+    """
+    Yield the contents of an SMB file in chunks, so only one chunk is held in memory at a time.
+    When start/length are given, only that byte range is read, seeking on the remote handle first.
+    """
+    with open_smb_file(path) as remote_file:
+        if start:
+            remote_file.seek(start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = read_smb_chunk(remote_file, chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+_EOF = object()
+
+
+class _ReadError:
+    def __init__(self, error):
+        self.error = error
+
+
+class SmbPrefetcher:
+    """
+    Read a list of SMB files ahead of the consumer on a bounded thread pool.
+
+    Files are handed out in the order given through iter_file(index) and must be consumed in that order.
+    At most `workers` files are read at once and each buffers at most `buffer_chunks` chunks, so memory
+    is bounded by workers * buffer_chunks * chunk_size regardless of file sizes. `ranges`, if given, holds
+    a (start, length) byte range to read instead of the whole file, or None, for each path.
+    """
+
+    def __init__(self, paths, workers=ZIP_PREFETCH_WORKERS, chunk_size=ZIP_PREFETCH_CHUNK_SIZE, buffer_chunks=ZIP_PREFETCH_BUFFER_CHUNKS, ranges=None):
+        self._paths = list(paths)
+        self._ranges = list(ranges) if ranges is not None else [None] * len(self._paths)
+        self._queues = [queue.Queue(maxsize=buffer_chunks) for _ in self._paths]
+        self._workers = workers
+        self._chunk_size = chunk_size
+        self._cancelled = threading.Event()
+        self._executor = None
+
+    def _start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="smb-prefetch")
+        # The executor runs tasks in submission order, so file i always starts before file i + 1
+        for path, byte_range, chunks in zip(self._paths, self._ranges, self._queues):
+            self._executor.submit(self._read, path, byte_range, chunks)
+
+    def _put(self, chunks, item):
+        while not self._cancelled.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self, path, byte_range, chunks):
+        if self._cancelled.is_set():
+            return
+        try:
+            with open_smb_file(path) as remote_file:
+                remaining = None
+                if byte_range is not None:
+                    start, remaining = byte_range
+                    remote_file.seek(start)
+                while remaining is None or remaining > 0:
+                    chunk = read_smb_chunk(remote_file, self._chunk_size if remaining is None else min(self._chunk_size, remaining))
+                    if not chunk:
+                        break
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                    if not self._put(chunks, chunk):
+                        return
+        except Exception as err:
+            self._put(chunks, _ReadError(err))
+            return
+        self._put(chunks, _EOF)
+
+    def iter_file(self, index):
+        if self._executor is None:
+            self._start()
+        chunks = self._queues[index]
+        while True:
+            item = chunks.get()
+            if item is _EOF:
+                return
+            if isinstance(item, _ReadError):
+                raise item.error
+            yield item
+
+    def close(self):
+        """Stop all pending reads, e.g. when the client disconnects mid-download."""
+        self._cancelled.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,16 @@
+-- Denormalized bitmask of each event's classifications, so "all of these types" filters are a single
+-- (classification_mask & wanted) = wanted predicate instead of a GROUP BY / HAVING COUNT subquery.
+-- Bit n - 1 is set for the n-th value of the classifications.name ENUM (see CLASSIFICATION_BITS in app/routers/enums.py).
+
+ALTER TABLE events
+    ADD COLUMN classification_mask INT UNSIGNED NOT NULL DEFAULT 0,
+    ADD KEY idx_events_classification_mask (classification_mask);
+
+UPDATE events e
+JOIN (
+    SELECT ec.event_id, BIT_OR(1 << (cl.name + 0 - 1)) AS mask
+    FROM event_classifications ec
+    JOIN classifications cl ON ec.classification_id = cl.classification_id
+    GROUP BY ec.event_id
+) m ON e.event_id = m.event_id
+SET e.classification_mask = m.mask;
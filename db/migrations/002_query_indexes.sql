@@ -0,0 +1,22 @@
+-- Secondary indexes for the filters generated by the /records, /events and /sessions routers,
+-- app/routers/checks.check_session_date_id and scripts/import_events.get_session_id.
+-- scripts/explain_queries.py checks every generated query shape against them on a seeded database.
+
+-- session_date filters: two orderings let the optimizer range-scan from whichever bound
+-- (start_time <= date or end_time > date) is more selective for the requested date
+ALTER TABLE sessions
+    ADD KEY idx_sessions_start_end (start_time, end_time),
+    ADD KEY idx_sessions_end_start (end_time, start_time),
+    ADD KEY idx_sessions_patient_start_end (patient_id, start_time, end_time);
+
+-- modality filters, alone or joined through the session (both cover record_id through the primary key)
+ALTER TABLE records
+    ADD KEY idx_records_modality_session (modality, session_id),
+    ADD KEY idx_records_session_modality (session_id, modality);
+
+ALTER TABLE events
+    ADD KEY idx_events_onset (onset_time);
+
+-- classification lookups by name in scripts/import_events.get_or_create_event_type_id
+ALTER TABLE classifications
+    ADD KEY idx_classifications_name (name);
@@ -0,0 +1,7 @@
+-- Generation counter behind the API's metadata cache (app/metadata_cache.py).
+-- The import scripts bump it after every run; the API re-reads it every METADATA_GENERATION_CHECK seconds.
+CREATE TABLE IF NOT EXISTS metadata_generation (
+    id TINYINT PRIMARY KEY,
+    generation BIGINT UNSIGNED NOT NULL
+);
+INSERT IGNORE INTO metadata_generation (id, generation) VALUES (1, 0);
@@ -0,0 +1,3 @@
+-- SHA-256 of each record's file contents, returned by POST /records/manifest. NULL until the file has been hashed.
+ALTER TABLE records
+    ADD COLUMN content_hash CHAR(64) NULL AFTER end_time;
@@ -0,0 +1,5 @@
+-- Size and mtime each record's file had when scripts/hash_records.py hashed it. The API only uses
+-- content_hash (as the download ETag and to dedupe zip entries) while they still match the file on the share.
+ALTER TABLE records
+    ADD COLUMN hashed_size BIGINT NULL AFTER content_hash,
+    ADD COLUMN hashed_mtime_ns BIGINT NULL AFTER hashed_size;
@@ -0,0 +1,13 @@
+-- Sparse sample -> byte offset index of wearable data files, written by scripts/get_records_metadata.py and read
+-- by GET /records/{record_id}/window. The next crawl indexes every wearable file already imported.
+CREATE TABLE IF NOT EXISTS record_sample_index (
+    record_id INT PRIMARY KEY,
+    sampling_rate DOUBLE NOT NULL,
+    sample_count BIGINT NOT NULL,
+    index_step INT NOT NULL,                        -- samples between consecutive offsets
+    indexed_size BIGINT NOT NULL,                   -- file size the offsets were computed for
+    offsets LONGBLOB NOT NULL,                      -- little-endian int64 byte offsets of samples 0, index_step, 2 * index_step, ...
+    FOREIGN KEY (record_id) REFERENCES records(record_id)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE
+);
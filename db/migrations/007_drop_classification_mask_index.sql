@@ -0,0 +1,5 @@
+-- A B-tree index cannot serve the (classification_mask & wanted) = wanted predicate, so the index added by
+-- 001_event_classification_mask.sql only cost writes. The mask is checked on the events reached through the
+-- other filters (patient, session, date).
+ALTER TABLE events
+    DROP KEY idx_events_classification_mask;
@@ -40,7 +40,10 @@ CREATE TABLE IF NOT EXISTS sessions (
     FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
         ON DELETE CASCADE
         ON UPDATE CASCADE,
-    UNIQUE KEY unique_patient_hospital_start (patient_id, hospital_code, start_time)
+    UNIQUE KEY unique_patient_hospital_start (patient_id, hospital_code, start_time),
+    KEY idx_sessions_start_end (start_time, end_time),
+    KEY idx_sessions_end_start (end_time, start_time),
+    KEY idx_sessions_patient_start_end (patient_id, start_time, end_time)
 );
 
 
@@ -53,10 +56,29 @@ CREATE TABLE IF NOT EXISTS records (
     modality ENUM('hospital_video', 'hospital_eeg', 'wearable', 'report') NOT NULL,   
     start_time DATETIME,                             
     end_time DATETIME,                          
+    content_hash CHAR(64),                          -- SHA-256 of the file contents, NULL until hashed
+    hashed_size BIGINT,                             -- size and mtime (ns) the file had when it was hashed;
+    hashed_mtime_ns BIGINT,                         -- the hash is only used while they still match the file
     FOREIGN KEY (session_id) REFERENCES sessions(session_id)
         ON DELETE CASCADE
         ON UPDATE CASCADE,
-    UNIQUE KEY unique_session_name_type (session_id, file_name, file_extension)
+    UNIQUE KEY unique_session_name_type (session_id, file_name, file_extension),
+    KEY idx_records_modality_session (modality, session_id),
+    KEY idx_records_session_modality (session_id, modality)
+);
+
+-- Written by scripts/get_records_metadata.py for wearable data files, so GET /records/{record_id}/window
+-- can seek straight to a time instead of reading the file from the start
+CREATE TABLE IF NOT EXISTS record_sample_index (
+    record_id INT PRIMARY KEY,
+    sampling_rate DOUBLE NOT NULL,
+    sample_count BIGINT NOT NULL,
+    index_step INT NOT NULL,                        -- samples between consecutive offsets
+    indexed_size BIGINT NOT NULL,                   -- file size the offsets were computed for
+    offsets LONGBLOB NOT NULL,                      -- little-endian int64 byte offsets of samples 0, index_step, 2 * index_step, ...
+    FOREIGN KEY (record_id) REFERENCES records(record_id)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE
 );
 
 CREATE TABLE IF NOT EXISTS events (
@@ -65,10 +87,12 @@ CREATE TABLE IF NOT EXISTS events (
     onset_time DATETIME,
     offset_time DATETIME,
     annotations TEXT,
+    classification_mask INT UNSIGNED NOT NULL DEFAULT 0, -- one bit per classifications.name ENUM value, kept in sync by scripts/import_events.py; not indexable, see migration 007
     FOREIGN KEY (session_id) REFERENCES sessions(session_id)
         ON DELETE CASCADE
         ON UPDATE CASCADE,
-    UNIQUE KEY unique_session_onset (session_id, onset_time)
+    UNIQUE KEY unique_session_onset (session_id, onset_time),
+    KEY idx_events_onset (onset_time)
 );
 
 
@@ -78,7 +102,8 @@ CREATE TABLE classifications (
     "aware", "impaired awareness", "unknown awareness", 
     "focal", "generalized", "to bilateral tonic-clonic", "tonic-clonic", "tonic", 
     "motor", "non-motor", "automatisms", "behavior arrest", "absence"
-    ) NOT NULL
+    ) NOT NULL,
+    KEY idx_classifications_name (name)
 );
 
 
@@ -88,4 +113,10 @@ CREATE TABLE event_classifications (
     PRIMARY KEY (event_id, classification_id),
     FOREIGN KEY (event_id) REFERENCES events(event_id),
     FOREIGN KEY (classification_id) REFERENCES classifications(classification_id)
-);
\ No newline at end of file
+);
+-- Bumped by the import scripts after every run, so the API drops its cached metadata query results
+CREATE TABLE IF NOT EXISTS metadata_generation (
+    id TINYINT PRIMARY KEY,
+    generation BIGINT UNSIGNED NOT NULL
+);
+INSERT IGNORE INTO metadata_generation (id, generation) VALUES (1, 0);
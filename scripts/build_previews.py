@@ -0,0 +1,123 @@
+"""
+Background preview pyramid job for converted wearable recordings.
+
+Builds a min/max decimation pyramid per channel for the files of the crawl state written by get_records_metadata.py
+that have been converted to their columnar form but have no pyramid yet, i.e. new files and files converted again
+since they changed. Level 0 holds the min and max of every PREVIEW_BASE_BIN samples, and each further level those
+of PREVIEW_FACTOR bins of the previous one, down to a handful of bins, so GET /records/{record_id}/preview can
+answer any zoom level with a bounded number of points. Meant to run after the crawler, e.g. from cron:
+    python scripts/get_records_metadata.py && python scripts/build_previews.py
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from config import COLUMNAR_DIR, CRAWL_STATE_PATH, PREVIEW_WORKERS, PREVIEW_BASE_BIN, PREVIEW_FACTOR
+from bulk import batches, report_throughput
+from get_records_metadata import load_crawl_state, save_crawl_state
+sys.path.append('.')
+from app.columnar import columnar_base
+
+MIN_BINS = 16  # the coarsest level has at most this many bins
+RAW_CHUNK_BINS = 1 << 16  # level 0 bins computed per pass over the memory-mapped samples
+
+
+def _bin_starts(length, size):
+    return np.arange(0, length, size)
+
+
+def _decimate(data, size):
+    """Per-channel (mins, maxs) of every `size` rows of a memory-mapped samples x channels array, the last bin possibly partial."""
+    mins, maxs = [], []
+    chunk = size * RAW_CHUNK_BINS
+    for start in range(0, len(data), chunk):
+        block = np.asarray(data[start:start + chunk])
+        mins.append(np.minimum.reduceat(block, _bin_starts(len(block), size), axis=0))
+        maxs.append(np.maximum.reduceat(block, _bin_starts(len(block), size), axis=0))
+    return np.concatenate(mins), np.concatenate(maxs)
+
+
+def _save_level(path, mins, maxs):
+    # Column-major with the min and max of each channel side by side, so the API reads a bin range per column
+    level = np.empty((len(mins), 2 * mins.shape[1]), dtype=mins.dtype, order='F')
+    level[:, 0::2] = mins
+    level[:, 1::2] = maxs
+    with open(f"{path}.part", 'wb') as f:
+        np.save(f, level)
+    os.replace(f"{path}.part", path)
+
+
+def build_preview(base, base_bin=PREVIEW_BASE_BIN, factor=PREVIEW_FACTOR):
+    """
+    Write the pyramid of the converted recording at base as base.preview-<bin size>.npy files, then base.preview.json
+    with the bin sizes and the source size of the conversion they were built from, which marks the pyramid complete.
+    """
+    with open(f"{base}.json", encoding='utf-8') as f:
+        meta = json.load(f)
+    index_path = f"{base}.preview.json"
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+    data = np.load(f"{base}.npy", mmap_mode='r')
+    size = base_bin
+    mins, maxs = _decimate(data, size)
+    levels = []
+    while True:
+        _save_level(f"{base}.preview-{size}.npy", mins, maxs)
+        levels.append(size)
+        if len(mins) <= MIN_BINS:
+            break
+        mins = np.minimum.reduceat(mins, _bin_starts(len(mins), factor), axis=0)
+        maxs = np.maximum.reduceat(maxs, _bin_starts(len(maxs), factor), axis=0)
+        size *= factor
+
+    with open(f"{index_path}.part", 'w', encoding='utf-8') as f:
+        json.dump({'source_size': meta['source_size'], 'levels': levels}, f)
+    os.replace(f"{index_path}.part", index_path)
+
+
+def _try_build(columnar_dir, smb_path):
+    try:
+        build_preview(columnar_base(columnar_dir, smb_path))
+        return True
+    except (OSError, ValueError, KeyError) as err:
+        print(f"Error building preview of {smb_path}: {err}")
+        return False
+
+
+def build_previews(columnar_dir=COLUMNAR_DIR, workers=PREVIEW_WORKERS, batch_size=20, state_path=CRAWL_STATE_PATH):
+    state = load_crawl_state(state_path)
+    # The crawler drops "preview" from the state along with "converted" when a file changes
+    pending = sorted(smb_path for smb_path, file_state in state.items() if file_state.get("converted") and not file_state.get("preview"))
+
+    started = time.perf_counter()
+    built = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in batches(pending, batch_size):
+            for smb_path, ok in zip(batch, pool.map(_try_build, [columnar_dir] * len(batch), batch)):
+                if ok:
+                    state[smb_path]["preview"] = True
+                    built += 1
+            save_crawl_state(state, state_path)
+            print(f"Built {built}/{len(pending)} previews")
+    report_throughput("Built previews", built, started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--columnar-dir', default=COLUMNAR_DIR, help='Directory of the columnar form written by get_records_metadata.py')
+    parser.add_argument('--workers', type=int, default=PREVIEW_WORKERS, help='Processes building pyramids in parallel')
+    parser.add_argument('--batch-size', type=int, default=20, help='Pyramids built between crawl state saves')
+    parser.add_argument('--state', default=CRAWL_STATE_PATH, help='Crawl state file written by get_records_metadata.py')
+    args = parser.parse_args()
+    if not args.columnar_dir:
+        parser.error("COLUMNAR_DIR is not set")
+
+    build_previews(columnar_dir=args.columnar_dir, workers=args.workers, batch_size=args.batch_size, state_path=args.state)
+
+
+if __name__ == "__main__":
+    main()
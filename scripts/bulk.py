@@ -0,0 +1,39 @@
+import time
+import mysql.connector
+
+
+def batches(rows, batch_size):
+    """Split an iterable of rows into lists of at most batch_size rows."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def report_throughput(label, count, started):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"{label}: {count} rows in {elapsed:.1f}s ({count / elapsed:.0f} rows/s)")
+
+
+def ask_batch_size():
+    """Ask for a bulk batch size on the command line; None keeps the row-by-row import."""
+    answer = input("Batch size for bulk import (leave empty for row-by-row): ").strip()
+    return int(answer) if answer else None
+
+
+def bump_metadata_generation(conn):
+    """Tell running API processes that the metadata changed, so they drop their cached /records, /events and /sessions results."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO metadata_generation (id, generation) VALUES (1, 1) ON DUPLICATE KEY UPDATE generation = generation + 1"
+        )
+        conn.commit()
+    except mysql.connector.Error as err:
+        print(f"Error bumping metadata generation: {err}")
+    finally:
+        cursor.close()
@@ -0,0 +1,103 @@
+"""
+Conversion of wearable (OpenSignals text) recordings to a binary columnar form.
+
+Each file becomes <name>.npy, one column-major samples x channels array that np.load(path, mmap_mode='r') maps
+without parsing, <name>.parquet with one column per channel, and <name>.json with the header metadata, under a
+directory mirroring the file's smb_path (see app/columnar.py, which serves them).
+"""
+import io
+import json
+import os
+import sys
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from durations import count_lines, read_text_header
+sys.path.append('.')
+from app.columnar import columnar_base
+
+PARSE_BLOCK_SIZE = 1 << 24  # bytes of text parsed per numpy call
+PARQUET_ROW_GROUP = 1 << 20  # samples per Parquet row group
+
+
+def _parse_into(f, data_start, path, dtype, rows, channels):
+    """Parse the sample lines of f into a new column-major .npy file at path, one block of text at a time."""
+    array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(rows, channels), fortran_order=True)
+    f.seek(data_start)
+    row = 0
+    remainder = b''
+    while True:
+        block = f.read(PARSE_BLOCK_SIZE)
+        text = remainder + block
+        if block:
+            # Only complete lines; the partial last line is parsed with the next block
+            cut = text.rfind(b'\n') + 1
+            text, remainder = text[:cut], text[cut:]
+        if text.strip():
+            values = np.loadtxt(io.BytesIO(text), dtype=dtype, ndmin=2)
+            if values.shape[1] != channels or row + len(values) > rows:
+                raise ValueError(f"unexpected layout at sample {row}")
+            array[row:row + len(values)] = values
+            row += len(values)
+        if not block:
+            break
+    if row != rows:
+        raise ValueError(f"parsed {row} samples, expected {rows}")
+    array.flush()
+    return array
+
+
+def _write_parquet(array, channels, metadata, path):
+    schema = pa.schema([(name, pa.from_numpy_dtype(array.dtype)) for name in channels], metadata={'opensignals': json.dumps(metadata)})
+    with pq.ParquetWriter(path, schema) as writer:
+        for start in range(0, len(array), PARQUET_ROW_GROUP):
+            block = array[start:start + PARQUET_ROW_GROUP]
+            writer.write_table(pa.table([block[:, i] for i in range(len(channels))], schema=schema))
+
+
+def convert_wearable(filepath, out_base, sample_count=None):
+    """
+    Convert a wearable text file to out_base.npy/.parquet/.json. sample_count, if known (e.g. from its sample index),
+    saves counting the lines. Values are stored as int32, or float64 if the file holds non-integer values.
+    The .json is removed first and written last, so readers never see a partial conversion.
+    """
+    source_size = os.path.getsize(filepath)
+    os.makedirs(os.path.dirname(out_base), exist_ok=True)
+    meta_path = f"{out_base}.json"
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    with open(filepath, 'rb') as f:
+        header, data_start = read_text_header(f)
+        if sample_count is None:
+            sample_count = count_lines(f, data_start, source_size)
+        f.seek(data_start)
+        n_channels = len(f.readline().split())
+        channels = header.get('column') or []
+        if len(channels) != n_channels:
+            channels = [f"column_{i}" for i in range(n_channels)]
+
+        try:
+            array = _parse_into(f, data_start, f"{out_base}.npy.part", np.int32, sample_count, n_channels)
+        except ValueError:
+            array = _parse_into(f, data_start, f"{out_base}.npy.part", np.float64, sample_count, n_channels)
+
+    meta = {
+        'source_size': source_size,
+        'sampling_rate': header['sampling rate'],
+        'sample_count': sample_count,
+        'channels': channels,
+        'dtype': array.dtype.str,
+        'header': header,
+    }
+    _write_parquet(array, channels, meta, f"{out_base}.parquet.part")
+    del array
+    os.replace(f"{out_base}.npy.part", f"{out_base}.npy")
+    os.replace(f"{out_base}.parquet.part", f"{out_base}.parquet")
+    with open(f"{meta_path}.part", 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(f"{meta_path}.part", meta_path)
+
+
+def convert_record(root, smb_path, filepath, sample_count=None):
+    convert_wearable(filepath, columnar_base(root, smb_path), sample_count)
@@ -18,4 +18,14 @@ SMB_SHARE = os.getenv("SMB_SHARE")
 SMB_USER = os.getenv("SMB_USER")
 SMB_PASSWORD = os.getenv("SMB_PASSWORD")
 
-LOCAL_MNT = os.getenv("LOCAL_MNT")
\ No newline at end of file
+LOCAL_MNT = os.getenv("LOCAL_MNT")
+CRAWL_STATE_PATH = os.getenv("CRAWL_STATE_PATH", "crawl_state.json")
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", 8))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", 4))
+HASH_CHUNK_SIZE = int(os.getenv("HASH_CHUNK_SIZE", 4 * 1024 * 1024))
+SAMPLE_INDEX_INTERVAL = float(os.getenv("SAMPLE_INDEX_INTERVAL", 10))  # seconds of samples between sample index entries
+COLUMNAR_DIR = os.getenv("COLUMNAR_DIR")
+CONVERT_WORKERS = int(os.getenv("CONVERT_WORKERS", 4))
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", 4))
+PREVIEW_BASE_BIN = int(os.getenv("PREVIEW_BASE_BIN", 64))  # samples per bin of the finest preview level
+PREVIEW_FACTOR = int(os.getenv("PREVIEW_FACTOR", 4))  # bins of a preview level merged into one of the next
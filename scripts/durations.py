@@ -0,0 +1,258 @@
+"""
+Start/end time extraction for record files, without reading whole recordings.
+
+Readers are registered per file extension with @reader(...) and return (start_time, end_time) datetimes,
+or (None, None) when the file does not carry its times. read_times() dispatches on the extension.
+"""
+import ast
+import configparser
+import os
+import re
+from datetime import datetime, timedelta
+
+READ_BLOCK_SIZE = 1 << 16
+COUNT_BLOCK_SIZE = 1 << 23
+SAMPLE_BLOCKS = 8
+# Relative spread of the sampled mean line lengths above which the estimate is replaced by an exact count
+LINE_LENGTH_TOLERANCE = 0.005
+
+_readers = {}
+
+
+def reader(*extensions):
+    def register(func):
+        for extension in extensions:
+            _readers[extension] = func
+        return func
+    return register
+
+
+def read_times(filepath, file, exact=False):
+    """(start_time, end_time) of a record file read from filepath, or (None, None) if no reader knows its format."""
+    func = _readers.get(os.path.splitext(file)[1].lower())
+    if func is None:
+        return None, None
+    return func(filepath, file, exact=exact)
+
+
+# === Wearable (OpenSignals text) ===
+
+def wearable_start_time(file):
+    """Start time encoded in the name of a wearable data file (A<date> <time>.txt), or None for other files."""
+    data_file_pattern = re.compile(r"A2.*\.txt")
+    if not data_file_pattern.fullmatch(file):
+        return None
+
+    file_datetime = os.path.splitext(file)[0][1:]
+
+    parts = file_datetime.split('-')
+    if len(parts[-1]) == 0:
+        parts[-1] = parts[-1] + '00'
+    elif len(parts[-1]) == 1:  # seconds like '3' → '30'
+        parts[-1] = parts[-1] + '0'
+
+    return datetime.strptime('-'.join(parts), '%Y-%m-%d %H-%M-%S')
+
+
+def read_text_header(f):
+    """Parse the '# {...}' header line and return (header of the first device, offset of the first data line)."""
+    header = None
+    while True:
+        data_start = f.tell()
+        line = f.readline()
+        if not line.startswith(b'#'):
+            break
+        text = line[1:].strip().decode('utf-8', errors='replace')
+        if text.startswith('{'):
+            header_dict = ast.literal_eval(text)
+            header = header_dict[list(header_dict.keys())[0]]
+    if header is None or 'sampling rate' not in header:
+        raise ValueError("no sampling rate in header")
+    return header, data_start
+
+
+def _read_text_header(f):
+    """(sampling rate, offset of the first data line) of a wearable text file."""
+    header, data_start = read_text_header(f)
+    return header['sampling rate'], data_start
+
+
+def count_lines(f, start, size):
+    """Exact number of lines between start and size, reading binary blocks instead of decoding every line."""
+    f.seek(start)
+    count = 0
+    last = b'\n'
+    while True:
+        block = f.read(COUNT_BLOCK_SIZE)
+        if not block:
+            break
+        count += block.count(b'\n')
+        last = block[-1:]
+    return count + (last != b'\n' and size > start)
+
+
+def estimate_lines(f, start, size):
+    """
+    Number of lines between start and size, from the data size and the mean line length of SAMPLE_BLOCKS blocks
+    spread over the file. Falls back to count_lines when the file is small or the line length drifts.
+    """
+    data_size = size - start
+    if data_size <= 2 * SAMPLE_BLOCKS * READ_BLOCK_SIZE:
+        return count_lines(f, start, size)
+
+    means = []
+    step = (data_size - READ_BLOCK_SIZE) // (SAMPLE_BLOCKS - 1)
+    for i in range(SAMPLE_BLOCKS):
+        f.seek(start + i * step)
+        block = f.read(READ_BLOCK_SIZE)
+        # Only complete lines: drop the partial line at each end of the block
+        first, last = (block.find(b'\n') if i else -1), block.rfind(b'\n')
+        lines = block[first + 1:last + 1].count(b'\n')
+        if lines == 0:
+            return count_lines(f, start, size)
+        means.append((last - first) / lines)
+
+    mean = sum(means) / len(means)
+    if (max(means) - min(means)) / mean > LINE_LENGTH_TOLERANCE:
+        return count_lines(f, start, size)
+    return round(data_size / mean)
+
+
+@reader('.txt')
+def wearable_times(filepath, file, exact=False):
+    start_time = wearable_start_time(file)
+    if start_time is None:
+        return None, None
+
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        fs, data_start = _read_text_header(f)
+        sample_count = count_lines(f, data_start, size) if exact else estimate_lines(f, data_start, size)
+
+    return start_time, start_time + timedelta(seconds=sample_count / fs)
+
+
+def _nth_newline(block, start, n, line_length):
+    """Position of the n-th newline in block after start, which must exist: guessed from the line length, then corrected."""
+    pos = min(start + int(n * line_length), len(block))
+    count = block.count(b'\n', start, pos)
+    if count >= n:
+        while count >= n:
+            pos = block.rindex(b'\n', start, pos)
+            count -= 1
+        return pos
+    while count < n:
+        pos = block.index(b'\n', pos) + 1
+        count += 1
+    return pos - 1
+
+
+def sample_offsets(f, start, size, step):
+    """
+    Exact number of lines between start and size, and the byte offsets of lines 0, step, 2 * step, ...
+    Like count_lines, blocks are scanned with bytes.count; indexed lines are located from the mean line length.
+    """
+    f.seek(start)
+    offsets = [start]
+    count = 0
+    pending = step  # lines left before the next indexed one
+    position = start
+    last = b'\n'
+    while True:
+        block = f.read(COUNT_BLOCK_SIZE)
+        if not block:
+            break
+        lines = block.count(b'\n')
+        line_length = len(block) / max(lines, 1)
+        offset = 0
+        while lines >= pending:
+            offset = _nth_newline(block, offset, pending, line_length) + 1
+            offsets.append(position + offset)
+            lines -= pending
+            count += pending
+            pending = step
+        pending -= lines
+        count += lines
+        position += len(block)
+        last = block[-1:]
+    count += last != b'\n' and size > start
+    # The offset after the last newline is the end of the file, not a sample
+    return count, [offset for offset in offsets if offset < size] or [start]
+
+
+def wearable_index(filepath, file, interval):
+    """
+    (start_time, end_time, index) of a wearable data file from one exact pass over it, where index holds the
+    sampling rate, the sample count, the file size and the byte offsets of every step-th sample (step being
+    `interval` seconds of samples), so a time window can later be read by seeking instead of scanning.
+    """
+    start_time = wearable_start_time(file)
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        fs, data_start = _read_text_header(f)
+        step = max(1, round(fs * interval))
+        sample_count, offsets = sample_offsets(f, data_start, size, step)
+
+    index = {"sampling_rate": fs, "sample_count": sample_count, "step": step, "size": size, "offsets": offsets}
+    return start_time, start_time + timedelta(seconds=sample_count / fs), index
+
+
+# === Hospital EEG headers ===
+
+@reader('.edf', '.bdf')
+def edf_times(filepath, file, exact=False):
+    """EDF/BDF: start date/time, number of data records and record duration from the fixed 256-byte header."""
+    with open(filepath, 'rb') as f:
+        header = f.read(256).decode('ascii', errors='replace')
+
+    day, month, year = (int(part) for part in header[168:176].split('.'))
+    hour, minute, second = (int(part) for part in header[176:184].split('.'))
+    # EDF two-digit years: 85-99 are 1985-1999, 00-84 are 2000-2084
+    start_time = datetime(1900 + year if year >= 85 else 2000 + year, month, day, hour, minute, second)
+
+    n_records, record_duration = int(header[236:244]), float(header[244:252])
+    if n_records < 0:  # -1 while the recording was still being written
+        return start_time, None
+    return start_time, start_time + timedelta(seconds=n_records * record_duration)
+
+
+_BINARY_FORMAT_SIZES = {'INT_16': 2, 'UINT_16': 2, 'INT_32': 4, 'IEEE_FLOAT_32': 4}
+
+
+@reader('.vhdr')
+def brainvision_times(filepath, file, exact=False):
+    """
+    BrainVision: sampling interval and channel layout from the .vhdr, start time from the 'New Segment' marker
+    in the .vmrk, and the sample count from the size of the binary .eeg data file.
+    """
+    directory = os.path.dirname(filepath)
+    header = _read_brainvision_ini(filepath)
+    common = header['Common Infos']
+
+    start_time = None
+    markers = _read_brainvision_ini(os.path.join(directory, common['MarkerFile']))
+    for marker in markers['Marker Infos'].values() if markers.has_section('Marker Infos') else []:
+        fields = marker.split(',')
+        if fields[0] == 'New Segment' and len(fields) > 5 and fields[5]:
+            start_time = datetime.strptime(fields[5][:20], '%Y%m%d%H%M%S%f')
+            break
+    if start_time is None:
+        return None, None
+
+    binary_format = header.get('Binary Infos', 'BinaryFormat', fallback=None)
+    if common.get('DataFormat', 'BINARY').upper() != 'BINARY' or binary_format not in _BINARY_FORMAT_SIZES:
+        return start_time, None
+
+    data_size = os.path.getsize(os.path.join(directory, common['DataFile']))
+    sample_count = data_size // (int(common['NumberOfChannels']) * _BINARY_FORMAT_SIZES[binary_format])
+    return start_time, start_time + timedelta(microseconds=sample_count * float(common['SamplingInterval']))
+
+
+def _read_brainvision_ini(path):
+    with open(path, encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    # Skip the identification line before the first [section]
+    parser = configparser.ConfigParser(interpolation=None, strict=False)
+    parser.optionxform = str
+    parser.read_string(text[text.find('['):])
+    return parser
@@ -0,0 +1,226 @@
+"""
+Query-plan regression check for the API's generated SQL.
+
+Creates a scratch database from db/schema.sql, seeds it with synthetic patients, sessions, records and events,
+then runs EXPLAIN on every query shape the /records, /events and /sessions routers can generate (plus the
+session lookups in app/routers/checks.py and scripts/import_events.py). Exits with status 1 if any shape
+makes MySQL/MariaDB fall back to a full table scan where an index should be used.
+
+Run from the repository root against a local server (credentials from .env):
+    python scripts/explain_queries.py [--database preepiseizures_explain] [--patients 500] [--keep]
+or as part of the test suite (tests/test_query_plans.py), which skips it when no server is configured.
+"""
+import argparse
+import itertools
+import random
+import sys
+from datetime import datetime, timedelta
+
+import mysql.connector
+from dotenv import load_dotenv
+from config import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME
+import import_events
+sys.path.append('.')
+from app.routers.checks import check_session_date_id
+from app.routers.enums import CLASSIFICATION_BITS, MODALITY_EXTENSIONS, classification_mask
+from app.routers.events import build_events_query
+from app.routers.records import build_records_query
+from app.routers.sessions import build_sessions_query
+
+load_dotenv()
+
+# Table alias each filter should reach through an index
+FILTER_ALIASES = {
+    'patient_code': 'p',
+    'session_date': 's',
+    'session_id': 's',
+    'modality': 'r',
+    'event_types': None,  # bitmask predicate, checked on the rows reached through the other filters
+}
+
+
+class _CapturingCursor:
+    """Stands in for a DB cursor so helpers that run their own queries can be EXPLAINed without executing them."""
+
+    def __init__(self):
+        self.queries = []
+
+    def execute(self, query, params=()):
+        self.queries.append((query, params))
+
+    def fetchone(self):
+        return None
+
+
+def seed(cursor, n_patients):
+    random.seed(0)
+    cursor.executemany("INSERT INTO classifications (name) VALUES (%s)", [(name,) for name in CLASSIFICATION_BITS])
+    cursor.execute("SELECT classification_id, name FROM classifications")
+    classification_ids = {name: cid for cid, name in cursor.fetchall()}
+
+    cursor.executemany(
+        "INSERT INTO patients (patient_code) VALUES (%s)",
+        [(f"P{i:04d}",) for i in range(n_patients)]
+    )
+
+    timeline_start = datetime(2019, 1, 1)
+    sessions = []
+    for patient_id in range(1, n_patients + 1):
+        start = timeline_start + timedelta(days=random.uniform(0, 6 * 365))
+        for _ in range(random.randint(1, 3)):
+            end = start + timedelta(days=random.uniform(1, 10))
+            sessions.append((patient_id, f"H{patient_id}-{len(sessions)}", start, end))
+            start = end + timedelta(days=random.uniform(30, 365))
+    cursor.executemany(
+        "INSERT INTO sessions (patient_id, hospital_code, start_time, end_time) VALUES (%s, %s, %s, %s)",
+        sessions
+    )
+
+    records, events, links = [], [], []
+    event_id = 0
+    for session_id, (_, _, start, end) in enumerate(sessions, start=1):
+        for modality, extensions in MODALITY_EXTENSIONS.items():
+            for k in range(random.randint(1, 3)):
+                extension = random.choice(extensions)
+                name = f"S{session_id}-{modality}-{k}"
+                records.append((session_id, name, extension, rf"P\{name}{extension}", modality, start, end))
+        for _ in range(random.randint(0, 5)):
+            names = random.sample(list(CLASSIFICATION_BITS), random.randint(1, 3))
+            onset = start + (end - start) * random.random()
+            event_id += 1
+            events.append((session_id, onset, onset + timedelta(minutes=2), None, classification_mask(names)))
+            links.extend((event_id, classification_ids[name]) for name in names)
+
+    cursor.executemany(
+        """
+        INSERT INTO records (session_id, file_name, file_extension, smb_path, modality, start_time, end_time)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """,
+        records
+    )
+    cursor.executemany(
+        "INSERT INTO events (session_id, onset_time, offset_time, annotations, classification_mask) VALUES (%s, %s, %s, %s, %s)",
+        events
+    )
+    cursor.executemany("INSERT INTO event_classifications (event_id, classification_id) VALUES (%s, %s)", links)
+    cursor.execute("ANALYZE TABLE patients, sessions, records, events, event_classifications, classifications")
+    cursor.fetchall()
+    return sessions
+
+
+def query_shapes(probe):
+    """Yield (name, query, params, aliases that must not be full-scanned) for every generated query shape."""
+    builders = [
+        ('records', build_records_query, ['patient_code', 'session_date', 'session_id', 'modality']),
+        ('events', build_events_query, ['patient_code', 'session_date', 'session_id', 'event_types']),
+        ('sessions', build_sessions_query, ['patient_code', 'event_types', 'modality']),
+    ]
+    for name, builder, filters in builders:
+        for n in range(len(filters) + 1):
+            for combination in itertools.combinations(filters, n):
+                for paged in (False, True):
+                    kwargs = {f: probe[f] for f in combination}
+                    if paged:
+                        kwargs.update(limit=100, page_cursor=probe['page_cursor'])
+                    query, params = builder(**kwargs)
+                    aliases = {FILTER_ALIASES[f] for f in combination} - {None}
+                    yield f"{name}({', '.join(combination) or '-'}{', paged' if paged else ''})", query, params, aliases
+
+    helpers = [
+        ('checks.check_session_date_id', lambda c: check_session_date_id(c, probe['session_id'], probe['session_date']), {'sessions'}),
+        ('import_events.get_session_id', lambda c: import_events.get_session_id(c, probe['session_date'], probe['patient_code']), {'s', 'p'}),
+        ('import_events.get_session_id(no patient)', lambda c: import_events.get_session_id(c, probe['session_date'], None), {'s'}),
+    ]
+    for name, helper, aliases in helpers:
+        capture = _CapturingCursor()
+        try:
+            helper(capture)
+        except Exception:
+            pass  # helpers may raise on the empty fetch; the query has been captured by then
+        for query, params in capture.queries:
+            yield name, query, params, aliases
+
+
+def full_scans(plan, aliases):
+    """Tables accessed with a full scan that should have used an index: filtered tables, or any joined table."""
+    return [
+        row['table'] for position, row in enumerate(plan)
+        if row['type'] == 'ALL' and (row['table'] in aliases or position > 0)
+    ]
+
+
+def check_query_plans(conn, database, patients=500, keep=False):
+    """
+    Create and seed the scratch database on conn, EXPLAIN every query shape and return the (name, full-scanned
+    tables, plan) of those that fall back to a full scan. Also used by tests/test_query_plans.py.
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+    cursor.execute(f"CREATE DATABASE `{database}`")
+    cursor.execute(f"USE `{database}`")
+
+    failures = []
+    try:
+        with open('db/schema.sql', encoding='utf-8') as f:
+            for statement in f.read().split(';'):
+                if statement.strip():
+                    cursor.execute(statement)
+
+        sessions = seed(cursor, patients)
+        conn.commit()
+
+        # Probe a recent session, the usual target of date lookups
+        session_id = int(len(sessions) * 0.9)
+        patient_id, _, start, end = sessions[session_id - 1]
+        probe = {
+            'patient_code': f"P{patient_id - 1:04d}",
+            'session_date': start + (end - start) / 2,
+            'session_id': session_id,
+            'modality': 'wearable',
+            'event_types': ['focal', 'aware'],
+            'page_cursor': 1000,
+        }
+
+        explain = conn.cursor(dictionary=True)
+        for name, query, params, aliases in query_shapes(probe):
+            explain.execute("EXPLAIN " + query, tuple(params))
+            plan = explain.fetchall()
+            scanned = full_scans(plan, aliases)
+            if scanned:
+                failures.append((name, scanned, plan))
+        explain.close()
+    finally:
+        if not keep:
+            cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+        cursor.close()
+    return failures
+
+
+def format_failure(name, scanned, plan):
+    lines = [f"FULL SCAN  {name}: {', '.join(scanned)}"]
+    for row in plan:
+        lines.append(f"    {row['table']}: type={row['type']} key={row['key']} rows={row['rows']} {row['Extra'] or ''}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=f"{DB_NAME}_explain", help='Scratch database to create (dropped afterwards unless --keep)')
+    parser.add_argument('--patients', type=int, default=500, help='Number of synthetic patients to seed')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch database after the run')
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD)
+    try:
+        failures = check_query_plans(conn, args.database, args.patients, args.keep)
+    finally:
+        conn.close()
+
+    for failure in failures:
+        print(format_failure(*failure))
+    print(f"{len(failures)} query shape(s) with full scans")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
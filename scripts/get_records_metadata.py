@@ -1,11 +1,23 @@
+import argparse
+import configparser
+import json
+import multiprocessing
 import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
 from dotenv import load_dotenv
 import mysql.connector
-from config import SMB_USER, SMB_PASSWORD, SMB_SHARE, DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, LOCAL_MNT
+from config import SMB_USER, SMB_PASSWORD, SMB_SHARE, DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, LOCAL_MNT, CRAWL_STATE_PATH, CRAWL_WORKERS, SAMPLE_INDEX_INTERVAL, COLUMNAR_DIR, CONVERT_WORKERS
+sys.path.append('.')
+from app.routers.enums import MODALITY_EXTENSIONS
+from bulk import batches, bump_metadata_generation, report_throughput
+from columnar import convert_record
+from durations import read_times, wearable_index, wearable_start_time
+from session_index import SessionIndex
 import smbclient
-import re
-from datetime import datetime, timedelta
-import ast 
 
 
 load_dotenv()
@@ -20,155 +32,272 @@ def get_db_connection():
 
 def _get_metadata_from_name(file):
     file_name, file_extension = os.path.splitext(file)
-    modality_map = {
-        'hospital_video': ['.mpe', '.wmv', '.avi'],
-        'hospital_eeg': ['.vhdr', '.vmrk', '.eeg', '.edf', '.bdf', '.gdf', '.cnt', '.egi', '.mff', '.set', '.fdt', '.data', '.nxe', '.lay', '.dat', '.eeg', '.21e', '.pnt', '.log', '.xdf', '.xdfz', '.trc'],
-        'wearable': ['.txt'],
-        'report': ['.doc', '.docx', '.pdf']
-    }
-    for modality, extensions in modality_map.items():
+    for modality, extensions in MODALITY_EXTENSIONS.items():
         if file_extension.lower() in extensions:
             return file_name, file_extension, modality
     return file_name, file_extension, 'unknown'
 
-def _get_session_id_from_patient(cursor, code, file):
-    cursor.execute("""
-        SELECT s.* 
-        FROM patients p 
-        LEFT JOIN sessions s ON p.patient_id = s.patient_id 
-        WHERE p.patient_code = %s
-    """, (code,))
-    
-    rows = cursor.fetchall()
-    
-    if not rows:
-        print("No sessions found for that patient code.")
-        return None
-
-    session_ids = [row[0] for row in rows if row[0] is not None]
-    
-    if not session_ids:
-        print("Patient found but no session IDs linked.")
-        return None
-
+def _get_session_id(session_index, code, file):
+    """
+    Resolve the session of a file without prompting: the patient's only session, else the session containing
+    the start time encoded in the file name. Files that cannot be resolved are left in session_index for report().
+    """
+    session_ids = session_index.session_ids(code)
     if len(session_ids) == 1:
         return session_ids[0]
-    
-    print(f"Multiple sessions found for {file} (patient {code}):")
-    if code == 'IQCX':
-        if 'EEG' in file.upper():
-            return session_ids[0]
-        elif 'A2021' in file.upper():
-            return session_ids[1]
-        
-    for idx, sid in enumerate(session_ids):
-        print(f"{idx + 1}. {rows[idx]}")
-    
-    while True:
-        try:
-            choice = int(input(f"Select session number (1-{len(session_ids)}): "))
-            if 1 <= choice <= len(session_ids):
-                return session_ids[choice - 1]
-            else:
-                print("Invalid selection. Try again.")
-        except ValueError:
-            print("Please enter a valid number.")
-    
-def _get_times_from_file(filepath, file):
-    data_file_pattern = re.compile(r"A2.*\.txt")
-
-    if data_file_pattern.fullmatch(file):
-
-        # Get start time
-        file_datetime = os.path.splitext(file)[0][1:]
-
-        parts = file_datetime.split('-')
-        if len(parts[-1]) == 0:
-            parts[-1] = parts[-1] + '00'
-        elif len(parts[-1]) == 1:  # seconds like '3' → '30'
-            parts[-1] = parts[-1] + '0'
-
-        start_time = datetime.strptime('-'.join(parts), '%Y-%m-%d %H-%M-%S')
-
-        # Get end time
-        with open(filepath, 'r') as f:
-            _ = next(f)
-            header_line = next(f).strip()
-            sample_count = sum(1 for _ in f)
-
-        dict_str = header_line[1:].strip()
-        header_dict = ast.literal_eval(dict_str)
-
-        fs = header_dict[list(header_dict.keys())[0]]['sampling rate']
-        duration_sec = sample_count / fs
-        end_time = start_time + timedelta(seconds=duration_sec)
-
-        return start_time.strftime("%Y-%m-%d %H-%M-%S"), end_time.strftime("%Y-%m-%d %H-%M-%S")
-
-    else:
+
+    start_time = wearable_start_time(file)
+    if start_time is not None:
+        return session_index.resolve(start_time, code, label=file)
+
+    if code == 'IQCX' and 'EEG' in file.upper():
+        return session_ids[0]
+
+    (session_index.ambiguous if session_ids else session_index.unmatched).append((file, code, session_ids))
+    return None
+
+
+def _format_times(start_time, end_time):
+    if start_time is None:
         return None, None
-    
-
-def file_exists(cursor, session_id, file_name, file_extension):
-    query = """
-        SELECT record_id 
-        FROM records 
-        WHERE session_id = %s AND file_name = %s AND file_extension = %s
-        LIMIT 1
-    """
-    cursor.execute(query, (session_id, file_name, file_extension))
-    return cursor.fetchone() is not None
+    return start_time.strftime("%Y-%m-%d %H-%M-%S"), end_time.strftime("%Y-%m-%d %H-%M-%S") if end_time else None
 
 
-conn = get_db_connection()
-cursor = conn.cursor()
+def _get_times_from_file(filepath, file, exact=False):
+    return _format_times(*read_times(filepath, file, exact=exact))
 
-# Register your SMB server credentials
-smbclient.ClientConfig(username=SMB_USER, password=SMB_PASSWORD)
 
-patient_list = smbclient.listdir(rf"{SMB_SHARE}")
+def load_crawl_state(path):
+    """
+    Crawl state of a previous run: smb_path -> {"size", "mtime"} of every file already stored in records,
+    "indexed" once the sample index of a wearable file has been stored, "converted" once it has been converted
+    to its columnar form, plus the content hash fields added by scripts/hash_records.py and "preview" once
+    scripts/build_previews.py has built the preview pyramid of its columnar form.
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
 
 
-for pat in patient_list: 
+def save_crawl_state(state, path):
+    # Written to a temporary file first, so an interrupted run never leaves a truncated state behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
 
-    patient_dir = rf"{SMB_SHARE}\{pat}"
 
-    directory_list = smbclient.listdir(patient_dir)
-    
-    for dir in directory_list:
-        
-        if not smbclient.path.isdir(rf"{patient_dir}\{dir}"):
+def scan_patient(pat):
+    """
+    List the files of one patient directory as (pat, dir, file, size, mtime) tuples.
+    scandir returns type, size and mtime with the listing, so there is no isdir/stat round-trip per entry.
+    """
+    files = []
+    for dir_entry in smbclient.scandir(rf"{SMB_SHARE}\{pat}"):
+        if not dir_entry.is_dir():
             continue
-        
-        file_dir = rf"{patient_dir}\{dir}" 
-        file_list = smbclient.listdir(file_dir)
-        
-        for file in file_list:
-            session_id = _get_session_id_from_patient(cursor, pat, file)
-            file_name, file_extension, modality = _get_metadata_from_name(file)
-            
-            if file_exists(cursor, session_id, file_name, file_extension):
-                print(f"File {file_name}.{file_extension} already exists in database.")
-            else:
+        for file_entry in smbclient.scandir(dir_entry.path):
+            if not file_entry.is_file():
+                continue
+            info = file_entry.smb_info
+            files.append((pat, dir_entry.name, file_entry.name, info.end_of_file, info.last_write_time.timestamp()))
+    return files
+
+
+# Looked up through the records unique key, since several records may share an smb_path
+SAMPLE_INDEX_UPSERT = """
+    INSERT INTO record_sample_index (record_id, sampling_rate, sample_count, index_step, indexed_size, offsets)
+    SELECT record_id, %s, %s, %s, %s, %s FROM records
+    WHERE session_id = %s AND file_name = %s AND file_extension = %s
+    ON DUPLICATE KEY UPDATE sampling_rate = VALUES(sampling_rate), sample_count = VALUES(sample_count),
+        index_step = VALUES(index_step), indexed_size = VALUES(indexed_size), offsets = VALUES(offsets)
+"""
+
+
+def _needs_index(file, index_interval):
+    return bool(index_interval) and wearable_start_time(file) is not None
+
+
+def _needs_conversion(file, columnar_dir):
+    return bool(columnar_dir) and wearable_start_time(file) is not None
+
+
+def _local_path(pat, dir, file):
+    return os.path.join('/'.join(LOCAL_MNT.split('\\')), pat, dir, file)
+
+
+def _read_file(pat, dir, file, exact=False, index_interval=None):
+    """
+    Start/end times of a file and, for wearable data files when index_interval is set, its sample index.
+    Building the index counts every sample, so those files get exact end times regardless of `exact`.
+    """
+    filepath = _local_path(pat, dir, file)
+    try:
+        if _needs_index(file, index_interval):
+            start_time, end_time, sample_index = wearable_index(filepath, file, index_interval)
+            return (*_format_times(start_time, end_time), sample_index)
+        return (*_get_times_from_file(filepath, file, exact=exact), None)
+    except (OSError, ValueError, SyntaxError, KeyError, configparser.Error) as err:
+        print(f"Error reading times from {pat}\\{dir}\\{file}: {err}")
+        return None, None, None
+
+
+def _convert(pat, dir, file, columnar_dir, sample_count=None):
+    """Convert a wearable data file to its columnar form (see columnar.py); runs in a worker process."""
+    try:
+        convert_record(columnar_dir, rf"{pat}\{dir}\{file}", _local_path(pat, dir, file), sample_count)
+        return True
+    except (OSError, ValueError, SyntaxError, KeyError) as err:
+        print(f"Error converting {pat}\\{dir}\\{file}: {err}")
+        return False
+
+
+def _sample_index_row(session_id, file_name, file_extension, sample_index):
+    offsets = sample_index["offsets"]
+    return (
+        sample_index["sampling_rate"], sample_index["sample_count"], sample_index["step"], sample_index["size"],
+        struct.pack(f"<{len(offsets)}q", *offsets), session_id, file_name, file_extension,
+    )
+
+
+def crawl(conn, workers=CRAWL_WORKERS, batch_size=1000, state_path=CRAWL_STATE_PATH, full=False, exact=False, index_interval=SAMPLE_INDEX_INTERVAL, columnar_dir=COLUMNAR_DIR, convert_workers=CONVERT_WORKERS):
+    """
+    Crawl the share and upsert the records of new or changed files.
+
+    Patient directories are listed in parallel on a thread pool, which is also used to read the start/end times
+    of the files to import (see durations.py; exact=True counts wearable samples instead of estimating them).
+    Files whose size and mtime match the crawl state are skipped, as are files that already have a record but
+    are missing from the state (e.g. on the first run), which are only added to it, except wearable data files
+    without a sample index yet. Records are written with multi-row upserts together with the sample indexes
+    (byte offset of every index_interval seconds of samples, 0 disables them), one transaction per batch,
+    and the state is saved after each batch. When columnar_dir is set, the wearable data files of each batch
+    are then converted to their columnar form on a pool of convert_workers processes, since parsing is CPU-bound.
+    """
+    cursor = conn.cursor()
+    session_index = SessionIndex.load(cursor)
+    cursor.execute("SELECT smb_path FROM records")
+    stored = {smb_path for (smb_path,) in cursor.fetchall()}
+    state = load_crawl_state(state_path)
+
+    smbclient.ClientConfig(username=SMB_USER, password=SMB_PASSWORD)
+    patients = [entry.name for entry in smbclient.scandir(rf"{SMB_SHARE}") if entry.is_dir()]
+
+    started = time.perf_counter()
+    scanned = 0
+    unknown = 0
+    pending = []
+    # Conversion workers are spawned rather than forked from this process, which already runs crawler threads and
+    # holds a MySQL connection; without columnar_dir there is nothing to convert and no pool is started
+    converter = ProcessPoolExecutor(max_workers=convert_workers, mp_context=multiprocessing.get_context('spawn')) if columnar_dir else nullcontext()
+    with ThreadPoolExecutor(max_workers=workers) as pool, converter:
+        for files in pool.map(scan_patient, patients):
+            for pat, dir, file, size, mtime in files:
+                scanned += 1
+                # records.modality has no 'unknown' value: one such row would fail the whole batch insert
+                if _get_metadata_from_name(file)[2] == 'unknown':
+                    unknown += 1
+                    continue
                 smb_path = rf"{pat}\{dir}\{file}"
-                start_time, end_time = _get_times_from_file(os.path.join('/'.join(LOCAL_MNT.split('\\')), pat, dir, file), file)
-
-            
-                try:
-                    cursor.execute(
-                        """
-                        INSERT INTO records (session_id, file_name, file_extension, smb_path, modality, start_time, end_time)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        """,
-                        (session_id, file_name, file_extension, smb_path, modality, start_time, end_time)
-                    )
-                    record_id = cursor.lastrowid
-
-                    print(f"Imported record {smb_path} (ID: {record_id})")
-                except mysql.connector.Error as err:
-                    print(f"Error importing record {file}: {err}")
-    
-conn.commit()
-cursor.close()
-conn.close()
-        
+                file_state = {"size": size, "mtime": mtime}
+                previous = state.get(smb_path, {})
+                unchanged = previous.get("size") == size and previous.get("mtime") == mtime
+                needs_index = _needs_index(file, index_interval) and not (unchanged and previous.get("indexed"))
+                needs_conversion = _needs_conversion(file, columnar_dir) and not (unchanged and previous.get("converted"))
+                needs_update = needs_index or needs_conversion
+                if unchanged and not full and not needs_update:
+                    continue
+                if smb_path in stored and not previous and not full and not needs_update:
+                    state[smb_path] = file_state
+                    continue
+                if unchanged:
+                    # Keep what later jobs stored for the same file, e.g. its content hash (scripts/hash_records.py)
+                    file_state = previous
+
+                session_id = _get_session_id(session_index, pat, file)
+                if session_id is None:
+                    continue
+                pending.append((smb_path, file_state, session_id, pat, dir, file))
+        report_throughput("Scanned files", scanned, started)
+        if unknown:
+            print(f"Skipped {unknown} files of unknown type")
+
+        imported = 0
+        for batch in batches(pending, batch_size):
+            results = pool.map(lambda entry: _read_file(*entry[3:], exact=exact, index_interval=index_interval), batch)
+            rows, index_rows, indexed, conversions = [], [], [], []
+            for (smb_path, file_state, session_id, pat, dir, file), (start_time, end_time, sample_index) in zip(batch, results):
+                file_name, file_extension, modality = _get_metadata_from_name(file)
+                rows.append((session_id, file_name, file_extension, smb_path, modality, start_time, end_time))
+                if sample_index is not None:
+                    index_rows.append(_sample_index_row(session_id, file_name, file_extension, sample_index))
+                    indexed.append(smb_path)
+                # Files re-read only to be indexed keep a conversion that is still current
+                if _needs_conversion(file, columnar_dir) and not file_state.get("converted"):
+                    sample_count = sample_index["sample_count"] if sample_index is not None else None
+                    conversions.append((smb_path, (pat, dir, file, columnar_dir, sample_count)))
+
+            try:
+                cursor.executemany(
+                    """
+                    INSERT INTO records (session_id, file_name, file_extension, smb_path, modality, start_time, end_time)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE smb_path = VALUES(smb_path), modality = VALUES(modality),
+                        start_time = VALUES(start_time), end_time = VALUES(end_time)
+                    """,
+                    rows
+                )
+                # One statement per index: executemany cannot batch INSERT ... SELECT, and each row is a large blob anyway
+                for index_row in index_rows:
+                    cursor.execute(SAMPLE_INDEX_UPSERT, index_row)
+                conn.commit()
+            except mysql.connector.Error as err:
+                conn.rollback()
+                print(f"Error importing batch of {len(rows)} records: {err}")
+                continue
+
+            for smb_path, file_state, *_ in batch:
+                state[smb_path] = file_state
+            for smb_path in indexed:
+                state[smb_path]["indexed"] = True
+            # conversions is always empty without columnar_dir
+            futures = [(smb_path, converter.submit(_convert, *args)) for smb_path, args in conversions]
+            for smb_path, future in futures:
+                if future.result():
+                    state[smb_path]["converted"] = True
+            save_crawl_state(state, state_path)
+            imported += len(rows)
+            print(f"Imported {imported}/{len(pending)} new or changed records")
+
+    save_crawl_state(state, state_path)
+    cursor.close()
+    bump_metadata_generation(conn)
+    report_throughput("Imported records", imported, started)
+    session_index.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl the SMB share and import new or changed records.")
+    parser.add_argument('--workers', type=int, default=CRAWL_WORKERS, help='Threads listing patient directories and reading file times')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Records per INSERT batch and transaction')
+    parser.add_argument('--state', default=CRAWL_STATE_PATH, help='Crawl state file (path -> size/mtime of imported files)')
+    parser.add_argument('--full', action='store_true', help='Re-import every file, ignoring the crawl state')
+    parser.add_argument('--exact', action='store_true', help='Count every sample of wearable files instead of estimating durations')
+    parser.add_argument('--index-interval', type=float, default=SAMPLE_INDEX_INTERVAL, help='Seconds of samples between sample index entries of wearable files (0 skips indexing)')
+    parser.add_argument('--columnar-dir', default=COLUMNAR_DIR, help='Directory for the columnar (.npy/.parquet) form of wearable files (empty skips conversion)')
+    parser.add_argument('--convert-workers', type=int, default=CONVERT_WORKERS, help='Processes converting wearable files to their columnar form')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        crawl(
+            conn, workers=args.workers, batch_size=args.batch_size, state_path=args.state, full=args.full, exact=args.exact,
+            index_interval=args.index_interval, columnar_dir=args.columnar_dir, convert_workers=args.convert_workers,
+        )
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Background content-hash job for records.
+
+Hashes (SHA-256) the files of the crawl state written by get_records_metadata.py that have no hash yet, i.e. new
+files and files whose size or mtime changed since they were last hashed, and stores the hash in records together
+with the size and mtime it was computed for. Meant to run after the crawler, e.g. from cron:
+    python scripts/get_records_metadata.py && python scripts/hash_records.py
+"""
+import argparse
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import mysql.connector
+import smbclient
+from config import SMB_USER, SMB_PASSWORD, SMB_SHARE, CRAWL_STATE_PATH, HASH_WORKERS, HASH_CHUNK_SIZE
+from bulk import batches, bump_metadata_generation, report_throughput
+from get_records_metadata import get_db_connection, load_crawl_state, save_crawl_state
+
+load_dotenv()
+
+
+def hash_file(smb_path):
+    """(sha256 hex digest, size, mtime_ns) of a file on the share; raises OSError if it changed while being read."""
+    path = rf"{SMB_SHARE}\{smb_path}"
+    before = smbclient.stat(path)
+    digest = hashlib.sha256()
+    with smbclient.open_file(path, mode='rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    after = smbclient.stat(path)
+    if (before.st_size, before.st_mtime_ns) != (after.st_size, after.st_mtime_ns):
+        raise OSError("file changed while it was hashed")
+    return digest.hexdigest(), after.st_size, after.st_mtime_ns
+
+
+def _try_hash(smb_path):
+    try:
+        return hash_file(smb_path)
+    except OSError as err:
+        print(f"Error hashing {smb_path}: {err}")
+        return None
+
+
+def hash_records(conn, workers=HASH_WORKERS, batch_size=100, state_path=CRAWL_STATE_PATH):
+    cursor = conn.cursor()
+    cursor.execute("SELECT record_id, smb_path, content_hash, hashed_size, hashed_mtime_ns FROM records")
+    records = cursor.fetchall()
+    state = load_crawl_state(state_path)
+
+    not_crawled = sum(1 for _, smb_path, *_ in records if smb_path not in state)
+    if not_crawled:
+        print(f"{not_crawled} records are not in the crawl state yet; run get_records_metadata.py first")
+
+    # Several records may share a file; the crawler drops the hash from the state when a file changes
+    pending = sorted({smb_path for _, smb_path, *_ in records if smb_path in state and "hash" not in state[smb_path]})
+
+    smbclient.ClientConfig(username=SMB_USER, password=SMB_PASSWORD)
+    started = time.perf_counter()
+    hashed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch in batches(pending, batch_size):
+            for smb_path, result in zip(batch, pool.map(_try_hash, batch)):
+                if result is not None:
+                    digest, size, mtime_ns = result
+                    state[smb_path].update(hash=digest, hashed_size=size, hashed_mtime_ns=mtime_ns)
+                    hashed += 1
+            save_crawl_state(state, state_path)
+            print(f"Hashed {hashed}/{len(pending)} files")
+    report_throughput("Hashed files", hashed, started)
+
+    updates = []
+    for record_id, smb_path, content_hash, hashed_size, hashed_mtime_ns in records:
+        file_state = state.get(smb_path, {})
+        if "hash" in file_state and (content_hash, hashed_size, hashed_mtime_ns) != (file_state["hash"], file_state["hashed_size"], file_state["hashed_mtime_ns"]):
+            updates.append((file_state["hash"], file_state["hashed_size"], file_state["hashed_mtime_ns"], record_id))
+
+    for batch in batches(updates, 1000):
+        try:
+            cursor.executemany(
+                "UPDATE records SET content_hash = %s, hashed_size = %s, hashed_mtime_ns = %s WHERE record_id = %s",
+                batch
+            )
+            conn.commit()
+        except mysql.connector.Error as err:
+            conn.rollback()
+            print(f"Error storing {len(batch)} content hashes: {err}")
+    print(f"Stored content hashes of {len(updates)} records")
+
+    cursor.close()
+    if updates:
+        bump_metadata_generation(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=HASH_WORKERS, help='Files hashed in parallel')
+    parser.add_argument('--batch-size', type=int, default=100, help='Files hashed between crawl state saves')
+    parser.add_argument('--state', default=CRAWL_STATE_PATH, help='Crawl state file written by get_records_metadata.py')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        hash_records(conn, workers=args.workers, batch_size=args.batch_size, state_path=args.state)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 import csv
+import time
+from datetime import datetime, timedelta
 import mysql.connector
 from dotenv import load_dotenv
 import sys
 sys.path.append('app')
 from config import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
+from routers.enums import CLASSIFICATION_BITS
+from bulk import ask_batch_size, batches, bump_metadata_generation, report_throughput
+from session_index import SessionIndex
 
 load_dotenv()
 
@@ -60,15 +65,18 @@ def import_events_from_csv(csv_path):
             annotations = row.get("annotations") or None
             session_id = get_session_id(cursor, onset_time, patient_code)
             event_types = [e.strip() for e in (row.get("event_type") or "").split(",") if e.strip()]
+            classification_mask = 0
+            for etype in event_types:
+                classification_mask |= CLASSIFICATION_BITS.get(etype.lower(), 0)
 
             try:
                 # Insert event
                 cursor.execute(
                     """
-                    INSERT INTO events (session_id, onset_time, offset_time, annotations)
-                    VALUES (%s, %s, %s, %s)
+                    INSERT INTO events (session_id, onset_time, offset_time, annotations, classification_mask)
+                    VALUES (%s, %s, %s, %s, %s)
                     """,
-                    (session_id, onset_time, offset_time, annotations)
+                    (session_id, onset_time, offset_time, annotations, classification_mask)
                 )
                 event_id = cursor.lastrowid
 
@@ -86,8 +94,144 @@ def import_events_from_csv(csv_path):
     
     conn.commit()
     cursor.close()
+    bump_metadata_generation(conn)
     conn.close()
 
+def load_classification_ids(cursor):
+    cursor.execute("SELECT classification_id, name FROM classifications")
+    return {name: classification_id for classification_id, name in cursor.fetchall()}
+
+
+def stored_onset(onset):
+    """
+    An onset datetime as events.onset_time stores it: a DATETIME without fractional seconds, to which MySQL rounds
+    (half up) on insert. Bulk imports match inserted rows back through this value, so it must be the stored one.
+    """
+    if onset.microsecond >= 500000:
+        onset += timedelta(seconds=1)
+    return onset.replace(microsecond=0)
+
+
+def bulk_import_events_from_csv(csv_path, batch_size=1000):
+    """
+    Set-based variant of import_events_from_csv: lookups are loaded once, sessions are resolved through an
+    in-memory SessionIndex, and each batch of rows is inserted with multi-row INSERTs in its own transaction.
+    Event types that are not classifications.name values are dropped from their row and reported.
+    Events already in the database (same session and onset) are not inserted again, but gain the classifications
+    of the row; events without exactly one matching session are skipped and reported at the end.
+    """
+    started = time.perf_counter()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    classification_ids = load_classification_ids(cursor)
+    sessions = SessionIndex.load(cursor)
+    read = imported = unknown_types = 0
+
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for batch in batches(csv.DictReader(f), batch_size):
+            read += len(batch)
+            events, event_types = [], {}
+            for row in batch:
+                patient_code = row.get("patient_code") or None
+                onset_time = row.get("onset_time") or None
+                if not onset_time:
+                    print(f"Skipping event without onset_time of patient {patient_code}")
+                    continue
+                try:
+                    onset = datetime.fromisoformat(onset_time)
+                except ValueError:
+                    print(f"Skipping event with unparseable onset_time {onset_time!r} of patient {patient_code}")
+                    continue
+                session_id = sessions.resolve(onset, patient_code, label=f"event {onset_time}")
+                if session_id is None:
+                    continue
+
+                names = [e.strip().lower() for e in (row.get("event_type") or "").split(",") if e.strip()]
+                # classifications.name is an ENUM: inserting another name would fail the whole batch
+                unknown = [name for name in names if name not in CLASSIFICATION_BITS]
+                if unknown:
+                    print(f"Ignoring unknown event types {', '.join(unknown)} of event {onset_time}")
+                    unknown_types += len(unknown)
+                    names = [name for name in names if name in CLASSIFICATION_BITS]
+                classification_mask = 0
+                for name in names:
+                    classification_mask |= CLASSIFICATION_BITS[name]
+                onset = stored_onset(onset)
+                events.append((session_id, onset, row.get("offset_time") or None, row.get("annotations") or None, classification_mask))
+                # Rows rounding to the same second are one event; INSERT IGNORE keeps the first
+                event_types.setdefault((session_id, onset), names)
+
+            if not events:
+                continue
+            try:
+                for name in {n for names in event_types.values() for n in names} - classification_ids.keys():
+                    cursor.execute("INSERT INTO classifications (name) VALUES (%s)", (name,))
+                    classification_ids[name] = cursor.lastrowid
+
+                cursor.executemany(
+                    """
+                    INSERT IGNORE INTO events (session_id, onset_time, offset_time, annotations, classification_mask)
+                    VALUES (%s, %s, %s, %s, %s)
+                    """,
+                    events
+                )
+                batch_imported = cursor.rowcount
+
+                # Map the batch back to event IDs through the (session_id, onset_time) unique key
+                placeholders = ', '.join(['(%s, %s)'] * len(events))
+                cursor.execute(
+                    f"SELECT event_id, session_id, onset_time FROM events WHERE (session_id, onset_time) IN ({placeholders})",
+                    [value for event in events for value in event[:2]]
+                )
+                matched = cursor.fetchall()
+                links = [
+                    (event_id, classification_ids[name])
+                    for event_id, session_id, onset_time in matched
+                    for name in event_types.get((session_id, onset_time), [])
+                ]
+                if links:
+                    cursor.executemany(
+                        "INSERT IGNORE INTO event_classifications (event_id, classification_id) VALUES (%s, %s)",
+                        links
+                    )
+                    # Events that already existed may have gained classifications, so their masks are recomputed
+                    # from the link table (see CLASSIFICATION_BITS) rather than left as first inserted
+                    linked = sorted({event_id for event_id, _ in links})
+                    cursor.execute(
+                        f"""
+                        UPDATE events e SET e.classification_mask = (
+                            SELECT COALESCE(BIT_OR(1 << (cl.name + 0 - 1)), 0)
+                            FROM event_classifications ec
+                            JOIN classifications cl ON ec.classification_id = cl.classification_id
+                            WHERE ec.event_id = e.event_id
+                        )
+                        WHERE e.event_id IN ({', '.join(['%s'] * len(linked))})
+                        """,
+                        linked
+                    )
+                conn.commit()
+                imported += batch_imported
+                print(f"Imported {batch_imported} of {len(events)} events ({read} rows read)")
+            except mysql.connector.Error as err:
+                conn.rollback()
+                classification_ids = load_classification_ids(cursor)
+                print(f"Error importing batch ending at row {read}: {err}")
+
+    cursor.close()
+    bump_metadata_generation(conn)
+    conn.close()
+    sessions.report()
+    if unknown_types:
+        print(f"Ignored {unknown_types} unknown event types")
+    report_throughput("Events", read, started)
+    return imported
+
+
 if __name__ == "__main__":
     csv_path = input("Path to events CSV file: ").strip()
-    import_events_from_csv(csv_path)
\ No newline at end of file
+    batch_size = ask_batch_size()
+    if batch_size:
+        bulk_import_events_from_csv(csv_path, batch_size)
+    else:
+        import_events_from_csv(csv_path)
\ No newline at end of file
@@ -1,7 +1,9 @@
 import csv
+import time
 import mysql.connector
 from dotenv import load_dotenv
 from app.config import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
+from bulk import ask_batch_size, batches, bump_metadata_generation, report_throughput
 
 load_dotenv()
 
@@ -60,8 +62,80 @@ def import_patients_from_csv(csv_path):
     
     conn.commit()
     cursor.close()
+    bump_metadata_generation(conn)
     conn.close()
 
+def bulk_import_patients_from_csv(csv_path, batch_size=1000):
+    """
+    Set-based variant of import_patients_from_csv: diagnoses are loaded once and each batch of rows
+    is inserted with multi-row INSERTs in its own transaction. Patients already in the database are skipped.
+    """
+    started = time.perf_counter()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT name, diagnosis_id FROM diagnoses")
+    diagnosis_ids = dict(cursor.fetchall())
+    read = imported = 0
+
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for batch in batches(csv.DictReader(f), batch_size):
+            read += len(batch)
+            patients, diagnoses = [], {}
+            for row in batch:
+                code = row["patient_code"].strip()
+                patients.append((code, row.get("laterality") or None, row.get("common_auras") or None, row.get("comorbidities") or None))
+                diagnoses[code] = [d.strip().lower() for d in (row.get("diagnosis") or "").split(",") if d.strip()]
+
+            try:
+                new_diagnoses = {d for names in diagnoses.values() for d in names} - diagnosis_ids.keys()
+                if new_diagnoses:
+                    cursor.executemany("INSERT INTO diagnoses (name) VALUES (%s)", [(name,) for name in new_diagnoses])
+                    placeholders = ', '.join(['%s'] * len(new_diagnoses))
+                    cursor.execute(f"SELECT name, diagnosis_id FROM diagnoses WHERE name IN ({placeholders})", list(new_diagnoses))
+                    diagnosis_ids.update(cursor.fetchall())
+
+                cursor.executemany(
+                    """
+                    INSERT IGNORE INTO patients (patient_code, laterality, common_auras, comorbidities)
+                    VALUES (%s, %s, %s, %s)
+                    """,
+                    patients
+                )
+                batch_imported = cursor.rowcount
+
+                placeholders = ', '.join(['%s'] * len(diagnoses))
+                cursor.execute(f"SELECT patient_code, patient_id FROM patients WHERE patient_code IN ({placeholders})", list(diagnoses))
+                links = [
+                    (patient_id, diagnosis_ids[name])
+                    for code, patient_id in cursor.fetchall()
+                    for name in diagnoses.get(code, [])
+                ]
+                if links:
+                    cursor.executemany(
+                        "INSERT IGNORE INTO patient_diagnoses (patient_id, diagnosis_id) VALUES (%s, %s)",
+                        links
+                    )
+                conn.commit()
+                imported += batch_imported
+                print(f"Imported {batch_imported} of {len(patients)} patients ({read} rows read)")
+            except mysql.connector.Error as err:
+                conn.rollback()
+                cursor.execute("SELECT name, diagnosis_id FROM diagnoses")
+                diagnosis_ids = dict(cursor.fetchall())
+                print(f"Error importing batch ending at row {read}: {err}")
+
+    cursor.close()
+    bump_metadata_generation(conn)
+    conn.close()
+    report_throughput("Patients", read, started)
+    return imported
+
+
 if __name__ == "__main__":
     csv_path = input("Path to patient CSV file: ").strip()
-    import_patients_from_csv(csv_path)
\ No newline at end of file
+    batch_size = ask_batch_size()
+    if batch_size:
+        bulk_import_patients_from_csv(csv_path, batch_size)
+    else:
+        import_patients_from_csv(csv_path)
\ No newline at end of file
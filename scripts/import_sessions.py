@@ -1,9 +1,11 @@
 import csv
+import time
 import mysql.connector
 from dotenv import load_dotenv
 import sys
 sys.path.append('app')
 from config import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
+from bulk import ask_batch_size, batches, bump_metadata_generation, report_throughput
 
 load_dotenv()
 
@@ -51,8 +53,66 @@ def import_sessions_from_csv(csv_path):
     
     conn.commit()
     cursor.close()
+    bump_metadata_generation(conn)
     conn.close()
 
+def bulk_import_sessions_from_csv(csv_path, batch_size=1000):
+    """
+    Set-based variant of import_sessions_from_csv: patient codes are loaded once and each batch of rows
+    is inserted with a multi-row INSERT in its own transaction. Sessions already in the database are skipped, as
+    are sessions of patients that are not in the database, which are reported.
+    """
+    started = time.perf_counter()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT patient_code, patient_id FROM patients")
+    patient_ids = dict(cursor.fetchall())
+    read = imported = unknown = 0
+
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for batch in batches(csv.DictReader(f), batch_size):
+            read += len(batch)
+            sessions = []
+            for row in batch:
+                patient_code = row["patient_code"].strip()
+                # A NULL patient_id never matches the unique key, so INSERT IGNORE would add it again on every run
+                if patient_code not in patient_ids:
+                    print(f"Skipping session {row.get('start_time')} of unknown patient {patient_code}")
+                    unknown += 1
+                    continue
+                sessions.append((patient_ids[patient_code], row.get("hospital_code") or None, row.get("start_time") or None, row.get("end_time") or None))
+
+            if not sessions:
+                continue
+            try:
+                cursor.executemany(
+                    """
+                    INSERT IGNORE INTO sessions (patient_id, hospital_code, start_time, end_time)
+                    VALUES (%s, %s, %s, %s)
+                    """,
+                    sessions
+                )
+                conn.commit()
+                imported += cursor.rowcount
+                print(f"Imported {cursor.rowcount} of {len(sessions)} sessions ({read} rows read)")
+            except mysql.connector.Error as err:
+                conn.rollback()
+                print(f"Error importing batch ending at row {read}: {err}")
+
+    cursor.close()
+    bump_metadata_generation(conn)
+    conn.close()
+    if unknown:
+        print(f"Skipped {unknown} sessions of unknown patients")
+    report_throughput("Sessions", read, started)
+    return imported
+
+
 if __name__ == "__main__":
     csv_path = input("Path to sessions CSV file: ").strip()
-    import_sessions_from_csv(csv_path)
\ No newline at end of file
+    batch_size = ask_batch_size()
+    if batch_size:
+        bulk_import_sessions_from_csv(csv_path, batch_size)
+    else:
+        import_sessions_from_csv(csv_path)
\ No newline at end of file
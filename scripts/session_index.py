@@ -0,0 +1,97 @@
+from bisect import bisect_right
+
+
+class SessionIndex:
+    """
+    In-memory interval index of session start/end times per patient, loaded once per import.
+
+    Timestamps are resolved to the sessions containing them (start_time <= t < end_time) with a binary search
+    over the sessions sorted by start time, plus a backwards walk bounded by the running maximum end time,
+    i.e. O(log n + k) for k matches. Unmatched and ambiguous lookups are collected so they can be reported
+    in bulk at the end of an unattended import instead of stopping it.
+    """
+
+    def __init__(self, sessions):
+        """sessions: iterable of (session_id, patient_code, start_time, end_time) rows."""
+        grouped = {}
+        self._session_ids = {}
+        for session_id, patient_code, start_time, end_time in sessions:
+            self._session_ids.setdefault(patient_code, []).append(session_id)
+            if start_time is None or end_time is None:
+                continue
+            # None indexes the sessions of every patient, for lookups without a patient code
+            for key in {patient_code, None}:
+                grouped.setdefault(key, []).append((start_time, end_time, session_id))
+
+        self._index = {}
+        for key, intervals in grouped.items():
+            intervals.sort()
+            max_ends, running = [], None
+            for _, end_time, _ in intervals:
+                running = end_time if running is None else max(running, end_time)
+                max_ends.append(running)
+            self._index[key] = ([start for start, _, _ in intervals], intervals, max_ends)
+
+        self.unmatched = []
+        self.ambiguous = []
+
+    @classmethod
+    def load(cls, cursor):
+        cursor.execute("""
+            SELECT s.session_id, p.patient_code, s.start_time, s.end_time
+            FROM sessions s
+            LEFT JOIN patients p ON s.patient_id=p.patient_id
+            ORDER BY s.session_id
+        """)
+        return cls(cursor.fetchall())
+
+    def session_ids(self, patient_code):
+        """All sessions of a patient, in session_id order."""
+        return sorted(self._session_ids.get(patient_code, []))
+
+    def lookup(self, timestamp, patient_code=None):
+        """IDs of every session of the patient (or of any patient) that contains the timestamp."""
+        if patient_code not in self._index:
+            return []
+        starts, intervals, max_ends = self._index[patient_code]
+        matches = []
+        i = bisect_right(starts, timestamp) - 1
+        while i >= 0 and max_ends[i] > timestamp:
+            _, end_time, session_id = intervals[i]
+            if end_time > timestamp:
+                matches.append(session_id)
+            i -= 1
+        return sorted(matches)
+
+    def resolve(self, timestamp, patient_code=None, label=None):
+        """Session containing the timestamp, or None (recorded for report()) when there is none or several."""
+        matches = self.lookup(timestamp, patient_code)
+        if len(matches) == 1:
+            return matches[0]
+        entry = (label or timestamp, patient_code, matches)
+        (self.ambiguous if matches else self.unmatched).append(entry)
+        return None
+
+    def overlaps(self):
+        """Pairs of sessions of the same patient whose intervals overlap."""
+        pairs = []
+        for patient_code, (_, intervals, max_ends) in self._index.items():
+            if patient_code is None:
+                continue
+            for i in range(1, len(intervals)):
+                start_time, _, session_id = intervals[i]
+                if max_ends[i - 1] > start_time:
+                    pairs.extend(
+                        (patient_code, other_id, session_id)
+                        for _, end_time, other_id in intervals[:i] if end_time > start_time
+                    )
+        return pairs
+
+    def report(self):
+        for patient_code, first_id, second_id in self.overlaps():
+            print(f"Overlapping sessions {first_id} and {second_id} of patient {patient_code}")
+        for label, patient_code, matches in self.ambiguous:
+            print(f"Ambiguous session for {label} (patient {patient_code}): sessions {', '.join(map(str, matches))}")
+        for label, patient_code, _ in self.unmatched:
+            print(f"No session found for {label} (patient {patient_code})")
+        print(f"{len(self.ambiguous)} ambiguous and {len(self.unmatched)} unmatched lookups")
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# A small pool and short checkout timeout make starvation show up within seconds; set before app.config is imported
+os.environ["DB_POOL_SIZE"] = "2"
+os.environ["DB_POOL_TIMEOUT"] = "3"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
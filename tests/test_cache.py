@@ -0,0 +1,79 @@
+import types
+
+import pytest
+
+import app.cache as cache
+from app.cache import MISSING, TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A monotonic clock for app.cache that only moves when the test advances it."""
+    now = types.SimpleNamespace(value=0.0)
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_entries_expire_after_ttl(clock):
+    c = TTLCache(maxsize=10, ttl=5)
+    c.set("a", 1)
+    clock.value = 4.9
+    assert c.get("a") == 1
+    clock.value = 5
+    assert c.get("a") is MISSING
+    assert c.stats()["size"] == 0
+    assert (c.hits, c.misses) == (1, 1)
+
+
+def test_set_restarts_the_ttl(clock):
+    c = TTLCache(maxsize=10, ttl=5)
+    c.set("a", 1)
+    clock.value = 4
+    c.set("a", 2)
+    clock.value = 8
+    assert c.get("a") == 2
+
+
+def test_evicts_least_recently_used(clock):
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")  # b is now the least recently used
+    c.set("c", 3)
+    assert c.get("b") is MISSING
+    assert c.get("a") == 1 and c.get("c") == 3
+
+
+def test_max_weight_bounds_the_total_weight(clock):
+    c = TTLCache(maxsize=10, ttl=60, max_weight=100)
+    c.set("a", "a", weight=40)
+    c.set("b", "b", weight=40)
+    c.get("a")
+    c.set("c", "c", weight=40)  # 120 > 100: evicts the least recently used, b
+    assert c.get("b") is MISSING
+    assert c.stats()["weight"] == 80
+    c.set("a", "a2", weight=10)  # replacing an entry replaces its weight
+    assert c.stats()["weight"] == 50
+
+
+def test_values_heavier_than_max_weight_are_not_stored(clock):
+    c = TTLCache(maxsize=10, ttl=60, max_weight=100)
+    c.set("a", "a", weight=10)
+    c.set("big", "big", weight=101)
+    assert c.get("big") is MISSING
+    assert c.get("a") == "a"
+
+
+@pytest.mark.parametrize("maxsize, ttl", [(0, 60), (10, 0)])
+def test_disabled_cache_stores_nothing(clock, maxsize, ttl):
+    c = TTLCache(maxsize=maxsize, ttl=ttl)
+    c.set("a", 1)
+    assert c.get("a") is MISSING
+
+
+def test_clear(clock):
+    c = TTLCache(maxsize=10, ttl=60, max_weight=100)
+    c.set("a", 1, weight=30)
+    c.clear()
+    assert c.get("a") is MISSING
+    assert c.stats()["weight"] == 0
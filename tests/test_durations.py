@@ -0,0 +1,64 @@
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+import durations  # noqa: E402
+
+HEADER = b"# OpenSignals Text File Format\n# EndOfHeader\n"
+# Enough lines of 6+ bytes to be estimated rather than counted (over 2 * SAMPLE_BLOCKS * READ_BLOCK_SIZE bytes of data)
+LINES = 2 * durations.SAMPLE_BLOCKS * durations.READ_BLOCK_SIZE // 6
+
+
+@pytest.fixture
+def exact_counts(monkeypatch):
+    """Record the calls estimate_lines makes to count_lines, i.e. its fallbacks to an exact count."""
+    calls = []
+    count_lines = durations.count_lines
+
+    def spy(f, start, size):
+        calls.append((start, size))
+        return count_lines(f, start, size)
+
+    monkeypatch.setattr(durations, "count_lines", spy)
+    return calls
+
+
+def estimate(data):
+    f = io.BytesIO(HEADER + data)
+    return durations.estimate_lines(f, len(HEADER), len(HEADER) + len(data))
+
+
+def test_count_lines_counts_a_last_line_without_newline():
+    data = b"1\t2\n3\t4\n5\t6"
+    assert durations.count_lines(io.BytesIO(data), 0, len(data)) == 3
+    assert durations.count_lines(io.BytesIO(data + b"\n"), 0, len(data) + 1) == 3
+    assert durations.count_lines(io.BytesIO(b""), 0, 0) == 0
+
+
+def test_small_files_are_counted_exactly(exact_counts):
+    assert estimate(b"".join(b"%d\t0\n" % (i % 16) for i in range(1000))) == 1000
+    assert len(exact_counts) == 1
+
+
+def test_uniform_lines_are_estimated(exact_counts):
+    # Fixed-width lines, like the sample lines of an OpenSignals file
+    data = b"".join(b"%02d\t0\t512\n" % (i % 16) for i in range(LINES + 123))
+    assert estimate(data) == LINES + 123
+    assert not exact_counts
+
+
+def test_drifting_line_length_falls_back_to_an_exact_count(exact_counts):
+    # Lines get longer through the file, so the sampled means disagree beyond LINE_LENGTH_TOLERANCE
+    short = b"1\t0\t5\n" * (LINES // 2)
+    long = b"1\t0\t512\t1023\t65535\n" * (LINES // 2)
+    assert estimate(short + long) == 2 * (LINES // 2)
+    assert len(exact_counts) == 1
+
+
+def test_blocks_without_a_complete_line_fall_back_to_an_exact_count(exact_counts):
+    data = b"x" * (2 * durations.SAMPLE_BLOCKS * durations.READ_BLOCK_SIZE + 1) + b"\n1\n"
+    assert estimate(data) == 2
+    assert len(exact_counts) == 1
@@ -0,0 +1,29 @@
+import os
+import re
+
+from app.routers.enums import CLASSIFICATION_BITS, SeizureClassEnum, classification_mask
+
+SCHEMA = os.path.join(os.path.dirname(__file__), "..", "db", "schema.sql")
+
+
+def schema_classification_names():
+    with open(SCHEMA, encoding="utf-8") as f:
+        table = re.search(r"CREATE TABLE classifications \((.*?)\n\);", f.read(), re.S).group(1)
+    values = re.search(r"name ENUM\((.*?)\)\s*NOT NULL", table, re.S).group(1)
+    return re.findall(r"[\"']([^\"']*)[\"']", values)
+
+
+def test_classification_bits_follow_the_schema_enum():
+    # The SQL side computes a bit as 1 << (name + 0 - 1), i.e. from the 1-based position in the ENUM
+    names = schema_classification_names()
+    assert list(CLASSIFICATION_BITS) == names
+    assert [CLASSIFICATION_BITS[name] for name in names] == [1 << i for i in range(len(names))]
+
+
+def test_every_classification_has_a_bit():
+    assert {member.value for member in SeizureClassEnum} == set(CLASSIFICATION_BITS)
+
+
+def test_classification_mask():
+    assert classification_mask([]) == 0
+    assert classification_mask(["seizure", SeizureClassEnum.focal]) == CLASSIFICATION_BITS["seizure"] | CLASSIFICATION_BITS["focal"]
@@ -0,0 +1,94 @@
+import asyncio
+import io
+import time
+from unittest import mock
+
+import httpx
+
+import app.database as database
+from app.main import app
+from app.routers.token import get_current_user
+
+RECORD = {
+    'record_id': 1, 'session_id': 1, 'file_name': 'a', 'file_extension': '.txt', 'smb_path': r'P\a.txt',
+    'modality': 'wearable', 'start_time': None, 'end_time': None,
+    'content_hash': None, 'hashed_size': None, 'hashed_mtime_ns': None,
+}
+CHUNKS = 5
+CHUNK_DELAY = 0.3
+
+
+class FakeCursor:
+    def __init__(self, dictionary=False):
+        self.dictionary = dictionary
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchone(self):
+        return dict(RECORD) if self.dictionary else (1,)
+
+    def fetchall(self):
+        return [self.fetchone()]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def cursor(self, dictionary=False, **kwargs):
+        return FakeCursor(dictionary)
+
+    def close(self):
+        pass
+
+
+class FakePool:
+    def get_connection(self):
+        return FakeConnection()
+
+
+class SlowFile(io.BytesIO):
+    """A remote file whose every read takes CHUNK_DELAY, like a loaded SMB share."""
+
+    def read(self, size=-1):
+        time.sleep(CHUNK_DELAY)
+        return super().read(size)
+
+
+class FakeStat:
+    st_size = CHUNKS * 1024 * 1024
+    st_mtime = 0
+    st_mtime_ns = 0
+
+
+def test_metadata_stays_responsive_while_downloads_saturate_the_pool():
+    app.dependency_overrides[get_current_user] = lambda: {'id': 1, 'can_access_sensitive': True}
+    downloads = 2 * database.DB_POOL_SIZE
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            async def listing():
+                # Once every download is streaming
+                await asyncio.sleep(2 * CHUNK_DELAY)
+                started = time.perf_counter()
+                response = await client.get("/records/")
+                return response.status_code, time.perf_counter() - started
+
+            results = await asyncio.gather(*[client.get("/download/1") for _ in range(downloads)], listing())
+        return results[:-1], results[-1]
+
+    with mock.patch.object(database, "_pool", FakePool()), \
+            mock.patch("smbclient.stat", lambda path: FakeStat), \
+            mock.patch("smbclient.open_file", lambda path, mode: SlowFile(b"x" * FakeStat.st_size)):
+        try:
+            responses, (status, elapsed) = asyncio.run(scenario())
+        finally:
+            app.dependency_overrides.clear()
+
+    assert all(response.status_code == 200 for response in responses)
+    assert status == 200
+    # Well before the downloads finish, let alone before a checkout would time out
+    assert elapsed < CHUNK_DELAY * CHUNKS
+    assert database.get_pool_stats()["in_use"] == 0
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import mysql.connector
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+import explain_queries  # noqa: E402
+from config import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    """A connection to the MySQL/MariaDB server configured in .env; the test is skipped without one."""
+    if not DB_USER:
+        pytest.skip("no MySQL/MariaDB server configured (DB_USER)")
+    try:
+        conn = mysql.connector.connect(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD)
+    except mysql.connector.Error as err:
+        pytest.skip(f"MySQL/MariaDB server not reachable: {err}")
+    yield conn
+    conn.close()
+
+
+def test_generated_queries_use_indexes(server, monkeypatch):
+    # db/schema.sql is read relative to the repository root
+    monkeypatch.chdir(os.path.join(os.path.dirname(__file__), ".."))
+    failures = explain_queries.check_query_plans(server, f"{DB_NAME or 'preepiseizures'}_explain", patients=200)
+    assert not failures, "\n".join(explain_queries.format_failure(*failure) for failure in failures)
@@ -0,0 +1,52 @@
+import pytest
+from fastapi import HTTPException
+
+from app.routers.ranges import http_date, if_range_matches, parse_range
+
+SIZE = 1000
+ETAG = '"abc-3e8"'
+MTIME = 1700000000
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=500-", (500, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),  # suffix longer than the file: the whole file
+    ("bytes=900-5000", (900, 999)),  # end past the file is clamped
+    ("bytes=999-999", (999, 999)),
+    ("BYTES = 0-0", (0, 0)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=0-99,200-299",  # multi-range: the full file is sent instead
+    "items=0-99",
+    "bytes=100",
+    "bytes=abc-",
+    "bytes=99-0",
+])
+def test_parse_range_ignores_unsupported_headers(header):
+    assert parse_range(header, SIZE) is None
+
+
+@pytest.mark.parametrize("header, size", [("bytes=1000-", SIZE), ("bytes=5000-6000", SIZE), ("bytes=-0", SIZE), ("bytes=0-", 0)])
+def test_parse_range_not_satisfiable(header, size):
+    with pytest.raises(HTTPException) as raised:
+        parse_range(header, size)
+    assert raised.value.status_code == 416
+    assert raised.value.headers["Content-Range"] == f"bytes */{size}"
+
+
+def test_if_range_etag_uses_strong_comparison():
+    assert if_range_matches(ETAG, ETAG, MTIME)
+    assert not if_range_matches('"other"', ETAG, MTIME)
+    assert not if_range_matches(f"W/{ETAG}", ETAG, MTIME)
+
+
+def test_if_range_date():
+    assert if_range_matches(http_date(MTIME), ETAG, MTIME + 0.5)
+    assert not if_range_matches(http_date(MTIME - 1), ETAG, MTIME)
+    assert not if_range_matches("not a date", ETAG, MTIME)
@@ -0,0 +1,68 @@
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+from session_index import SessionIndex  # noqa: E402
+
+
+def at(hour, minute=0):
+    return datetime(2021, 1, 1, hour, minute)
+
+
+# AAAA: 1 [8h, 10h), 2 [10h, 12h), 3 [11h, 13h) overlapping 2, 4 [14h, 15h); 5 [6h, 20h) of BBBB encloses
+# its later short session 6 [9h, 9h30), so finding 5 from 9h15 needs the running maximum end time
+SESSIONS = [
+    (1, 'AAAA', at(8), at(10)),
+    (2, 'AAAA', at(10), at(12)),
+    (3, 'AAAA', at(11), at(13)),
+    (4, 'AAAA', at(14), at(15)),
+    (5, 'BBBB', at(6), at(20)),
+    (6, 'BBBB', at(9), at(9, 30)),
+    (7, 'CCCC', None, None),
+]
+
+
+def test_resolve_single_session():
+    index = SessionIndex(SESSIONS)
+    assert index.resolve(at(8), 'AAAA') == 1
+    assert index.resolve(at(9, 59), 'AAAA') == 1
+    assert index.resolve(at(10), 'AAAA') == 2  # end times are exclusive
+    assert index.resolve(at(14, 30), 'AAAA') == 4
+    assert index.resolve(at(19), 'BBBB') == 5
+    assert not index.ambiguous and not index.unmatched
+
+
+def test_resolve_ambiguous():
+    index = SessionIndex(SESSIONS)
+    assert index.resolve(at(11, 30), 'AAAA', label="event 1") is None
+    assert index.resolve(at(9, 15), 'BBBB') is None
+    assert index.ambiguous == [("event 1", 'AAAA', [2, 3]), (at(9, 15), 'BBBB', [5, 6])]
+    assert not index.unmatched
+
+
+def test_resolve_unmatched():
+    index = SessionIndex(SESSIONS)
+    assert index.resolve(at(13, 30), 'AAAA') is None  # gap between sessions
+    assert index.resolve(at(7), 'AAAA') is None  # before the first session
+    assert index.resolve(at(8), 'DDDD') is None  # unknown patient
+    assert index.resolve(at(8), 'CCCC') is None  # sessions without times are not indexed
+    assert [patient_code for _, patient_code, _ in index.unmatched] == ['AAAA', 'AAAA', 'DDDD', 'CCCC']
+    assert not index.ambiguous
+
+
+def test_lookup_without_patient_searches_every_patient():
+    index = SessionIndex(SESSIONS)
+    assert index.lookup(at(8)) == [1, 5]
+    assert index.lookup(at(14, 30)) == [4, 5]
+    assert index.lookup(at(21)) == []
+
+
+def test_overlaps():
+    assert sorted(SessionIndex(SESSIONS).overlaps()) == [('AAAA', 2, 3), ('BBBB', 5, 6)]
+
+
+def test_session_ids_include_sessions_without_times():
+    index = SessionIndex(SESSIONS)
+    assert index.session_ids('CCCC') == [7]
+    assert index.session_ids('AAAA') == [1, 2, 3, 4]
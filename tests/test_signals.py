@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.signals import sample_range, slice_lines
+
+LINES = b"".join(b"%d\t0\t512\n" % i for i in range(10))
+START = datetime(2021, 1, 1, 8)
+ENTRY = {'start_time': START, 'sampling_rate': 100, 'sample_count': 1000}
+
+
+class Chunks:
+    """A stream of chunks that records how much of it was consumed and whether it was closed."""
+
+    def __init__(self, data, size):
+        self.chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.consumed += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+def expected(skip, count):
+    return b"".join(LINES.splitlines(keepends=True)[skip:skip + count])
+
+
+# Chunk sizes of 1 and 7 bytes split every line, 8 bytes is exactly one line, and 1000 is the whole data at once
+@pytest.mark.parametrize("size", [1, 7, 8, 13, 1000])
+@pytest.mark.parametrize("skip, count", [(0, 10), (0, 1), (3, 4), (9, 1), (3, 100), (10, 5)])
+def test_slice_lines(size, skip, count):
+    chunks = Chunks(LINES, size)
+    assert b"".join(slice_lines(chunks, skip, count)) == expected(skip, count)
+    assert chunks.consumed == len(chunks.chunks)
+    assert chunks.closed
+
+
+def test_slice_lines_closes_the_stream_when_abandoned():
+    chunks = Chunks(LINES, 7)
+    lines = slice_lines(chunks, 0, 10)
+    next(lines)
+    lines.close()
+    assert chunks.closed
+
+
+@pytest.mark.parametrize("start, end, expected_range", [
+    (START, START + timedelta(seconds=1), (0, 100)),
+    # Bounds falling exactly on a sample: the first is included and the last excluded, despite float error
+    (START + timedelta(seconds=0.07), START + timedelta(seconds=0.29), (7, 29)),
+    (START + timedelta(milliseconds=5), START + timedelta(milliseconds=15), (1, 2)),
+    # Clamped to the recording
+    (START - timedelta(seconds=1), START + timedelta(seconds=1), (0, 100)),
+    (START + timedelta(seconds=9), START + timedelta(seconds=20), (900, 1000)),
+])
+def test_sample_range(start, end, expected_range):
+    assert sample_range(ENTRY, start, end) == expected_range
+
+
+def test_sample_range_outside_the_recording_is_empty():
+    first, last = sample_range(ENTRY, START + timedelta(seconds=20), START + timedelta(seconds=30))
+    assert first >= last
+    first, last = sample_range(ENTRY, START - timedelta(seconds=2), START - timedelta(seconds=1))
+    assert first >= last